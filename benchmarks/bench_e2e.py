@@ -0,0 +1,84 @@
+"""Runs jywriter against a fake JIRA on synthetic documents, and reports
+throughput, API calls per item and server-side latency.
+
+    python benchmarks/bench_e2e.py [--sizes=10,1000,10000] [--latency=0.002] [-- jywriter options]
+
+e.g. ``python benchmarks/bench_e2e.py --sizes=1000 -- --jobs=8 --bulk=50``.
+"""
+from jy.fakejira import FakeJira
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def document(n):
+    """A document of ``n`` items, in groups of ten: an epic with five new
+    stories (one commented, one linked, one in a sprint), and four existing
+    issues being transitioned or commented on."""
+    lines = ["- objectify:", "    issuetype: name", "  sprintBoard: 1",
+             "  manifest:", "    project: NEW", "    assignee: bob"]
+    existing = 0
+    for group in range(0, n, 10):
+        size = min(10, n - group)
+        lines += ["- Epic: epic %d" % group]
+        if size > 1:
+            lines += ["  items:"]
+        for i in range(1, min(6, size)):
+            lines += ["  - Story: story %d" % (group + i)]
+            if i == 1:
+                lines += ["    +comment: a comment"]
+            elif i == 2:
+                lines += ["    links:", "    - OLD-%d: blocks" % (existing + 1)]
+            elif i == 3:
+                lines += ["    sprint: Sprint 1"]
+        for i in range(6, size):
+            existing += 1
+            lines += ["- key: OLD-%d" % existing,
+                      "  +status: Resolved" if i % 2 else "  +comment: still open"]
+    return "\n".join(lines) + "\n", existing + 1
+
+
+def run(n, latency, options):
+    text, existing = document(n)
+    fake = FakeJira(latency=latency)
+    for i in range(existing):
+        fake.add_issue({'project': 'OLD', 'issuetype': 'Bug', 'summary': 'old %d' % i})
+    home = tempfile.mkdtemp()
+    try:
+        path = os.path.join(home, 'doc.yaml')
+        with open(path, 'w') as f:
+            f.write(text)
+        env = dict(os.environ, HOME=home, JY_SERVER=fake.start(), JY_USERNAME='bob', JY_PASSWORD='secret',
+                   PYTHONPATH=os.pathsep.join([os.path.dirname(os.path.dirname(os.path.abspath(__file__)))] +
+                                              os.environ.get('PYTHONPATH', '').split(os.pathsep)))
+        fake.reset_stats()
+        start = time.time()
+        with open(os.devnull, 'w') as devnull:
+            subprocess.check_call([sys.executable, '-m', 'jy.writer'] + options + [path],
+                                  env=env, stdout=devnull)
+        elapsed = time.time() - start
+        stats = fake.stats()
+    finally:
+        fake.stop()
+        shutil.rmtree(home)
+    return elapsed, stats
+
+
+def main(args):
+    options = args[args.index('--') + 1:] if '--' in args else []
+    args = dict(a.lstrip('-').split('=', 1) for a in args[:len(args) - len(options)] if '=' in a)
+    sizes = [int(s) for s in args.get('sizes', '10,1000,10000').split(',')]
+    latency = float(args.get('latency', 0.002))
+    print "options: %s, latency %.1fms" % (" ".join(options) or "(none)", latency * 1e3)
+    print "%8s %10s %10s %12s %10s %10s" % ("items", "time (s)", "items/s", "calls/item", "p50 (ms)", "p99 (ms)")
+    for n in sizes:
+        elapsed, stats = run(n, latency, options)
+        print "%8d %10.2f %10.1f %12.2f %10.2f %10.2f" % (
+            n, elapsed, n / elapsed, stats['total'] / float(n), stats['p50'] * 1e3, stats['p99'] * 1e3)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
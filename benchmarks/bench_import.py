@@ -0,0 +1,88 @@
+"""Measures how long jywriter and jyd take to start, and which imports the
+time goes to.
+
+    python benchmarks/bench_import.py [--runs=10] [--top=15]
+
+Python 2 has no ``-X importtime``, so the imports of ``import jy.writer``
+are timed by wrapping ``__import__`` in a fresh interpreter, giving the
+same self and cumulative times, in microseconds.
+"""
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+COMMANDS = [
+    ("python (baseline)", ['-c', 'pass']),
+    ("import jy.writer", ['-c', 'import jy.writer']),
+    ("jywriter --help", ['-m', 'jy.writer', '--help']),
+    ("jyd run (no daemon)", ['-m', 'jy.daemon', 'run', '--socket=/nonexistent', 'x.yaml']),
+    ("connect + transformers", ['-c', 'import jy.writer, jy.transport, jy.registry; jy.registry.load()']),
+]
+
+# run in a fresh interpreter: times every import made by ``import jy.writer``
+TRACE = r"""
+import __builtin__, sys, time
+_import = __builtin__.__import__
+stack, times = [], []
+def timed_import(name, *args):
+    level = len(stack)
+    new = name not in sys.modules
+    stack.append(0.0)
+    start = time.time()
+    try:
+        return _import(name, *args)
+    finally:
+        total = time.time() - start
+        children = stack.pop()
+        if stack:
+            stack[-1] += total
+        if new and name in sys.modules:
+            times.append((level, name, total - children, total))
+__builtin__.__import__ = timed_import
+import jy.writer
+for level, name, own, total in times:
+    print "%d\t%s\t%d\t%d" % (level, name, own * 1e6, total * 1e6)
+"""
+
+
+def wall(args, runs):
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    best = None
+    with open(os.devnull, 'w') as devnull:
+        for _ in range(runs):
+            start = time.time()
+            subprocess.call([sys.executable] + args, env=env, stdout=devnull, stderr=devnull)
+            elapsed = time.time() - start
+            best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def trace():
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    out = subprocess.check_output([sys.executable, '-c', TRACE], env=env)
+    rows = []
+    for line in out.splitlines():
+        level, name, own, total = line.split("\t")
+        rows.append((int(level), name, int(own), int(total)))
+    return rows
+
+
+def main(args):
+    args = dict(a.lstrip('-').split('=', 1) for a in args if '=' in a)
+    runs = int(args.get('runs', 10))
+    top = int(args.get('top', 15))
+    print "%-28s %10s" % ("command", "best (ms)")
+    for name, command in COMMANDS:
+        print "%-28s %10.1f" % (name, wall(command, runs) * 1e3)
+    print
+    print "slowest imports of import jy.writer:"
+    print "%10s %10s  %s" % ("self (us)", "cumulative", "module")
+    for level, name, own, total in sorted(trace(), key=lambda r: -r[3])[:top]:
+        print "%10d %10d  %s%s" % (own, total, "  " * level, name)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
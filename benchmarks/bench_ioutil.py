@@ -0,0 +1,51 @@
+"""Compares the libyaml and pure-Python backends of jy.ioutil on synthetic
+planning documents.
+
+    python benchmarks/bench_ioutil.py [items ...]
+"""
+from jy import ioutil
+import StringIO
+import sys
+import time
+
+
+def document(n):
+    """A planning document of ``n`` stories, in epics of 20."""
+    lines = ["- assignee: bob\n  project: PROJ\n  issuetype: Story\n"]
+    for epic in range(0, n, 20):
+        lines.append("- Epic: Epic %d\n  key: PROJ-%d\n  items:\n" % (epic, epic))
+        for i in range(epic, min(n, epic + 20)):
+            lines.append("  - Story: As a user, I want feature %d, so that it works.\n"
+                         "    key: PROJ-%d\n    assignee: bob\n    components: [Foo, Bar]\n"
+                         "    status: Open\n    subtasks:\n    - summary: Design it.\n"
+                         "    - summary: Build it.\n" % (i, i + 100000))
+    return "".join(lines)
+
+
+def timed(fn, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        result = fn()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main(sizes):
+    backends = [('pure', ioutil.PureLoader, ioutil.PureDumper),
+                ('libyaml', ioutil.Loader, ioutil.Dumper)]
+    if ioutil.Loader is ioutil.PureLoader:
+        print "libyaml is not available; only the pure backend is measured"
+        backends = backends[:1]
+    print "%8s %10s %8s %10s %10s" % ("items", "backend", "KB", "load (s)", "dump (s)")
+    for n in sizes:
+        text = document(n)
+        for name, loader, dumper in backends:
+            load_time, items = timed(lambda: ioutil.load(StringIO.StringIO(text), Loader=loader))
+            dump_time, _ = timed(lambda: ioutil.dump(items, Dumper=dumper, default_flow_style=False))
+            print "%8d %10s %8d %10.3f %10.3f" % (n, name, len(text) / 1024, load_time, dump_time)
+
+
+if __name__ == '__main__':
+    main([int(n) for n in sys.argv[1:]] or [100, 1000, 5000])
@@ -0,0 +1,79 @@
+"""Compares the per-item cost of preparing an issue's fields with the
+compiled normalization plan against the previous implementation, which
+merged every manifest and walked every alias and rule for each item.
+
+    python benchmarks/bench_normalize.py [items]
+"""
+from jy import registry
+from jy.transformers import NewManifest
+from jy.writer import Context
+from mock import Mock
+import copy
+import functools
+import sys
+import timeit
+
+
+def _dictify(k, dkey, item):
+    if isinstance(item.get(k), basestring):
+        item[k] = {dkey: item[k]}
+
+
+class legacy(object):
+    """The previous compute_defaults and _normalize."""
+    def __init__(self, ctx):
+        self.ctx = ctx
+        self.objectified = [functools.partial(_dictify, k, v.args[0])
+                            for k, v in ctx.objectified.items()]
+
+    def normalize(self, item):
+        item = copy.copy(item)
+        for k in self.ctx.user_fields:
+            user = item.get(k)
+            if isinstance(user, basestring) and user in self.ctx.user_aliases:
+                item[k] = self.ctx.user_aliases[user]
+        for trans in self.objectified:
+            trans(item)
+        for k, v in self.ctx.aliases.items():
+            if k in item:
+                item[v] = item.pop(k)
+        for trans in registry.transformers():
+            for k in trans.ignored:
+                item.pop(k, None)
+        return item
+
+    def issue_fields(self, item):
+        params = {}
+        for m in self.ctx.manifests:
+            params.update(m)
+        params.update(item)
+        self.normalize(params)['issuetype']
+        return self.normalize(params)
+
+
+def context(aliases, manifests):
+    ctx = Context(Mock())
+    NewManifest(ctx)({'objectify': dict(('field%d' % i, 'name') for i in range(aliases)),
+                      'aliases': dict(('field%d' % i, 'customfield_%d' % i) for i in range(aliases)),
+                      'userAliases': dict(('user%d' % i, 'user.%d' % i) for i in range(aliases))})
+    ctx.update_objectified('issuetype', 'name')
+    for i in range(manifests):
+        NewManifest(ctx)({'manifest': {'project': 'PROJ', 'assignee': 'user1', 'label%d' % (i % 5): i}})
+    return ctx
+
+
+def main(n):
+    items = [{'summary': 'item %d' % i, 'issuetype': 'Story', 'field1': 'x', 'links': []}
+             for i in range(n)]
+    print "%8s %10s %14s %14s" % ("aliases", "manifests", "legacy (us)", "compiled (us)")
+    for size in (1, 10, 100, 1000):
+        ctx = context(size, size)
+        old = legacy(ctx)
+        assert [old.issue_fields(i) for i in items[:10]] == [ctx.issue_fields(i) for i in items[:10]]
+        t_old = timeit.timeit(lambda: [old.issue_fields(i) for i in items], number=3) / 3 / n
+        t_new = timeit.timeit(lambda: [ctx.issue_fields(i) for i in items], number=3) / 3 / n
+        print "%8d %10d %14.2f %14.2f" % (size, size, t_old * 1e6, t_new * 1e6)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if sys.argv[1:] else 2000)
@@ -0,0 +1,68 @@
+"""Compares the memory and lookup cost of jy.ioutil.sdict against the
+previous double-OrderedDict implementation.
+
+    python benchmarks/bench_sdict.py [mappings]
+"""
+from jy.ioutil import sdict
+import collections
+import subprocess
+import sys
+import timeit
+
+
+class legacy_sdict(collections.OrderedDict):
+    """The previous sdict: the data is held twice, and nested access
+    re-assigns ``parent``."""
+    def __init__(self, pairs, parent=None):
+        super(legacy_sdict, self).__init__(pairs)
+        self.real = collections.OrderedDict(pairs)
+        self.parent = parent
+
+    def __getitem__(self, key):
+        v = dict.__getitem__(self, key)
+        if isinstance(v, legacy_sdict):
+            v.parent = self
+        return v
+
+    def apply(self, key, value):
+        self.real[key] = self[key] = value
+
+
+IMPLEMENTATIONS = {'legacy': legacy_sdict, 'compact': sdict}
+
+
+def build(cls, n):
+    return [cls([('key', 'PROJ-%d' % i), ('status', 'Open'), ('assignee', 'bob'),
+                 ('fields', cls([('points', i % 8), ('labels', 'x')]))])
+            for i in range(n)]
+
+
+def rss_kb():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+
+
+def child(name, n):
+    """Run in a fresh interpreter, so that each measurement starts clean."""
+    before = rss_kb()
+    items = build(IMPLEMENTATIONS[name], n)
+    print rss_kb() - before
+    return items
+
+
+def main(n):
+    print "%10s %10s %14s %16s" % ("impl", "mappings", "memory (KB)", "lookup (us)")
+    for name, cls in sorted(IMPLEMENTATIONS.items()):
+        memory = subprocess.check_output([sys.executable, __file__, '--child', name, str(n)]).strip()
+        items = build(cls, 1000)
+        lookup = timeit.timeit(lambda: [item['fields']['points'] for item in items], number=100)
+        print "%10s %10d %14s %16.3f" % (name, n, memory, lookup / 100 / 1000 * 1e6)
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--child']:
+        child(sys.argv[2], int(sys.argv[3]))
+    else:
+        main(int(sys.argv[1]) if sys.argv[1:] else 50000)
@@ -0,0 +1,59 @@
+"""Times expanding a search into a document list, and purging items from
+it, with slist.position and slist.splice against the previous index,
+insert and remove calls.
+
+    python benchmarks/bench_splice.py [size...]
+
+e.g. ``python benchmarks/bench_splice.py 1000 5000 20000``, or with the
+sizes separated by commas. A search of
+``size / 2`` results is expanded in the middle of a list of ``size``
+items, and then every other item is purged.
+"""
+from jy.ioutil import sdict, slist
+import sys
+import time
+
+
+def document(n):
+    return slist(sdict([('key', 'P-%d' % i), ('status', 'Closed' if i % 2 else 'Open')]) for i in range(n))
+
+
+def results(n):
+    return [sdict([('Story', 'story %d' % i), ('key', 'S-%d' % i)]) for i in range(n)]
+
+
+def legacy(items, node, found, purged):
+    i_ = items.index(node)
+    for j, result in enumerate(found):
+        items.insert(i_ + 2 + j, result)
+    for item in purged:
+        items.remove(item)
+
+
+def spliced(items, node, found, purged):
+    i_ = items.position(node)
+    items.splice([(i_ + 2, i_ + 2, found)])
+    items.splice([(p, p + 1, []) for p in sorted(items.position(item) for item in purged)])
+
+
+def run(fn, n):
+    items = document(n)
+    node = items[n // 2]
+    purged = items[1::2]
+    found = results(n // 2)
+    start = time.time()
+    fn(items, node, found, purged)
+    elapsed = time.time() - start
+    assert len(items) == n - len(purged) + len(found)
+    return elapsed
+
+
+def main(sizes):
+    print "%8s %12s %12s %14s" % ("items", "legacy (ms)", "splice (ms)", "splice (us/item)")
+    for n in sizes:
+        old, new = run(legacy, n), run(spliced, n)
+        print "%8d %12.1f %12.1f %14.2f" % (n, old * 1e3, new * 1e3, new * 1e6 / n)
+
+
+if __name__ == '__main__':
+    main([int(n) for arg in sys.argv[1:] for n in arg.split(',') if n] or [1000, 5000, 20000])
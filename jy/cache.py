@@ -0,0 +1,184 @@
+import json
+import os
+import re
+import threading
+import time
+
+_missing = object()
+
+
+class MetaCache(object):
+    """Caches JIRA metadata which rarely changes - workflow transitions,
+    board sprints and field lookups - across runs.
+
+    Entries are grouped by namespace, and expire after the namespace's time
+    to live. Beyond ``max_entries``, the least recently used entries are
+    evicted. Without a ``path``, the cache lasts for the process only.
+    """
+    ttls = {'transitions': 7 * 24 * 3600,
+            'sprints': 3600,
+            'fields': 24 * 3600}
+    default_ttl = 3600
+    max_entries = 5000
+
+    def __init__(self, path=None, max_entries=None):
+        self.path = path
+        self.max_entries = max_entries or self.max_entries
+        self.lock = threading.Lock()
+        self.changed = False
+        # "namespace:key" -> [expires, last used, value]
+        self.entries = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path) as f:
+                    self.entries = json.load(f)
+            except ValueError:
+                # a damaged cache is rebuilt from scratch
+                self.changed = True
+
+    def get(self, namespace, key, default=None):
+        now = time.time()
+        name = "%s:%s" % (namespace, key)
+        with self.lock:
+            entry = self.entries.get(name)
+            if entry is None:
+                return default
+            if entry[0] < now:
+                del self.entries[name]
+                self.changed = True
+                return default
+            # the time of use is saved too, for the eviction order
+            entry[1] = now
+            self.changed = True
+            return entry[2]
+
+    def set(self, namespace, key, value, ttl=None):
+        now = time.time()
+        if ttl is None:
+            ttl = self.ttls.get(namespace, self.default_ttl)
+        with self.lock:
+            self.entries["%s:%s" % (namespace, key)] = [now + ttl, now, value]
+            self.changed = True
+            if len(self.entries) > self.max_entries:
+                self._evict()
+        return value
+
+    def fetch(self, namespace, key, fn):
+        """Returns the cached value, or caches and returns ``fn()``, None
+        included."""
+        value = self.get(namespace, key, _missing)
+        if value is _missing:
+            value = self.set(namespace, key, fn())
+        return value
+
+    def invalidate(self, namespace, key=None):
+        """Drops an entry, or a whole namespace when ``key`` is None; used
+        when the server rejects a cached value."""
+        prefix = "%s:%s" % (namespace, "" if key is None else key)
+        with self.lock:
+            for name in self.entries.keys():
+                if name == prefix or (key is None and name.startswith(prefix)):
+                    del self.entries[name]
+                    self.changed = True
+
+    def clear(self):
+        with self.lock:
+            self.entries = {}
+            self.changed = True
+
+    def _evict(self):
+        # evict down to 90% so that eviction is not repeated on every set
+        by_use = sorted(self.entries, key=lambda name: self.entries[name][1])
+        for name in by_use[:len(by_use) - int(self.max_entries * 0.9)]:
+            del self.entries[name]
+
+    def save(self):
+        if not self.path or not self.changed:
+            return
+        now = time.time()
+        with self.lock:
+            entries = dict((name, e) for name, e in self.entries.items() if e[0] >= now)
+            self.changed = False
+        tmp = "%s.%s.tmp" % (self.path, os.getpid())
+        with open(tmp, "w") as f:
+            json.dump(entries, f)
+        os.rename(tmp, self.path)
+
+
+class SearchCache(MetaCache):
+    """Caches the issues JQL searches match across runs, by the search and
+    the fields it asks for.
+
+    A cached search is checked, rather than run again, with the query for
+    the issues it matches which were updated since it was cached, which are
+    merged into the cached issues, and the keys of all the issues it
+    matches, ``key_page_size`` to a request: the issues which left the
+    search are dropped, and the rest put in the search's order. A key which
+    is not cached means an issue joined the search without being updated,
+    and it is run again. Searches of more than ``max_issues`` issues are
+    not kept.
+    """
+    ttls = {'search': 7 * 24 * 3600}
+    max_entries = 200
+    max_issues = 5000
+    key_page_size = 1000
+
+    def search(self, jira, jql, fields, page_size=100, validate=True):
+        """Yields the raw JSON of each issue matching ``jql``, as
+        jy.transformers.iter_search does."""
+        from jy.transformers import iter_search
+        if isinstance(fields, basestring):
+            fields = fields.split(",")
+        fields = sorted(set(fields))
+        key = json.dumps([normalize_jql(jql), fields, validate])
+        started = time.time()
+        entry = self.get('search', key)
+        if entry is not None:
+            issues = self._refresh(jira, jql, fields, entry, started, page_size, validate)
+            if issues is not None:
+                self.set('search', key, {'time': started, 'issues': issues})
+                for issue in issues:
+                    yield issue
+                return
+        issues = []
+        for issue in iter_search(jira, jql, fields, page_size, validate):
+            if issues is not None:
+                issues.append(issue)
+                if len(issues) > self.max_issues:
+                    issues = None
+            yield issue
+        if issues is not None:
+            self.set('search', key, {'time': started, 'issues': issues})
+
+    def _refresh(self, jira, jql, fields, entry, started, page_size, validate):
+        """The cached issues of ``entry`` brought up to date, or None when
+        the search has to be run again."""
+        from jy.transformers import iter_search
+        where, _ = split_order(jql)
+        if not where:
+            return None
+        # JQL dates are in the user's time zone; a relative date is not,
+        # and a minute is added for the rounding
+        minutes = int(started - entry['time']) // 60 + 2
+        issues = dict((issue['key'], issue) for issue in entry['issues'])
+        for issue in iter_search(jira, "(%s) AND updated >= -%dm" % (where, minutes), fields, page_size,
+                                 validate):
+            issues[issue['key']] = issue
+        # the keys the search matches now, in its order: an issue which
+        # matches it without having been updated, e.g. through a JQL
+        # function, is not in the cache, and the search is run again
+        keys = [issue['key'] for issue in iter_search(jira, jql, 'key', self.key_page_size, validate)]
+        if not issues.viewkeys() >= set(keys):
+            return None
+        return [issues[key] for key in keys]
+
+
+def normalize_jql(jql):
+    """``jql`` with the whitespace outside its quoted strings collapsed."""
+    return re.sub(r'("[^"]*"|\'[^\']*\')|\s+', lambda m: m.group(1) or " ", jql).strip()
+
+
+def split_order(jql):
+    """The condition and the ``ORDER BY`` clause, if any, of ``jql``."""
+    parts = re.split(r'(?:^|\s+)(order\s+by\s+.*)$', jql.strip(), maxsplit=1, flags=re.I)
+    return parts[0].strip(), parts[1] if len(parts) > 1 else None
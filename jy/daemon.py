@@ -0,0 +1,270 @@
+"""Keeps a connection to JIRA and warm caches between runs of jywriter.
+
+The daemon runs documents when asked to over a Unix socket, and whenever
+a document it watches changes. ``jyd run`` asks it to run a document and
+prints the result, without importing the client or connecting itself.
+
+Usage:
+  jyd serve [options] [<path>...]
+  jyd run [options] <path>
+  jyd watch [options] <path>...
+  jyd stop [options]
+
+Options:
+  -s --socket=<path>    Socket of the daemon [default: ~/.jy.sock].
+  -U --update           Update all the known tickets with Status.
+  -P --purge            Remove all completed items.
+  --full                With --update, fetch every ticket rather than those changed since.
+  -j --jobs=<n>         Run up to <n> JIRA calls at once.
+  -I --incremental      Only process items changed since the last run.
+  --no-search-cache     Run every search against JIRA rather than checking cached results.
+  -i --interval=<s>     Seconds between checks of the watched documents [default: 1].
+  -h --help             Show this screen.
+"""
+from SocketServer import StreamRequestHandler, ThreadingMixIn, UnixStreamServer
+from StringIO import StringIO
+import json
+import os
+import socket
+import sys
+import threading
+
+# the options a request may set for its run
+RUN_OPTIONS = ('--update', '--purge', '--full')
+
+
+class Handler(StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            try:
+                reply = self.server.daemon.handle(json.loads(line))
+            except Exception, e:
+                reply = {'ok': False, 'output': "%s\n" % e}
+            self.wfile.write(json.dumps(reply) + "\n")
+            self.wfile.flush()
+
+
+class Server(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+
+class Daemon(object):
+    """Runs documents through one Runner, one at a time.
+
+    A watched document is run when its modification time or size changes,
+    other than by the daemon's own rewrite. The documents are checked every
+    ``interval`` seconds, and as soon as pyinotify reports a change, when
+    it is installed.
+    """
+    def __init__(self, runner, address, interval=1.0):
+        self.runner = runner
+        self.address = address
+        self.interval = interval
+        self.arguments = dict(runner.arguments)
+        self.reruns = 3
+        self.lock = threading.Lock()
+        # path -> (mtime, size) as of its last run
+        self.watched = {}
+        self.wake = threading.Event()
+        self.stopped = threading.Event()
+        self.server = None
+        self.notifier = None
+        # where runs of watched documents are reported
+        self.log = sys.stdout
+
+    def sync(self, path, options=None):
+        """Runs the document at ``path``, and returns what it printed.
+
+        A document saved while it runs is not written over; it is run
+        again, up to ``reruns`` times, and the changes already made in
+        JIRA replayed into it from the journal.
+        """
+        from jy.writer import document_version, read_document
+        out = StringIO()
+        with self.lock:
+            self.runner.arguments = dict(self.arguments, **dict((k, v) for k, v in (options or {}).items()
+                                                                if k in RUN_OPTIONS))
+            ok = False
+            for _ in range(self.reruns + 1):
+                # taken before reading, so that a save in between is caught
+                version = document_version(path)
+                try:
+                    source, items = read_document(path)
+                    self.runner.run(path, path, source, items, version, out)
+                    ok = True
+                except (Exception, SystemExit), e:
+                    print >> out, e
+                if self.runner.summary and self.runner.summary[-1][0] == path:
+                    print >> out, self.runner.describe(self.runner.summary[-1])
+                del self.runner.summary[:]
+                if self.runner.written is not None or not ok:
+                    break
+                print >> out, "Running", path, "again"
+                ok = False
+            if path in self.watched:
+                # the version the run wrote, or else the one it read: a save
+                # made since is run by the next check
+                self.watched[path] = self.runner.written or version
+        return {'ok': ok, 'output': out.getvalue()}
+
+    def watch(self, path):
+        with self.lock:
+            if path not in self.watched:
+                self.watched[path] = None
+                if self.notifier:
+                    self.notifier.add(path)
+        self.wake.set()
+        return {'ok': True, 'output': "Watching %s\n" % path}
+
+    def handle(self, request):
+        command = request.get('command')
+        if command == 'run':
+            return self.sync(os.path.abspath(request['path']), request.get('options'))
+        if command == 'watch':
+            return self.watch(os.path.abspath(request['path']))
+        if command == 'stop':
+            threading.Thread(target=self.stop).start()
+            return {'ok': True, 'output': ""}
+        return {'ok': False, 'output': "Unknown command %r\n" % command}
+
+    def check(self):
+        """Runs the watched documents which changed since their last run."""
+        from jy.writer import document_version
+        for path, version in self.watched.items():
+            if document_version(path) != version:
+                self.log.write(self.sync(path)['output'])
+                self.log.flush()
+
+    def poll(self):
+        while not self.stopped.is_set():
+            self.check()
+            self.wake.wait(self.interval)
+            self.wake.clear()
+
+    def serve(self):
+        """Serves requests until :meth:`stop` is called."""
+        if os.path.exists(self.address):
+            if _alive(self.address):
+                raise RuntimeError("A daemon is already listening on %s" % self.address)
+            os.remove(self.address)
+        self.server = Server(self.address, Handler)
+        self.server.daemon = self
+        os.chmod(self.address, 0600)
+        self.notifier = Notifier.start(self.wake)
+        for path in self.watched:
+            if self.notifier:
+                self.notifier.add(path)
+        poller = threading.Thread(target=self.poll)
+        poller.daemon = True
+        poller.start()
+        try:
+            self.server.serve_forever(poll_interval=0.1)
+        finally:
+            self.stopped.set()
+            self.wake.set()
+            poller.join()
+            self.server.server_close()
+            if self.notifier:
+                self.notifier.stop()
+            if os.path.exists(self.address):
+                os.remove(self.address)
+
+    def stop(self):
+        self.server.shutdown()
+
+
+class Notifier(object):
+    """Wakes the daemon when inotify reports a write to a watched document's
+    directory; editors often save by replacing the file."""
+    def __init__(self, pyinotify, wake):
+        self.pyinotify = pyinotify
+        self.manager = pyinotify.WatchManager()
+        self.notifier = pyinotify.ThreadedNotifier(self.manager, lambda event: wake.set())
+        self.dirs = set()
+
+    @classmethod
+    def start(cls, wake):
+        try:
+            import pyinotify
+        except ImportError:
+            return None
+        notifier = cls(pyinotify, wake)
+        notifier.notifier.daemon = True
+        notifier.notifier.start()
+        return notifier
+
+    def add(self, path):
+        head = os.path.dirname(path)
+        if head not in self.dirs:
+            self.dirs.add(head)
+            self.manager.add_watch(head, self.pyinotify.IN_CLOSE_WRITE | self.pyinotify.IN_MOVED_TO)
+
+    def stop(self):
+        self.notifier.stop()
+
+
+def _alive(address):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(address)
+        return True
+    except socket.error:
+        return False
+    finally:
+        sock.close()
+
+
+def request(address, message):
+    """Sends ``message`` to the daemon at ``address`` and returns its reply."""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(address)
+        f = sock.makefile('rw')
+        f.write(json.dumps(message) + "\n")
+        f.flush()
+        return json.loads(f.readline())
+    finally:
+        sock.close()
+
+
+def main():
+    from docopt import docopt
+    arguments = docopt(__doc__)
+    address = os.path.expanduser(arguments['--socket'])
+    if arguments['serve']:
+        from jy.writer import load_conf, make_runner
+        runner = make_runner(dict((k, v) for k, v in arguments.items() if k.startswith('--')), load_conf())
+        daemon = Daemon(runner, address, float(arguments['--interval']))
+        for path in arguments['<path>']:
+            daemon.watched[os.path.abspath(path)] = None
+        print "Listening on", address
+        try:
+            daemon.serve()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            runner.finish()
+        return
+
+    options = dict((k, arguments[k]) for k in RUN_OPTIONS if arguments[k])
+    if arguments['run']:
+        messages = [{'command': 'run', 'path': os.path.abspath(arguments['<path>'][0]), 'options': options}]
+    elif arguments['watch']:
+        messages = [{'command': 'watch', 'path': os.path.abspath(p)} for p in arguments['<path>']]
+    else:
+        messages = [{'command': 'stop'}]
+    ok = True
+    for message in messages:
+        try:
+            reply = request(address, message)
+        except socket.error, e:
+            print >> sys.stderr, "No daemon on %s (%s); start one with jyd serve" % (address, e)
+            sys.exit(2)
+        sys.stdout.write(reply['output'])
+        ok = ok and reply['ok']
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
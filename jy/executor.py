@@ -0,0 +1,130 @@
+from multiprocessing.pool import ThreadPool
+import sys
+import threading
+
+
+class Task(object):
+    def __init__(self, fn, args):
+        self.fn = fn
+        self.args = args
+        # one hold for the scheduler, plus one per unfinished dependency
+        self.waiting = 1
+        self.dependents = []
+        self.finished = False
+        self.failed = False
+
+
+class Executor(object):
+    """Runs tasks on a bounded pool of threads.
+
+    A task may depend on another task, or as a barrier on every task
+    registered before it, and only starts once those have finished
+    successfully; dependents of a failed task are cancelled. The
+    first error raised by any task, SystemExit included, is re-raised by
+    :meth:`wait`.
+    """
+    def __init__(self, jobs):
+        self.pool = ThreadPool(jobs)
+        self.cond = threading.Condition()
+        self.pending = 0
+        self.error = None
+        # the registered tasks which have not finished, for barriers
+        self.unfinished = set()
+
+    def task(self, fn, *args, **kwargs):
+        """Registers a task which runs ``fn(*args)`` after the task given as
+        ``after``, and with ``barrier``, after every task registered before
+        it. The task is held until it is passed to :meth:`start`."""
+        after = kwargs.get('after')
+        task = Task(fn, args)
+        with self.cond:
+            afters = set(self.unfinished) if kwargs.get('barrier') else set()
+            if after is not None:
+                afters.add(after)
+            if self.error or any(a.failed for a in afters):
+                task.finished = task.failed = True
+                return task
+            self.pending += 1
+            self.unfinished.add(task)
+            for a in afters:
+                if not a.finished:
+                    a.dependents.append(task)
+                    task.waiting += 1
+        return task
+
+    def start(self, task):
+        if not task.finished:
+            self._release(task)
+
+    def cancel(self, task):
+        if not task.finished:
+            self._cancel(task)
+
+    def _release(self, task):
+        with self.cond:
+            if task.finished:
+                # cancelled by another of its dependencies
+                return
+            task.waiting -= 1
+            ready = task.waiting == 0
+        if ready:
+            self.pool.apply_async(self._run, (task,))
+
+    def _run(self, task):
+        try:
+            task.fn(*task.args)
+        except BaseException:
+            # including SystemExit, e.g. from a failed create, which would
+            # otherwise end the pool's thread and leave wait() hanging
+            with self.cond:
+                if self.error is None:
+                    self.error = sys.exc_info()
+            task.failed = True
+        with self.cond:
+            task.finished = True
+            self.unfinished.discard(task)
+            dependents, task.dependents = task.dependents, []
+        for dependent in dependents:
+            if task.failed:
+                self._cancel(dependent)
+            else:
+                self._release(dependent)
+        self._done()
+
+    def _cancel(self, task):
+        with self.cond:
+            if task.finished:
+                return
+            task.finished = task.failed = True
+            self.unfinished.discard(task)
+            dependents, task.dependents = task.dependents, []
+        for dependent in dependents:
+            self._cancel(dependent)
+        self._done()
+
+    def _done(self):
+        with self.cond:
+            self.pending -= 1
+            self.cond.notify_all()
+
+    def map(self, fn, iterable):
+        """Applies ``fn`` to each element on the pool, yielding results in order."""
+        return self.pool.imap(fn, iterable)
+
+    @property
+    def failed(self):
+        return self.error is not None
+
+    def wait(self):
+        """Blocks until every registered task has finished or been cancelled."""
+        with self.cond:
+            while self.pending:
+                # a timeout keeps the wait interruptible
+                self.cond.wait(1)
+            error, self.error = self.error, None
+        if error:
+            raise error[0], error[1], error[2]
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
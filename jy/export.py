@@ -0,0 +1,196 @@
+"""Writes the items of a document, or the issues a search matches, as JSON
+Lines, CSV or a FreeMind mind map.
+
+Exporters are handed ``(depth, item)`` pairs one at a time and write each
+out at once, so that the issues of a search, which are fetched a page at
+a time, are exported in constant memory. Other packages can add formats
+under the ``jy.exporters`` entry point group, as for transformers; see
+jy.registry.
+"""
+from jy import registry
+from jy.ioutil import atomic_open, sdict
+from jy.state import plain
+from xml.sax.saxutils import quoteattr
+import csv
+import itertools
+import json
+
+# the columns of a CSV export
+COLUMNS = ['key', 'type', 'summary', 'status', 'assignee', 'parent']
+# keys which hold the items nested under an item
+NESTED = ('items', 'subtasks')
+
+
+def walk(items, depth=0):
+    """Yields ``(depth, item)`` for each mapping in a document, depth first."""
+    for item in items:
+        if isinstance(item, dict):
+            yield depth, item
+            for key in NESTED:
+                if isinstance(item.get(key), list):
+                    for pair in walk(item[key], depth + 1):
+                        yield pair
+
+
+def search(ctx, jql, extra=()):
+    """Yields ``(0, item)`` for each issue matching ``jql``, as DoSearch would
+    write it, fetching a page at a time. The search is always run against
+    JIRA rather than the search cache, which would hold every issue."""
+    from jy.transformers import DoSearch
+    for _, data in DoSearch(ctx)._search(jql, extra, cached=False):
+        yield 0, data
+
+
+def started(pairs):
+    """``pairs``, with its first pair already fetched, so that a search
+    JIRA rejects fails before the output is opened."""
+    pairs = iter(pairs)
+    for pair in pairs:
+        return itertools.chain([pair], pairs)
+    return pairs
+
+
+def fields(item):
+    """The item's own fields as written out, less its nested items."""
+    pairs = item.real_items() if isinstance(item, sdict) else item.items()
+    return [(k, v) for k, v in pairs if k not in NESTED]
+
+
+def headline(item):
+    """The ``(type, summary)`` of an item: its ``summary`` and
+    ``issuetype``, or e.g. ``Story: summary`` as written in documents."""
+    if 'summary' in item:
+        return item.get('issuetype'), item['summary']
+    for k, v in fields(item):
+        if isinstance(k, basestring) and k[:1].isupper() and isinstance(v, basestring):
+            return k, v
+    return None, None
+
+
+def text(value):
+    if value is None:
+        return u""
+    if isinstance(value, unicode):
+        return value
+    if isinstance(value, str):
+        return value.decode('utf-8')
+    return unicode(value)
+
+
+class Exporter(object):
+    """Base class of the formats: :meth:`write` is called for each item,
+    with its depth in the document, and :meth:`close` once at the end."""
+    def __init__(self, out, title=None):
+        self.out = out
+        self.title = title
+        # the keys of the items enclosing the current one, by depth
+        self.parents = []
+
+    def parent(self, depth, item):
+        """The key of the item which ``item``, at ``depth``, is nested in."""
+        del self.parents[depth:]
+        parent = self.parents[-1] if self.parents else None
+        self.parents.append(item.get('key'))
+        return parent
+
+    def write(self, depth, item):
+        raise NotImplementedError
+
+    def close(self):
+        self.out.flush()
+
+
+class JsonLines(Exporter):
+    """One JSON object per item: its fields, and the key of the item it is
+    nested in as ``parent``."""
+    def write(self, depth, item):
+        data = dict(fields(item))
+        parent = self.parent(depth, item)
+        if parent:
+            data['parent'] = parent
+        self.out.write(json.dumps(plain(data), sort_keys=True, default=str) + "\n")
+
+
+class Csv(Exporter):
+    """One row per item, of the :data:`COLUMNS`."""
+    def __init__(self, out, title=None):
+        super(Csv, self).__init__(out, title)
+        self.writer = csv.writer(out)
+        self.writer.writerow(COLUMNS)
+
+    def write(self, depth, item):
+        type_, summary = headline(item)
+        row = dict(fields(item), type=type_, summary=summary, parent=self.parent(depth, item))
+        self.writer.writerow([text(row.get(c)).encode('utf-8') for c in COLUMNS])
+
+
+class FreeMind(Exporter):
+    """A FreeMind map, with a node for each item under a root node named
+    ``title``. The item's other fields are the node's attributes."""
+    def __init__(self, out, title=None):
+        super(FreeMind, self).__init__(out, title)
+        self.depth = -1
+        self.out.write('<map version="1.0.1">\n<node TEXT=%s>\n' % self._attr(title or u""))
+
+    def _attr(self, value):
+        return quoteattr(text(value)).encode('utf-8')
+
+    def _close_to(self, depth):
+        while self.depth >= depth:
+            self.out.write("  " * (self.depth + 1) + "</node>\n")
+            self.depth -= 1
+
+    def write(self, depth, item):
+        self._close_to(depth)
+        type_, summary = headline(item)
+        label = u"%s: %s" % (type_, text(summary)) if type_ else text(summary or item.get('key') or u"")
+        if item.get('key') and label != item['key']:
+            label = u"%s [%s]" % (label, item['key'])
+        indent = "  " * (depth + 1)
+        self.out.write('%s<node TEXT=%s>\n' % (indent, self._attr(label)))
+        for k, v in fields(item):
+            if k not in (type_, 'summary', 'key') and not isinstance(v, (dict, list)):
+                self.out.write('%s  <attribute NAME=%s VALUE=%s/>\n' % (indent, self._attr(k), self._attr(v)))
+        self.depth = depth
+
+    def close(self):
+        self._close_to(0)
+        self.out.write("</node>\n</map>\n")
+        super(FreeMind, self).close()
+
+
+FORMATS = {'jsonl': JsonLines, 'csv': Csv, 'freemind': FreeMind}
+
+
+def exporter_class(name):
+    """The exporter class of the format ``name``."""
+    cls = FORMATS.get(name)
+    if cls is None:
+        for entry in registry.entry_points('jy.exporters', name):
+            return entry.resolve()
+        raise ValueError("Unknown export format %r; try one of %s" % (name, ", ".join(sorted(FORMATS))))
+    return cls
+
+
+def exporter(name, out, title=None):
+    """The exporter of the format ``name``, writing to ``out``."""
+    return exporter_class(name)(out, title)
+
+
+def export(pairs, exporter):
+    """Writes each ``(depth, item)`` of ``pairs`` with ``exporter``, and
+    returns how many were written."""
+    n = 0
+    for depth, item in pairs:
+        exporter.write(depth, item)
+        n += 1
+    exporter.close()
+    return n
+
+
+def export_to(path, pairs, cls, title=None):
+    """Writes ``pairs`` to the file at ``path`` with the exporter class
+    ``cls``, replacing it only once they all are written; see
+    jy.ioutil.atomic_open."""
+    with atomic_open(path) as out:
+        return export(pairs, cls(out, title))
@@ -0,0 +1,587 @@
+"""A stand-in for a JIRA server, for tests and benchmarks; run on its own
+with ``python -m jy.fakejira``.
+
+Usage:
+  fakejira [options]
+
+Options:
+  -p --port=<port>       Port to listen on [default: 8080].
+  -H --host=<host>       Address to listen on; the server is unauthenticated [default: 127.0.0.1].
+  -l --latency=<s>       Seconds added to every request [default: 0].
+  -s --page-size=<n>     Most issues returned by one search [default: 1000].
+  -b --board=<id>        Board with sprints "Sprint 1" to "Sprint 3" [default: 1].
+"""
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+import calendar
+import collections
+import json
+import re
+import threading
+import time
+import urlparse
+
+EPIC_LINK = 'customfield_10008'
+SPRINT = 'customfield_10007'
+
+# status -> [(transition, destination)]
+WORKFLOW = {'Open': [('Start Progress', 'In Progress'), ('Resolve Issue', 'Resolved'), ('Close Issue', 'Closed')],
+            'In Progress': [('Stop Progress', 'Open'), ('Resolve Issue', 'Resolved'), ('Close Issue', 'Closed')],
+            'Resolved': [('Reopen Issue', 'Reopened'), ('Close Issue', 'Closed')],
+            'Reopened': [('Start Progress', 'In Progress'), ('Resolve Issue', 'Resolved'), ('Close Issue', 'Closed')],
+            'Closed': [('Reopen Issue', 'Reopened')]}
+TRANSITION_IDS = dict((name, str(i + 1)) for i, name in
+                      enumerate(sorted(set(n for ts in WORKFLOW.values() for n, _ in ts))))
+LINK_TYPES = [('Relates', 'relates to', 'relates to'),
+              ('Blocks', 'is blocked by', 'blocks'),
+              ('Duplicate', 'is duplicated by', 'duplicates')]
+SUBTASK_TYPE_ID = '5'
+
+
+class NotFound(Exception):
+    pass
+
+
+class BadRequest(Exception):
+    pass
+
+
+def timestamp(t):
+    return time.strftime('%Y-%m-%dT%H:%M:%S.000+0000', time.gmtime(t))
+
+
+def parse_time(value):
+    """Parses a JQL date, e.g. ``2015/03/01 10:30`` as UTC, or ``-90m`` for
+    90 minutes ago."""
+    relative = re.match(r'-(\d+)([mhdw])$', value)
+    if relative:
+        unit = {'m': 60, 'h': 3600, 'd': 86400, 'w': 7 * 86400}[relative.group(2)]
+        return time.time() - int(relative.group(1)) * unit
+    for fmt in ('%Y/%m/%d %H:%M', '%Y-%m-%d %H:%M', '%Y/%m/%d', '%Y-%m-%d'):
+        try:
+            return calendar.timegm(time.strptime(value, fmt))
+        except ValueError:
+            pass
+    raise BadRequest("Bad date: %s" % value)
+
+
+class JQL(object):
+    """Enough of JQL for jywriter: clauses of the form ``field = value``,
+    ``field != value``, ``field >= date`` and ``field in (values)``, and
+    ``issue in linkedIssues(KEY)``, combined with AND, OR and parentheses.
+    """
+    token = re.compile(r'\s*("[^"]*"|\'[^\']*\'|\(|\)|,|!=|>=|<=|=|>|<|[^\s(),=!<>]+)')
+
+    def __init__(self, text):
+        text = re.split(r'\s+order\s+by\s+', text, flags=re.I)[0]
+        self.tokens = [t for t in self.token.findall(text) if t.strip()]
+        self.pos = 0
+        self.tree = self.expr() if self.tokens else ('all',)
+        if self.pos != len(self.tokens):
+            raise BadRequest("Unexpected %r in JQL" % self.tokens[self.pos])
+
+    def peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def next(self):
+        token = self.peek()
+        if token is None:
+            raise BadRequest("Unexpected end of JQL")
+        self.pos += 1
+        return token
+
+    def word(self):
+        token = self.next()
+        if token[0] in '"\'':
+            return token[1:-1]
+        return token
+
+    def expr(self):
+        node = self.conjunction()
+        while (self.peek() or '').lower() == 'or':
+            self.next()
+            node = ('or', node, self.conjunction())
+        return node
+
+    def conjunction(self):
+        node = self.clause()
+        while (self.peek() or '').lower() == 'and':
+            self.next()
+            node = ('and', node, self.clause())
+        return node
+
+    def clause(self):
+        if self.peek() == '(':
+            self.next()
+            node = self.expr()
+            if self.next() != ')':
+                raise BadRequest("Unbalanced parentheses in JQL")
+            return node
+        if (self.peek() or '').lower() == 'not':
+            self.next()
+            return ('not', self.clause())
+        field = self.word().lower()
+        op = self.next().lower()
+        if op == 'not':
+            if self.next().lower() != 'in':
+                raise BadRequest("Expected IN")
+            return ('not', self.values('in', field))
+        if op == 'in':
+            return self.values(op, field)
+        return (op, field, self.word())
+
+    def values(self, op, field):
+        if self.peek() != '(':
+            function = self.word()
+            if function.lower() != 'linkedissues':
+                raise BadRequest("Unknown function %s" % function)
+            self.next()
+            key = self.word()
+            self.next()
+            return ('linked', key)
+        self.next()
+        values = []
+        while self.peek() != ')':
+            values.append(self.word())
+            if self.peek() == ',':
+                self.next()
+        self.next()
+        return ('in', field, values)
+
+
+class FakeJira(object):
+    """The state of a fake JIRA server: issues, their workflow, comments,
+    links, epics and sprints, kept in memory.
+
+    ``latency`` maps the names of endpoints (``search``, ``create``,
+    ``bulk``, ``issue``, ``update``, ``comment``, ``transitions``,
+    ``transition``, ``link``, ``epic``, ``sprints``, ``rank``...) to the
+    seconds added to each request, with ``default`` for the rest. Searches
+    return at most ``page_size`` issues at a time, whatever is asked for.
+    With ``autocreate``, an issue referred to by key comes into existence.
+    """
+    def __init__(self, latency=None, page_size=1000, boards=None, autocreate=False):
+        if not isinstance(latency, dict):
+            latency = {'default': latency or 0}
+        self.latency = latency
+        self.page_size = page_size
+        self.autocreate = autocreate
+        self.lock = threading.RLock()
+        self.issues = collections.OrderedDict()
+        self.ids = {}
+        self.counters = collections.defaultdict(int)
+        self.sprints = {}
+        self.boards = {}
+        for board, names in (boards or {1: ['Sprint 1', 'Sprint 2', 'Sprint 3']}).items():
+            self.add_board(board, names)
+        self.calls = collections.defaultdict(int)
+        self.durations = []
+        self.server = None
+
+    # state
+
+    def add_board(self, board, names):
+        with self.lock:
+            self.boards[int(board)] = []
+            for name in names:
+                sprint_id = len(self.sprints) + 1
+                self.sprints[sprint_id] = {'id': sprint_id, 'name': name, 'state': 'ACTIVE', 'board': int(board)}
+                self.boards[int(board)].append(sprint_id)
+
+    def add_issue(self, fields, key=None):
+        """Creates an issue from ``fields``, as sent to ``POST /issue``, and
+        returns its key."""
+        with self.lock:
+            fields = dict(fields)
+            project = fields.pop('project', None)
+            if isinstance(project, dict):
+                project = project.get('key')
+            if not project:
+                raise BadRequest({'project': 'project is required'})
+            issuetype = fields.pop('issuetype', None) or {}
+            if isinstance(issuetype, basestring):
+                issuetype = {'name': issuetype}
+            if not issuetype.get('name') and str(issuetype.get('id')) == SUBTASK_TYPE_ID:
+                issuetype = {'name': 'Sub-task'}
+            if not issuetype.get('name'):
+                raise BadRequest({'issuetype': 'issue type is required'})
+            if not fields.get('summary'):
+                raise BadRequest({'summary': 'You must specify a summary of the issue.'})
+            if key is None:
+                self.counters[project] += 1
+                key = "%s-%d" % (project, self.counters[project])
+                while key in self.issues:
+                    self.counters[project] += 1
+                    key = "%s-%d" % (project, self.counters[project])
+            parent = fields.pop('parent', None)
+            if parent and self._issue(parent['key'] if isinstance(parent, dict) else parent) is None:
+                raise BadRequest({'parent': 'Could not find issue by id or key.'})
+            now = time.time()
+            issue = {'id': str(len(self.ids) + 10000), 'key': key, 'comments': [], 'links': [],
+                     'fields': {'summary': fields.pop('summary'),
+                                'issuetype': {'name': issuetype['name'], 'subtask': bool(parent)},
+                                'project': {'key': project},
+                                'status': {'name': 'Open'},
+                                'resolution': None,
+                                'assignee': None, 'reporter': None, 'description': None,
+                                'fixVersions': [], SPRINT: None, EPIC_LINK: None,
+                                'created': now, 'updated': now}}
+            if parent:
+                issue['fields']['parent'] = {'key': parent['key'] if isinstance(parent, dict) else parent}
+            self.issues[key] = issue
+            self.ids[issue['id']] = key
+            self._set(issue, fields)
+            return key
+
+    def _issue(self, key_or_id):
+        return self.issues.get(key_or_id) or self.issues.get(self.ids.get(key_or_id))
+
+    def issue(self, key_or_id):
+        issue = self._issue(key_or_id)
+        if issue is None and self.autocreate and re.match(r'[A-Z][A-Z0-9]*-\d+$', key_or_id):
+            self.add_issue({'project': key_or_id.split('-')[0], 'issuetype': 'Task', 'summary': key_or_id},
+                           key=key_or_id)
+            issue = self.issues[key_or_id]
+        if issue is None:
+            raise NotFound("Issue Does Not Exist")
+        return issue
+
+    def _set(self, issue, fields):
+        for name, value in fields.items():
+            if name in ('assignee', 'reporter') and isinstance(value, basestring):
+                value = {'name': value}
+            issue['fields'][name] = value
+        issue['fields']['updated'] = time.time()
+
+    def _touch(self, issue):
+        issue['fields']['updated'] = time.time()
+
+    def transitions(self, issue):
+        return [{'id': TRANSITION_IDS[name], 'name': name, 'to': {'name': to}}
+                for name, to in WORKFLOW.get(issue['fields']['status']['name'], [])]
+
+    def transition(self, issue, transition_id):
+        for t in self.transitions(issue):
+            if t['id'] == str(transition_id):
+                issue['fields']['status'] = {'name': t['to']['name']}
+                resolved = t['to']['name'] in ('Resolved', 'Closed')
+                issue['fields']['resolution'] = {'name': 'Fixed'} if resolved else None
+                self._touch(issue)
+                return
+        raise BadRequest("It seems that you have tried to perform a workflow operation (%s) that is not valid "
+                         "for the current state of this issue (%s)." % (transition_id, issue['key']))
+
+    def link(self, type_name, inward, outward):
+        for name, inward_name, outward_name in LINK_TYPES:
+            if type_name == name:
+                break
+        else:
+            raise NotFound("No issue link type with name '%s' found." % type_name)
+        a, b = self.issue(inward), self.issue(outward)
+        type_ = {'name': name, 'inward': inward_name, 'outward': outward_name}
+        a['links'].append({'type': type_, 'outwardIssue': {'key': b['key']}})
+        b['links'].append({'type': type_, 'inwardIssue': {'key': a['key']}})
+        self._touch(a)
+        self._touch(b)
+
+    def sprint_field(self, sprint_id):
+        s = self.sprints[sprint_id]
+        return ("com.atlassian.greenhopper.service.sprint.Sprint@%x[id=%s,rapidViewId=%s,state=%s,name=%s,"
+                "startDate=<null>,endDate=<null>,completeDate=<null>,sequence=%s]"
+                % (s['id'], s['id'], s['board'], s['state'], s['name'], s['id']))
+
+    def search(self, jql):
+        tree = JQL(jql).tree
+        return [issue for issue in self.issues.values() if self.matches(tree, issue)]
+
+    def matches(self, node, issue):
+        op = node[0]
+        if op == 'all':
+            return True
+        if op == 'and':
+            return self.matches(node[1], issue) and self.matches(node[2], issue)
+        if op == 'or':
+            return self.matches(node[1], issue) or self.matches(node[2], issue)
+        if op == 'not':
+            return not self.matches(node[1], issue)
+        if op == 'linked':
+            key = node[1]
+            return any(link.get('inwardIssue', link.get('outwardIssue'))['key'] == key
+                       for link in issue['links'])
+        values = self.values(node[1], issue)
+        if op == 'in':
+            targets = [v.lower() for v in node[2]]
+            return any(v is not None and str(v).lower() in targets for v in values)
+        if op in ('=', '!='):
+            found = any(v is not None and str(v).lower() == node[2].lower() for v in values)
+            return found if op == '=' else not found
+        if op in ('>', '>=', '<', '<='):
+            limit = parse_time(node[2])
+            value = values[0]
+            return {'>': value > limit, '>=': value >= limit, '<': value < limit, '<=': value <= limit}[op]
+        raise BadRequest("Unsupported operator %s" % op)
+
+    def values(self, field, issue):
+        fields = issue['fields']
+        if field in ('key', 'issue', 'issuekey', 'id'):
+            return [issue['key'], issue['id']]
+        if field == 'project':
+            return [fields['project']['key']]
+        if field == 'parent':
+            return [(fields.get('parent') or {}).get('key')]
+        if field in ('"epic link"', 'epic link', 'cf[10008]'):
+            return [fields.get(EPIC_LINK)]
+        if field == 'sprint':
+            sprint = fields.get(SPRINT)
+            ids = re.findall(r'id=(\d+)', sprint[0]) if sprint else []
+            return ids + [self.sprints[int(i)]['name'] for i in ids]
+        if field in ('updated', 'created'):
+            return [fields[field]]
+        value = fields.get(field)
+        if isinstance(value, dict):
+            value = value.get('name', value.get('key'))
+        if isinstance(value, list):
+            return [v.get('name') if isinstance(v, dict) else v for v in value] or [None]
+        return [value]
+
+    def to_json(self, issue, base, fields=None):
+        values = dict(issue['fields'])
+        values['created'] = timestamp(values['created'])
+        values['updated'] = timestamp(values['updated'])
+        values['issuelinks'] = issue['links']
+        values['comment'] = {'comments': issue['comments'], 'total': len(issue['comments'])}
+        if fields:
+            values = dict((k, v) for k, v in values.items() if k in fields)
+        return {'id': issue['id'], 'key': issue['key'], 'self': "%s/rest/api/2/issue/%s" % (base, issue['id']),
+                'fields': values}
+
+    # serving
+
+    def start(self, port=0, host='127.0.0.1'):
+        """Serves on a background thread, and returns the server's URL."""
+        self.server = _Server((host, port), _Handler)
+        self.server.jira = self
+        thread = threading.Thread(target=self.server.serve_forever, args=(0.05,))
+        thread.daemon = True
+        thread.start()
+        return self.url
+
+    @property
+    def url(self):
+        return "http://%s:%s" % self.server.server_address
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def stats(self):
+        """Calls per endpoint, and the 50th and 99th percentile of the time
+        taken to answer them, in seconds."""
+        with self.lock:
+            durations = sorted(self.durations)
+            calls = dict(self.calls)
+        def pct(p):
+            return durations[min(len(durations) - 1, int(len(durations) * p))] if durations else 0
+        return {'calls': calls, 'total': sum(calls.values()), 'p50': pct(0.5), 'p99': pct(0.99)}
+
+    def reset_stats(self):
+        with self.lock:
+            self.calls.clear()
+            del self.durations[:]
+
+    def handle(self, method, path, query, body, base):
+        """Answers a request, as ``(endpoint, status, json)``."""
+        api = re.match(r'/rest/api/2/(.*)$', path)
+        agile = re.match(r'/rest/greenhopper/1.0/(.*)$', path)
+        route = api.group(1) if api else agile.group(1) if agile else None
+        if route is None:
+            raise NotFound(path)
+        for pattern, verb, endpoint in ROUTES[bool(agile)]:
+            m = re.match(pattern + '$', route)
+            if m and verb == method:
+                status, result = getattr(self, '_' + endpoint)(query, body, base, *m.groups())
+                return endpoint, status, result
+        raise NotFound(path)
+
+    def _server_info(self, query, body, base):
+        return 200, {'baseUrl': base, 'version': '6.4.0', 'versionNumbers': [6, 4, 0]}
+
+    def _fields(self, query, body, base):
+        return 200, [{'id': EPIC_LINK, 'name': 'Epic Link', 'custom': True},
+                     {'id': SPRINT, 'name': 'Sprint', 'custom': True}] + \
+            [{'id': name, 'name': name.capitalize(), 'custom': False}
+             for name in ('summary', 'status', 'assignee', 'reporter', 'description', 'issuetype',
+                          'fixVersions', 'resolution', 'updated', 'created')]
+
+    def _get_issue(self, query, body, base, key):
+        fields = query.get('fields')
+        fields = set(",".join(fields).split(",")) if fields else None
+        return 200, self.to_json(self.issue(key), base, fields)
+
+    def _update(self, query, body, base, key):
+        self._set(self.issue(key), body.get('fields') or {})
+        return 204, None
+
+    def _create(self, query, body, base):
+        key = self.add_issue(body.get('fields') or {})
+        return 201, {'id': self.issues[key]['id'], 'key': key, 'self': "%s/rest/api/2/issue/%s" % (base, key)}
+
+    def _bulk(self, query, body, base):
+        issues, errors = [], []
+        for i, update in enumerate(body.get('issueUpdates') or []):
+            try:
+                key = self.add_issue(update.get('fields') or {})
+            except BadRequest, e:
+                errors.append({'status': 400, 'failedElementNumber': i,
+                               'elementErrors': {'errorMessages': [], 'errors': e.args[0]}})
+            else:
+                issues.append({'id': self.issues[key]['id'], 'key': key,
+                               'self': "%s/rest/api/2/issue/%s" % (base, key)})
+        return 201, {'issues': issues, 'errors': errors}
+
+    def _comment(self, query, body, base, key):
+        issue = self.issue(key)
+        comment = {'id': str(len(issue['comments']) + 1), 'body': body.get('body')}
+        issue['comments'].append(comment)
+        self._touch(issue)
+        return 201, comment
+
+    def _transitions(self, query, body, base, key):
+        return 200, {'transitions': self.transitions(self.issue(key))}
+
+    def _transition(self, query, body, base, key):
+        issue = self.issue(key)
+        self.transition(issue, body['transition']['id'])
+        self._set(issue, body.get('fields') or {})
+        return 204, None
+
+    def _link_types(self, query, body, base):
+        return 200, {'issueLinkTypes': [{'id': str(i + 1), 'name': name, 'inward': inward, 'outward': outward}
+                                        for i, (name, inward, outward) in enumerate(LINK_TYPES)]}
+
+    def _link(self, query, body, base):
+        self.link(body['type']['name'], body['inwardIssue']['key'], body['outwardIssue']['key'])
+        return 201, None
+
+    def _search(self, query, body, base):
+        jql = query.get('jql', [''])[0]
+        start = int(query.get('startAt', [0])[0])
+        size = min(int(query.get('maxResults', [50])[0]), self.page_size)
+        fields = query.get('fields')
+        fields = set(f for f in ",".join(fields).split(",") if f) if fields else None
+        if fields and '*all' in fields:
+            fields = None
+        found = self.search(jql)
+        return 200, {'startAt': start, 'maxResults': size, 'total': len(found),
+                     'issues': [self.to_json(issue, base, fields) for issue in found[start:start + size]]}
+
+    def _epic(self, query, body, base, epic):
+        self.issue(epic)
+        for key in body.get('issueKeys') or []:
+            issue = self.issue(key)
+            issue['fields'][EPIC_LINK] = epic
+            self._touch(issue)
+        return 204, None
+
+    def _sprints(self, query, body, base, board):
+        if int(board) not in self.boards:
+            raise NotFound("No board %s" % board)
+        return 200, {'rapidViewId': int(board),
+                     'sprints': [dict((k, v) for k, v in self.sprints[i].items() if k != 'board')
+                                 for i in self.boards[int(board)]]}
+
+    def _rank(self, query, body, base):
+        sprint = body.get('sprintId')
+        if not body.get('addToBacklog') and sprint not in self.sprints:
+            raise BadRequest("No sprint %s" % sprint)
+        for key in body.get('idOrKeys') or []:
+            issue = self.issue(key)
+            issue['fields'][SPRINT] = None if body.get('addToBacklog') else [self.sprint_field(sprint)]
+            self._touch(issue)
+        return 204, None
+
+
+# (pattern, method, endpoint), for the REST API and for GreenHopper
+ROUTES = {False: [(r'serverInfo', 'GET', 'server_info'),
+                  (r'field', 'GET', 'fields'),
+                  (r'issue', 'POST', 'create'),
+                  (r'issue/bulk', 'POST', 'bulk'),
+                  (r'issue/([^/]+)', 'GET', 'get_issue'),
+                  (r'issue/([^/]+)', 'PUT', 'update'),
+                  (r'issue/([^/]+)/comment', 'POST', 'comment'),
+                  (r'issue/([^/]+)/transitions', 'GET', 'transitions'),
+                  (r'issue/([^/]+)/transitions', 'POST', 'transition'),
+                  (r'issueLinkType', 'GET', 'link_types'),
+                  (r'issueLink', 'POST', 'link'),
+                  (r'search', 'GET', 'search')],
+          True: [(r'epics/([^/]+)/add', 'PUT', 'epic'),
+                 (r'sprintquery/(\d+)', 'GET', 'sprints'),
+                 (r'sprint/rank', 'PUT', 'rank')]}
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # send each response whole, rather than wait on delayed acks of its parts
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def _serve(self):
+        jira = self.server.jira
+        started = time.time()
+        url = urlparse.urlparse(self.path)
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else ''
+        endpoint = 'unknown'
+        try:
+            body = json.loads(body) if body else {}
+            base = "http://%s" % self.headers.get('Host', "%s:%s" % self.server.server_address)
+            with jira.lock:
+                endpoint, status, result = jira.handle(self.command, url.path, urlparse.parse_qs(url.query),
+                                                       body, base)
+        except NotFound, e:
+            status, result = 404, {'errorMessages': [str(e)], 'errors': {}}
+        except (BadRequest, ValueError, KeyError, TypeError), e:
+            errors = e.args[0] if e.args and isinstance(e.args[0], dict) else {}
+            status, result = 400, {'errorMessages': [] if errors else [str(e)], 'errors': errors}
+        except Exception, e:
+            status, result = 500, {'errorMessages': [repr(e)], 'errors': {}}
+        delay = jira.latency.get(endpoint, jira.latency.get('default', 0))
+        if delay:
+            time.sleep(delay)
+        text = json.dumps(result) if result is not None else ''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json;charset=UTF-8')
+        self.send_header('Content-Length', str(len(text)))
+        self.end_headers()
+        self.wfile.write(text)
+        with jira.lock:
+            jira.calls[endpoint] += 1
+            jira.durations.append(time.time() - started)
+
+    do_GET = do_POST = do_PUT = do_DELETE = _serve
+
+    def log_message(self, *args):
+        pass
+
+
+def main():
+    from docopt import docopt
+    arguments = docopt(__doc__)
+    jira = FakeJira(latency=float(arguments['--latency']), page_size=int(arguments['--page-size']),
+                    boards={int(arguments['--board']): ['Sprint 1', 'Sprint 2', 'Sprint 3']})
+    print "Serving a fake JIRA at", jira.start(int(arguments['--port']), arguments['--host'])
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        jira.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,45 +1,258 @@
 import collections
+import contextlib
+import os
+import stat
+import tempfile
 import yaml
 
 
-class sdict(collections.OrderedDict):
+class sdict(dict):
     """A shadow data structure which maintains a copy of the original data
     in order, and maintains parent-hierarchy.
+
+    The dict itself is the session's view. The original data, ``real``, is
+    the ordered list of its keys, read through the dict, except where the
+    session has changed or removed a key without ``apply``/``rm``; those
+    keys keep their original value in a small overlay.
+
+    The session view iterates in the order of the original keys, followed
+    by the keys only the session has, ``_added``, in the order they were
+    set.
+
+    ``_span`` locates the node in the text it was loaded from, and ``_dirty``
+    records an ``apply``/``rm`` since; see :func:`patch`.
     """
-    def __init__(self, pairs, parent=None):
-        super(sdict, self).__init__(pairs)
-        self.real = collections.OrderedDict(pairs)
+    __slots__ = ('parent', '_keys', '_added', '_saved', '_span', '_dirty')
+
+    def __init__(self, pairs=(), parent=None):
+        pairs = list(pairs.items() if isinstance(pairs, dict) else pairs)
+        dict.__init__(self, pairs)
+        if len(self) == len(pairs):
+            self._keys = [k for k, _ in pairs]
+        else:
+            self._keys = list(collections.OrderedDict(pairs))
+        self._added = None
+        self._saved = None
+        self._span = None
+        self._dirty = False
         self.parent = parent
 
-    def __getitem__(self, key):
-        v = dict.__getitem__(self, key)
-        if isinstance(v, (sdict, slist)):
-            v.parent = self
-        return v
+    def _save(self, key):
+        """Keeps the original value of ``key`` before the session changes it."""
+        if (self._saved is None or key not in self._saved) and key in self._keys:
+            if self._saved is None:
+                self._saved = {}
+            self._saved[key] = dict.__getitem__(self, key)
+
+    def _discard(self, key):
+        if self._added and key in self._added:
+            self._added.remove(key)
+
+    def __setitem__(self, key, value):
+        self._save(key)
+        if isinstance(value, (sdict, slist)):
+            value.parent = self
+        if not dict.__contains__(self, key) and key not in self._keys:
+            if self._added is None:
+                self._added = []
+            self._added.append(key)
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        self._save(key)
+        dict.__delitem__(self, key)
+        self._discard(key)
+
+    def pop(self, key, *default):
+        if key in self:
+            self._save(key)
+            self._discard(key)
+        return dict.pop(self, key, *default)
+
+    def __iter__(self):
+        for key in self._keys:
+            if dict.__contains__(self, key):
+                yield key
+        for key in self._added or ():
+            yield key
+
+    iterkeys = __iter__
+
+    def keys(self):
+        return list(self)
+
+    def itervalues(self):
+        for key in self:
+            yield dict.__getitem__(self, key)
+
+    def values(self):
+        return list(self.itervalues())
+
+    def iteritems(self):
+        for key in self:
+            yield key, dict.__getitem__(self, key)
+
+    def items(self):
+        return list(self.iteritems())
+
+    def popitem(self):
+        for key in self:
+            return key, self.pop(key)
+        raise KeyError('popitem(): dictionary is empty')
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return dict.__getitem__(self, key)
+
+    def update(self, *args, **kwargs):
+        for key, value in sdict(*args).items() + kwargs.items():
+            self[key] = value
+
+    def clear(self):
+        for key in self.keys():
+            del self[key]
 
     def apply(self, key, value):
-        self.real[key] = self[key] = value
+        if isinstance(value, (sdict, slist)):
+            value.parent = self
+        dict.__setitem__(self, key, value)
+        if key not in self._keys:
+            self._keys.append(key)
+            self._discard(key)
+        if self._saved:
+            self._saved.pop(key, None)
+        self._dirty = True
 
     def rm(self, key):
-        del self[key]
-        del self.real[key]
+        dict.__delitem__(self, key)
+        if key not in self._keys:
+            raise KeyError(key)
+        self._keys.remove(key)
+        if self._saved:
+            self._saved.pop(key, None)
+        self._dirty = True
+
+    def real_items(self):
+        saved = self._saved or {}
+        for key in self._keys:
+            yield key, saved[key] if key in saved else dict.__getitem__(self, key)
+
+    @property
+    def real(self):
+        return collections.OrderedDict(self.real_items())
 
     def parentize(self):
-        for v in self.values():
+        for v in self.itervalues():
             if isinstance(v, (sdict, slist)):
                 v.parent = self
 
+    def copy(self):
+        d = sdict.__new__(sdict)
+        dict.update(d, self)
+        d._keys = list(self._keys)
+        d._added = list(self._added) if self._added else None
+        d._saved = dict(self._saved) if self._saved else None
+        d._span = None
+        d._dirty = True
+        d.parent = self.parent
+        return d
+
+    __copy__ = copy
+
+    def __reduce__(self):
+        return _restore_sdict, (dict(self), self._keys, self._saved, self._span, self._dirty, self._added)
+
+
+def _restore_sdict(data, keys, saved, span=None, dirty=False, added=None):
+    d = sdict.__new__(sdict)
+    dict.update(d, data)
+    d._keys = keys
+    d._added = added
+    d._saved = saved
+    d._span = span
+    d._dirty = dirty
+    d.parent = None
+    d.parentize()
+    return d
+
+
+def _changes(method):
+    def wrapper(self, *args):
+        self._dirty = True
+        self._positions = None
+        return method(self, *args)
+    wrapper.__name__ = method.__name__
+    return wrapper
+
 
 class slist(list):
+    """A list which knows its parent. ``_positions`` indexes the children by
+    identity, and is rebuilt on the first lookup after a change."""
+    __slots__ = ('parent', '_span', '_dirty', '_positions')
+
     def __init__(self, *args):
         super(slist, self).__init__(*args)
         self.parent = None
+        self._span = None
+        self._dirty = False
+        self._positions = None
 
     def parentize(self):
         for v in self:
             if isinstance(v, (sdict, slist)):
                 v.parent = self
 
+    def position(self, child):
+        """The position of ``child`` itself, not of an equal value; like
+        ``index``, without scanning the list on each call."""
+        if self._positions is None:
+            positions = {}
+            for i in xrange(len(self) - 1, -1, -1):
+                positions[id(self[i])] = i
+            self._positions = positions
+        try:
+            return self._positions[id(child)]
+        except KeyError:
+            raise ValueError("%r is not in list" % (child,))
+
+    def splice(self, edits):
+        """Replaces ``self[start:stop]`` with ``values`` for each ``(start,
+        stop, values)`` of ``edits``, in one pass over the list. Positions are
+        those before any edit, and the ranges must not overlap; values
+        inserted at the same position keep the order of ``edits``."""
+        out = []
+        pos = 0
+        for start, stop, values in sorted(edits, key=lambda edit: (edit[0], edit[1])):
+            start = min(start, len(self))
+            stop = min(max(stop, start), len(self))
+            if start < pos:
+                raise ValueError("Overlapping edits at %d" % start)
+            out.extend(list.__getslice__(self, pos, start))
+            for v in values:
+                if isinstance(v, (sdict, slist)):
+                    v.parent = self
+                out.append(v)
+            pos = stop
+        out.extend(list.__getslice__(self, pos, len(self)))
+        self[:] = out
+
+    def __reduce__(self):
+        return _restore_slist, (list(self), self._span, self._dirty)
+
+
+for _name in ('__setitem__', '__delitem__', '__setslice__', '__delslice__', '__iadd__',
+              '__imul__', 'append', 'extend', 'insert', 'pop', 'remove', 'reverse', 'sort'):
+    setattr(slist, _name, _changes(getattr(list, _name)))
+
+
+def _restore_slist(data, span=None, dirty=False):
+    l = slist(data)
+    l._span = span
+    l._dirty = dirty
+    l.parentize()
+    return l
+
 # from:
 # http://stackoverflow.com/questions/5121931/in-python-how-can-you-load-yaml-mappings-as-ordereddicts
 _mapping_tag = yaml.resolver.BaseResolver.DEFAULT_MAPPING_TAG
@@ -47,11 +260,23 @@ _seq_tag = yaml.resolver.BaseResolver.DEFAULT_SEQUENCE_TAG
 
 
 def sdict_representer(dumper, data):
-    return dumper.represent_mapping(_mapping_tag, data.real.iteritems())
+    return dumper.represent_mapping(_mapping_tag, data.real_items())
+
+
+def _node_end(node):
+    if isinstance(node, yaml.ScalarNode) or node.flow_style or not node.value:
+        return node.end_mark.index
+    last = node.value[-1]
+    return _node_end(last[1] if isinstance(node, yaml.MappingNode) else last)
+
+
+def _span(node):
+    return (node.start_mark.index, _node_end(node), node.start_mark.column, bool(node.flow_style))
 
 
 def sdict_constructor(loader, node):
     d = sdict(loader.construct_pairs(node))
+    d._span = _span(node)
     d.parentize()
     return d
 
@@ -62,14 +287,153 @@ def slist_representer(dumper, data):
 
 def slist_constructor(loader, node):
     l = slist(loader.construct_sequence(node))
+    l._span = _span(node)
     l.parentize()
     return l
 
 
-yaml.add_representer(sdict, sdict_representer)
-yaml.add_representer(slist, slist_representer)
-yaml.add_constructor(_mapping_tag, sdict_constructor)
-yaml.add_constructor(_seq_tag, slist_constructor)
+# libyaml's parser and emitter, when PyYAML was built with them, with the
+# same constructors and representers as the pure-Python backend.
+PureLoader, PureDumper = yaml.Loader, yaml.Dumper
+Loader = getattr(yaml, 'CLoader', PureLoader)
+Dumper = getattr(yaml, 'CDumper', PureDumper)
+
+for _loader in set([PureLoader, Loader]):
+    _loader.add_constructor(_mapping_tag, sdict_constructor)
+    _loader.add_constructor(_seq_tag, slist_constructor)
+for _dumper in set([PureDumper, Dumper]):
+    _dumper.add_representer(sdict, sdict_representer)
+    _dumper.add_representer(slist, slist_representer)
+
+
+def load(stream, Loader=Loader):
+    return yaml.load(stream, Loader=Loader)
+
+
+def dump(data, stream=None, Dumper=Dumper, **kwds):
+    return yaml.dump(data, stream, Dumper=Dumper, **kwds)
+
+
+def patch(source, data, **kwds):
+    """Rewrites ``source``, the text ``data`` was loaded from, re-emitting
+    only the nodes which changed, so that formatting and comments elsewhere
+    are kept. Returns None when the changes cannot be confined to spans of
+    the source, e.g. when the top-level list itself changed.
+    """
+    edits = _edits(data, source, kwds)
+    if edits is None:
+        return None
+    out = []
+    pos = 0
+    for start, end, text in sorted(edits):
+        out.append(source[pos:start])
+        out.append(text)
+        pos = end
+    out.append(source[pos:])
+    return u"".join(out)
+
+
+def _edits(node, source, kwds):
+    """The edits which write out the changes under ``node``, or None when
+    the node has to be re-emitted as a whole."""
+    if node._span is None or node._dirty:
+        return None
+    edits = []
+    children = (v for _, v in node.real_items()) if isinstance(node, sdict) else node
+    for child in children:
+        if not isinstance(child, (sdict, slist)):
+            continue
+        child_edits = _edits(child, source, kwds)
+        if child_edits is not None:
+            edits.extend(child_edits)
+        elif child._span is None or (not child and not child._span[3]):
+            # a new node, or a block node which would become an inline {} or []
+            return None
+        else:
+            edits.append(_emit(child, source, kwds))
+    return edits
+
+
+def _emit(node, source, kwds):
+    start, end, column, flow = node._span
+    # block scalars end after their line breaks
+    while end > start and source[end - 1] in u" \t\r\n":
+        end -= 1
+    # a comment after the node on its last line belongs to that line
+    eol = source.find(u"\n", end)
+    eol = len(source) if eol == -1 else eol
+    if source[end:eol].strip().startswith(u"#"):
+        end = eol
+    kwds = dict(kwds, default_flow_style=flow, encoding=None)
+    lines = dump(node, **kwds).rstrip().split(u"\n")
+    indent = u" " * column
+    lines = lines[:1] + [indent + line if line else line for line in lines[1:]]
+    # the comments of the lines which are written out unchanged are kept
+    comments = {}
+    for line in source[start:end].split(u"\n"):
+        content, comment = _split_comment(line)
+        if comment:
+            comments.setdefault(content.strip(), []).append(comment)
+    for i, line in enumerate(lines):
+        if comments.get(line.strip()):
+            lines[i] = line.rstrip() + comments[line.strip()].pop(0)
+    return start, end, u"\n".join(lines)
+
+
+def _split_comment(line):
+    """``line`` as its content and its comment, with the whitespace before
+    the comment; a ``#`` in a quoted scalar does not start one."""
+    quote = None
+    for i, c in enumerate(line):
+        if quote:
+            if c == quote:
+                quote = None
+        elif c in u"\"'" and (i == 0 or line[i - 1] in u" \t[{,"):
+            quote = c
+        elif c == u"#" and (i == 0 or line[i - 1] in u" \t"):
+            content = line[:i].rstrip()
+            return content, line[len(content):]
+    return line, u""
+
+
+@contextlib.contextmanager
+def atomic_open(path):
+    """Opens a temporary file next to ``path`` for writing, and renames it
+    over ``path`` once the block is done, so that readers never see a
+    partial write and an error leaves ``path`` as it was. A symlink is
+    followed, and the file it points to replaced; a ``path`` which is not
+    a regular file, such as /dev/stdout, is written to directly."""
+    if os.path.exists(path) and not os.path.isfile(path):
+        # e.g. /dev/stdout, which realpath would turn into a pipe's name
+        with open(path, "w") as f:
+            yield f
+        return
+    path = os.path.realpath(path)
+    head, tail = os.path.split(path)
+    # a name of its own, as jyd and jywriter may write the same document
+    fd, tmp = tempfile.mkstemp(prefix=".%s." % tail, suffix=".tmp", dir=head)
+    try:
+        with os.fdopen(fd, "w") as f:
+            yield f
+        if os.path.exists(path):
+            mode = os.stat(path).st_mode & 07777
+        else:
+            umask = os.umask(0)
+            os.umask(umask)
+            mode = 0666 & ~umask
+        os.chmod(tmp, mode)
+        os.rename(tmp, path)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
 
-load = yaml.load
-dump = yaml.dump
+def atomic_write(path, text):
+    """Replaces the file at ``path`` with ``text``; see atomic_open.
+    Returns the stat of the file written, or None when ``path`` is not a
+    regular file."""
+    with atomic_open(path) as f:
+        f.write(text)
+        f.flush()
+        st = os.fstat(f.fileno())
+    return st if stat.S_ISREG(st.st_mode) else None
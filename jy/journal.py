@@ -0,0 +1,169 @@
+from jy.ioutil import sdict
+import hashlib
+import json
+import os
+import sys
+import threading
+
+
+def _native(value):
+    """Undoes json's decoding of every string as unicode, which would
+    otherwise be written out as !!python/unicode."""
+    if isinstance(value, unicode):
+        try:
+            return str(value)
+        except UnicodeEncodeError:
+            return value
+    return value
+
+
+def _fingerprint(item):
+    """Hashes the scalar fields of an item; nested lists and mappings are
+    left out, so that edits to them do not lose the item."""
+    fields = sorted((k, v) for k, v in item.real_items() if not isinstance(v, (dict, list)))
+    return hashlib.md5(json.dumps(fields, default=str)).hexdigest()
+
+
+class Journal(object):
+    """An append-only record of the changes made to JIRA during a run.
+
+    Each change is flushed to disk as soon as it is made, so that when a run
+    dies before the document is written, the next run can replay the changes
+    into the document instead of making them again. Items are identified by
+    their path in the document as loaded, e.g. ``3/items/0``, and by a
+    fingerprint of their fields, by which they are found again in a
+    document edited since. Without a ``path`` nothing is written, but
+    changes are still tracked.
+    """
+    def __init__(self, path=None):
+        self.path = path
+        self.lock = threading.Lock()
+        self.paths = {}
+        self.items = {}
+        # path -> fingerprint of the item as loaded
+        self.fingerprints = {}
+        self.completed = set()
+        self.f = None
+
+    @classmethod
+    def beside(cls, path):
+        head, tail = os.path.split(os.path.abspath(path))
+        return cls(os.path.join(head, ".%s.jyjournal" % tail))
+
+    def start(self, source, items, err=None):
+        """Indexes the document, replays any journal left by a run of the
+        same source, and opens the journal for appending. Returns the number
+        of changes replayed.
+
+        The changes of a journal left by a run of an earlier version of the
+        document are replayed into the items they were made for, found by
+        their fingerprints, and the journal rewritten for this version. If
+        an item cannot be found, e.g. because it was edited too, nothing is
+        replayed, the journal is kept, and RuntimeError is raised: running
+        the document would make the changes again. Both are reported to
+        ``err``, stderr by default.
+        """
+        err = err or sys.stderr
+        self._index(items, "")
+        digest = hashlib.md5(source.encode('utf-8')).hexdigest()
+        replayed = 0
+        if self.path and os.path.exists(self.path):
+            with open(self.path) as f:
+                entries = [json.loads(line) for line in f if line.endswith("\n")]
+            if entries[1:] and entries[0].get('source') != digest:
+                entries[1:] = self._match(entries[1:], err)
+                print >> err, "Matched", len(entries) - 1, "changes in", self.path, \
+                    "to the edited document"
+                entries[0] = {'source': digest}
+                tmp = "%s.tmp" % self.path
+                with open(tmp, "w") as f:
+                    f.writelines(json.dumps(entry) + "\n" for entry in entries)
+                os.rename(tmp, self.path)
+            for entry in entries[1:]:
+                self._replay(entry)
+                replayed += 1
+            if not entries[1:]:
+                os.remove(self.path)
+        if self.path:
+            fresh = not os.path.exists(self.path)
+            self.f = open(self.path, "a")
+            if fresh:
+                self._write({'source': digest})
+        return replayed
+
+    def _match(self, entries, err):
+        """``entries`` with the paths of their items in this document."""
+        by_fingerprint = {}
+        for path, fingerprint in self.fingerprints.items():
+            by_fingerprint.setdefault(fingerprint, []).append(path)
+        matched, unmatched = [], []
+        for entry in entries:
+            fingerprint = entry.get('fingerprint')
+            if fingerprint is not None and self.fingerprints.get(entry['item']) == fingerprint:
+                path = entry['item']
+            elif len(by_fingerprint.get(fingerprint, [])) == 1:
+                path = by_fingerprint[fingerprint][0]
+            else:
+                unmatched.append(entry)
+                continue
+            matched.append(dict(entry, item=path))
+        if unmatched:
+            for entry in unmatched:
+                print >> err, "  %(item)s: %(op)s" % entry, entry.get('apply') or ""
+            raise RuntimeError("%s holds %d changes made by an interrupted run to items since edited or "
+                               "removed, listed above; copy them into the document, e.g. the keys of "
+                               "created issues, and remove the journal to run it" % (self.path, len(unmatched)))
+        return matched
+
+    def _index(self, node, path):
+        if isinstance(node, sdict):
+            self.paths[id(node)] = path
+            self.items[path] = node
+            self.fingerprints[path] = _fingerprint(node)
+            children = node.iteritems()
+        elif isinstance(node, list):
+            children = enumerate(node)
+        else:
+            return
+        for k, child in children:
+            self._index(child, "%s/%s" % (path, k) if path else str(k))
+
+    def _write(self, entry):
+        self.f.write(json.dumps(entry) + "\n")
+        self.f.flush()
+        os.fsync(self.f.fileno())
+
+    def record(self, item, op, rm=None, apply=None, session=None):
+        """Records that ``op`` was carried out for ``item``, along with the
+        changes it made to the item: the key it removed, and the values it
+        applied or set for the session."""
+        path = self.paths.get(id(item))
+        with self.lock:
+            self.completed.add((id(item), op))
+            if self.f is not None and path is not None:
+                self._write(dict(item=path, fingerprint=self.fingerprints[path], op=op, rm=rm, apply=apply,
+                                 session=session))
+
+    def done(self, item, op):
+        return (id(item), op) in self.completed
+
+    def _replay(self, entry):
+        item = self.items.get(entry['item'])
+        if item is None:
+            return
+        self.completed.add((id(item), entry['op']))
+        if entry.get('rm') in item:
+            item.rm(entry['rm'])
+        for k, v in (entry.get('apply') or {}).items():
+            item.apply(str(k), _native(v))
+        for k, v in (entry.get('session') or {}).items():
+            item[str(k)] = _native(v)
+
+    def close(self, keep=False):
+        """Closes the journal, and removes it unless ``keep`` is set: once
+        the document has been written, there is nothing left to resume."""
+        if self.f is not None:
+            self.f.close()
+            self.f = None
+            if not keep:
+                os.remove(self.path)
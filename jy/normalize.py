@@ -0,0 +1,76 @@
+_keep = object()
+
+
+def dictify(dkey, value):
+    if isinstance(value, basestring):
+        return {dkey: value}
+    return value
+
+
+def listify(dkey, value):
+    if not isinstance(value, list):
+        value = [value]
+    return [{dkey: el} if isinstance(el, basestring) else el for el in value]
+
+
+class Plan(object):
+    """The field mappings of a context compiled into one rewrite step per
+    key, so that normalizing an item is a single pass over its keys, however
+    many aliases and rules are in scope.
+
+    A key's user alias is resolved first, then its objectify rule, then it
+    is renamed to its alias; keys whose final name is ignored are dropped.
+    Keys without a step are kept as they are.
+    """
+    def __init__(self, user_fields, user_aliases, objectified, aliases, ignored):
+        self.steps = {}
+        for k in set(user_fields) | set(objectified) | set(aliases) | set(ignored):
+            target = aliases.get(k, k)
+            if target in ignored:
+                self.steps[k] = None
+                continue
+            users = dict(user_aliases) if k in user_fields and user_aliases else None
+            self.steps[k] = (users, objectified.get(k), target)
+        # the keys which end up as each renamed field, e.g. issuetype
+        self.sources = {}
+        for k, step in self.steps.items():
+            if step is not None:
+                self.sources.setdefault(step[2], []).append(k)
+        for keys in self.sources.values():
+            # as in __call__, aliased values win over the field itself
+            keys.sort(key=lambda k: k in aliases)
+
+    def value(self, k, v):
+        """The value of key ``k`` once normalized."""
+        users, rule, _ = self.steps[k]
+        if users is not None and isinstance(v, basestring) and v in users:
+            v = users[v]
+        if rule is not None:
+            v = rule(v)
+        return v
+
+    def field(self, item, name):
+        """The normalized value of the field ``name`` of ``item``, without
+        normalizing the rest of it."""
+        value = item.get(name) if name not in self.steps else None
+        for k in self.sources.get(name, ()):
+            if k in item:
+                value = self.value(k, item[k])
+        return value
+
+    def __call__(self, item):
+        out = {}
+        renamed = []
+        for k, v in item.iteritems():
+            step = self.steps.get(k, _keep)
+            if step is _keep:
+                out[k] = v
+            elif step is not None:
+                v = self.value(k, v)
+                if step[2] == k:
+                    out[k] = v
+                else:
+                    renamed.append((step[2], v))
+        # aliased values replace any field of the same name
+        out.update(renamed)
+        return out
@@ -0,0 +1,64 @@
+"""The transformers a run applies: the built-in ones listed in
+jy.transformers.BUILTINS, and those other packages provide under the
+``jy.transformers`` entry point group, e.g. in their setup.py::
+
+    entry_points={'jy.transformers': ['estimate = jy_estimate:Estimate']}
+
+Entry points are found through pkg_resources, so installed, develop and
+zipped eggs are all seen. It is only imported on first use, as its import
+alone takes longer than the rest of jywriter's startup.
+"""
+import sys
+import threading
+
+GROUP = 'jy.transformers'
+
+_lock = threading.RLock()
+_registry = []
+_loaded = []
+
+
+def entry_points(group, name=None, working_set=None):
+    """The pkg_resources entry points of ``group``, or only those called
+    ``name``, of the distributions in ``working_set`` (by default, those
+    on ``sys.path``)."""
+    if working_set is None:
+        import pkg_resources
+        working_set = pkg_resources.working_set
+    return list(working_set.iter_entry_points(group, name))
+
+
+def register(cls):
+    """Adds ``cls`` to the transformers applied, if it is not already."""
+    from jy.transformers import Transformer
+    if not isinstance(cls, type) or not issubclass(cls, Transformer):
+        raise TypeError("%r is not a Transformer" % (cls,))
+    with _lock:
+        if cls not in _registry:
+            _registry.append(cls)
+    return cls
+
+
+def load(working_set=None):
+    """Registers the built-in transformers and those of the entry points,
+    once. An entry point which cannot be loaded is reported and skipped."""
+    if _loaded:
+        return
+    with _lock:
+        if _loaded:
+            return
+        from jy.transformers import BUILTINS
+        for cls in BUILTINS:
+            register(cls)
+        for entry in entry_points(GROUP, working_set=working_set):
+            try:
+                register(entry.resolve())
+            except Exception, e:
+                print >> sys.stderr, "Could not load transformer %s: %s" % (entry, e)
+        _loaded.append(True)
+
+
+def transformers():
+    """The transformer classes to apply."""
+    load()
+    return _registry
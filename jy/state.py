@@ -0,0 +1,134 @@
+from jy.ioutil import sdict
+import hashlib
+import json
+import os
+
+
+def plain(value):
+    """The persisted form of a document value, as plain dicts and lists."""
+    if isinstance(value, sdict):
+        return dict((k, plain(v)) for k, v in value.real_items())
+    if isinstance(value, (list, tuple)):
+        return [plain(v) for v in value]
+    if isinstance(value, dict):
+        return dict((k, plain(v)) for k, v in value.items())
+    return value
+
+
+def content_hash(value):
+    return hashlib.md5(json.dumps(plain(value), sort_keys=True, default=str)).hexdigest()
+
+
+def item_hash(item):
+    """Hashes an item as it is written out, less its nested ``items``, which
+    are hashed on their own."""
+    return content_hash(dict((k, v) for k, v in item.real_items() if k != 'items'))
+
+
+def walk(items):
+    """Yields each item in a document, depth first."""
+    for item in items:
+        if isinstance(item, sdict):
+            yield item
+            for child in walk(item.get('items') or []):
+                yield child
+
+
+def identities(items, parent="", seen=None):
+    """Yields ``(identity, item)`` for each item in a document, depth first.
+    An item is identified by its key, numbered from its second appearance
+    on, or otherwise by its position under the item it is nested in."""
+    seen = {} if seen is None else seen
+    for i, item in enumerate(items):
+        if not isinstance(item, sdict):
+            continue
+        key = item.get('key')
+        if key:
+            n = seen[key] = seen.get(key, 0) + 1
+            identity = key if n == 1 else "%s#%d" % (key, n)
+        else:
+            identity = "%s/%d" % (parent, i)
+        yield identity, item
+        for pair in identities(item.get('items') or [], identity, seen):
+            yield pair
+
+
+class DocumentState(object):
+    """State kept between runs in a sidecar file next to the document.
+    Without a ``path``, e.g. under --test, it is kept in memory only."""
+    def __init__(self, path=None):
+        self.path = None
+        self.data = {}
+        if path is None:
+            return
+        head, tail = os.path.split(os.path.abspath(path))
+        self.path = os.path.join(head, ".%s.jystate" % tail)
+        if os.path.exists(self.path):
+            try:
+                with open(self.path) as f:
+                    self.data = json.load(f)
+            except ValueError:
+                pass
+
+    def save(self):
+        if self.path is None:
+            return
+        tmp = "%s.tmp" % self.path
+        with open(tmp, "w") as f:
+            json.dump(self.data, f)
+        os.rename(tmp, self.path)
+
+
+class Incremental(object):
+    """Decides which items changed since the last run.
+
+    An item is changed if its content hash differs from the one recorded
+    for its identity (see :func:`identities`) after the last run, or if it
+    links to a changed item. A changed manifest also changes the items it
+    scopes; see ApplyTransformers.
+    """
+    def __init__(self, state, items, conf=None):
+        self.state = state
+        self.conf = content_hash(conf)
+        previous = {}
+        if state.data.get('conf') == self.conf and isinstance(state.data.get('items'), dict):
+            previous = state.data['items']
+        # id(item) -> (identity, hash)
+        self.hashes = dict((id(item), (identity, item_hash(item))) for identity, item in identities(items))
+        self.previous = previous
+        self.changed_keys = set(item['key'] for item in walk(items)
+                                if item.get('key') and self._changed(item))
+        self.skipped = 0
+
+    def _changed(self, item):
+        identity, hash_ = self.hashes[id(item)]
+        return self.previous.get(identity) != hash_
+
+    def changed(self, item):
+        if not isinstance(item, sdict):
+            return True
+        if id(item) not in self.hashes or self._changed(item):
+            return True
+        for link in item.get('links') or []:
+            keys = link.keys() if isinstance(link, dict) else [link]
+            if self.changed_keys.intersection(keys):
+                return True
+        return False
+
+    def record(self, items):
+        """Stores the hashes of the items as they are after the run, less
+        those of the items left pending, which the next run tries again."""
+        self.state.data['conf'] = self.conf
+        self.state.data['items'] = dict((identity, item_hash(item)) for identity, item in identities(items)
+                                        if not pending(item))
+        self.state.save()
+
+
+def pending(item):
+    """Whether an item has work left for the next run: an action key, such
+    as ``+sprint`` or ``+epic`` left by a failed assignment, or an issue
+    which was not created."""
+    from jy.transformers import NewIssue
+    if any(isinstance(k, basestring) and k.startswith('+') for k, _ in item.real_items()):
+        return True
+    return 'key' not in item and any(k in item for k in ['summary'] + NewIssue.issuetypes[:-1])
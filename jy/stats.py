@@ -0,0 +1,155 @@
+import contextlib
+import json
+import re
+import sys
+import threading
+import time
+
+# upper bounds of the latency histogram's buckets, in seconds
+BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5, 10, 30, float('inf'))
+
+
+class Entry(object):
+    __slots__ = ('calls', 'seconds', 'bytes', 'histogram')
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.bytes = 0
+        self.histogram = [0] * len(BUCKETS)
+
+    def percentile(self, p):
+        """The upper bound of the bucket holding the ``p``th percentile."""
+        rank = self.calls * p
+        seen = 0
+        for bound, count in zip(BUCKETS, self.histogram):
+            seen += count
+            if seen >= rank and count:
+                return bound
+        return 0
+
+    def as_json(self):
+        return {'calls': self.calls, 'seconds': self.seconds, 'bytes': self.bytes,
+                'p50': self.percentile(0.5), 'p99': self.percentile(0.99),
+                'histogram': dict(("%g" % b, c) for b, c in zip(BUCKETS, self.histogram) if c)}
+
+
+class Stats(object):
+    """Call counts, wall time, bytes and latency histograms of a run,
+    grouped by what was called: ``yaml`` phases, ``transformer`` classes,
+    ``context`` and ``jira`` methods, and ``http`` endpoints.
+
+    Nothing is measured unless :meth:`instrument` was called; times are
+    inclusive, e.g. ApplyTransformers includes the items nested under it.
+    """
+    context_methods = ('issue_fields', 'create_issue_from_item', 'create_subtask_from_item',
+                       'compute_defaults', '_normalize')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = {}
+        # ids of the clients measured already
+        self.clients = set()
+        self.started = time.time()
+
+    def record(self, group, name, seconds, nbytes=0):
+        i = 0
+        while seconds > BUCKETS[i]:
+            i += 1
+        with self.lock:
+            entry = self.entries.get((group, name))
+            if entry is None:
+                entry = self.entries[(group, name)] = Entry()
+            entry.calls += 1
+            entry.seconds += seconds
+            entry.bytes += nbytes
+            entry.histogram[i] += 1
+
+    @contextlib.contextmanager
+    def timed(self, group, name):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.record(group, name, time.time() - start)
+
+    def wrap(self, fn, group, name):
+        def timed(*args, **kwargs):
+            start = time.time()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.record(group, name, time.time() - start)
+        return timed
+
+    def instrument_class(self, obj, group, names):
+        """Times the methods ``names`` of ``obj`` by moving it to a subclass
+        of its class, which copies of it share."""
+        cls = type(obj)
+        methods = dict((name, self.wrap(getattr(cls, name).__func__, group, name)) for name in names)
+        obj.__class__ = type(cls.__name__, (cls,), methods)
+
+    def instrument(self, context):
+        """Measures ``context``, and its client and the client's session
+        unless a context sharing them was measured before."""
+        import inspect
+        context.stats = self
+        self.instrument_class(context, 'context', self.context_methods)
+        jira = context.jira
+        if id(jira) in self.clients:
+            return
+        self.clients.add(id(jira))
+        self.instrument_class(jira, 'jira', [name for name in dir(type(jira)) if not name.startswith('_')
+                                             and inspect.ismethod(getattr(type(jira), name))
+                                             and getattr(type(jira), name).im_self is None])
+        hooks = getattr(getattr(jira, '_session', None), 'hooks', None)
+        if isinstance(hooks, dict):
+            hooks.setdefault('response', []).append(self._on_response)
+
+    def _on_response(self, response, *args, **kwargs):
+        request = response.request
+        sent = len(request.body or '') if isinstance(request.body, basestring) else 0
+        self.record('http', "%s %s" % (request.method, endpoint(request.url)),
+                    response.elapsed.total_seconds(), sent + len(response.content or ''))
+
+    def as_json(self):
+        report = {'seconds': time.time() - self.started}
+        with self.lock:
+            for (group, name), entry in self.entries.items():
+                report.setdefault(group, {})[name] = entry.as_json()
+        return report
+
+    def report(self, out=sys.stderr):
+        print >> out, "%-52s %8s %10s %9s %9s %9s %10s" % (
+            "", "calls", "total (s)", "mean (ms)", "p50 (ms)", "p99 (ms)", "bytes")
+        with self.lock:
+            entries = sorted(self.entries.items(), key=lambda (k, e): (k[0], -e.seconds))
+        for (group, name), e in entries:
+            print >> out, "%-52s %8d %10.3f %9.2f %9s %9s %10s" % (
+                ("%s %s" % (group, name))[:52], e.calls, e.seconds, e.seconds / e.calls * 1e3,
+                "%g" % (e.percentile(0.5) * 1e3), "%g" % (e.percentile(0.99) * 1e3), e.bytes or "")
+        print >> out, "total %.3fs" % (time.time() - self.started)
+
+    def write_json(self, path):
+        with open(path, "w") as f:
+            json.dump(self.as_json(), f, indent=2, sort_keys=True)
+
+
+def endpoint(url):
+    """The REST path of ``url``, with keys and ids replaced, e.g.
+    ``/rest/api/2/issue/{key}/transitions``."""
+    path = re.sub(r'^[a-z]+://[^/]+', '', url).split('?')[0]
+    # the API's own version, e.g. /rest/api/2, is kept
+    base, path = re.match(r'(/rest/[^/]+/[^/]+)?(.*)$', path).groups()
+    path = re.sub(r'/[A-Z][A-Z0-9_]*-\d+(?=/|$)', '/{key}', path)
+    return (base or '') + re.sub(r'/\d+(?=/|$)', '/{id}', path)
+
+
+@contextlib.contextmanager
+def _untimed():
+    yield
+
+
+def timed(stats, group, name):
+    """``stats.timed(group, name)``, or nothing without stats."""
+    return stats.timed(group, name) if stats is not None else _untimed()
@@ -1,7 +1,14 @@
 from collections import OrderedDict
-from jira.utils import raise_on_error
+from jira.utils import JIRAError, raise_on_error
+from jy import registry
 from jy.ioutil import slist, sdict
+from jy.workflow import Workflow
+import heapq
+import itertools
 import json
+import re
+import threading
+import time
 import urlparse
 
 
@@ -12,31 +19,21 @@ def safe_str(s):
         return s
 
 
-class TransformerMetaClass(type):
-    # Metaprogramming/RegisterLeafClasses.py
-
-    def __init__(cls, name, bases, nmspc):
-        super(TransformerMetaClass, cls).__init__(name, bases, nmspc)
-        if not hasattr(cls, 'registry'):
-            cls.registry = set()
-        cls.registry.add(cls)
-        cls.registry -= set(bases) # Remove base classes
-    # Metamethods, called on class objects:
-
-    def __iter__(cls): #@NoSelf
-        return iter(cls.registry)
-
-    def __str__(cls): #@NoSelf
-        if cls in cls.registry:
-            return cls.__name__
-        return cls.__name__ + ": " + ", ".join([sc.__name__ for sc in cls])
-
-
 class Transformer(object):
-    __metaclass__ = TransformerMetaClass
-
     priority = 100
     ignored = []
+    # whether this transformer runs in the planning pass used by bulk creation
+    planning = False
+    # whether this transformer runs while walking the document when items
+    # are executed in parallel; inline transformers must not call JIRA.
+    inline = False
+    # the keys which an item needs for this transformer to act on it; None
+    # runs it on every item. See Dispatch.
+    triggers = None
+    # whether this transformer reads what the items before it change in
+    # JIRA, e.g. with a search, and so waits for all of their work when
+    # items are executed in parallel.
+    barrier = False
 
     def __init__(self, ctx):
         self.ctx = ctx
@@ -44,11 +41,19 @@ class Transformer(object):
     def __call__(self, item):
         pass
 
+    @classmethod
+    def trigger_keys(cls):
+        return cls.triggers
+
 
 class KeyTransformer(Transformer):
     """Base class for transformers which operate on a one or more keys."""
     keys = []
 
+    @classmethod
+    def trigger_keys(cls):
+        return cls.keys if cls.triggers is None else cls.triggers
+
     def __call__(self, item):
         for k in self.keys:
             if k in item:
@@ -56,44 +61,292 @@ class KeyTransformer(Transformer):
 
 
 class ApplyTransformers(Transformer):
+    """Runs every transformer over each item in a list.
+
+    With an executor on the context, only the ``inline`` transformers run
+    while walking the document; the rest of each item's work is scheduled
+    as a task against a snapshot of the context, after the task of the item
+    which contains it.
+    """
     priority = 10 ** 10
-    ignored = ['items']
+    ignored = triggers = ['items']
+    planning = inline = True
+    # (registry size, transformer classes by priority)
+    ordered = None
+
+    @classmethod
+    def classes(cls):
+        registered = registry.transformers()
+        if cls.ordered is None or cls.ordered[0] != len(registered):
+            cls.ordered = (len(registered), sorted(registered, key=lambda x: x.priority))
+        return cls.ordered[1]
 
     def __call__(self, item):
         if isinstance(item, list):
             items = item
         else:
             items = item.get('items', [])
+        # the document itself, rather than an item's nested items
+        top = isinstance(item, list) and self.ctx.task is None
 
-        transformers = [t(self.ctx) for t in sorted(Transformer, key=lambda x: x.priority)]
+        transformers = Dispatch([t(self.ctx) for t in self.classes()
+                                 if t.planning or not self.ctx.planning])
         original_manifest = list(self.ctx.manifests)
+        original_scope = self.ctx.scope_changed
+        executor = None if self.ctx.planning else self.ctx.executor
+        incremental = self.ctx.incremental
+        # only the manifests and nested items of an unchanged item are visited
+        unchanged = transformers.select(lambda t: isinstance(t, (NewManifest, ApplyTransformers)))
         for item in items[:]:
-            for t in transformers:
-                try:
+            run = transformers
+            if incremental is not None:
+                if self.ctx.scope_changed or incremental.changed(item):
+                    # a changed manifest changes everything it scopes
+                    if isinstance(item, dict) and any(k in item for k in NewManifest.keys):
+                        self.ctx.scope_changed = True
+                else:
+                    if not self.ctx.planning:
+                        incremental.skipped += 1
+                    run = unchanged
+            if executor is None:
+                self.apply(run, item)
+            elif not executor.failed:
+                self.schedule(executor, run, item)
+        self.ctx.restore_manifests(original_manifest)
+        self.ctx.scope_changed = original_scope
+        if executor is not None and self.ctx.task is None:
+            executor.wait()
+        if top and not self.ctx.planning:
+            self.ctx.linked.flush()
+            self.ctx.memberships.flush()
+
+    @staticmethod
+    def apply(transformers, item):
+        """Returns False if a transformer stopped the item."""
+        return transformers(item)
+
+    def schedule(self, executor, transformers, item):
+        # the item's own work sees the context as it is before the item
+        # changes it, e.g. with a manifest.
+        inline, rest = transformers.split()
+        work = rest.bind(self.ctx.fork())
+        parent, task = self.ctx.task, executor.task(self.apply, work, item, after=self.ctx.task,
+                                                   barrier=rest.barrier(item))
+        self.ctx.task = task
+        try:
+            complete = self.apply(inline, item)
+        finally:
+            self.ctx.task = parent
+        if complete:
+            executor.start(task)
+        else:
+            executor.cancel(task)
+
+
+class Dispatch(object):
+    """The transformers of a pass, indexed by the keys which trigger them, so
+    that each item only visits the transformers its keys call for, in order
+    of priority. Keys an item gains along the way, e.g. ``created``, bring in
+    the transformers they trigger. Items which are not mappings visit every
+    transformer. The index is built once for each list of classes.
+    """
+    indexes = {}
+
+    def __init__(self, transformers):
+        self.transformers = list(transformers)
+        classes = tuple(type(t) for t in self.transformers)
+        index = self.indexes.get(classes)
+        if index is None:
+            index = self.indexes[classes] = self._index(classes)
+        self.always, self.by_key = index
+        self._split = None
+        stats = self.transformers[0].ctx.stats if self.transformers else None
+        if stats is None:
+            self.calls = self.transformers
+        else:
+            self.calls = [stats.wrap(t, 'transformer', type(t).__name__) for t in self.transformers]
+
+    @staticmethod
+    def _index(classes):
+        always, by_key = [], {}
+        for i, cls in enumerate(classes):
+            keys = cls.trigger_keys()
+            if keys is None:
+                always.append(i)
+            else:
+                for k in keys:
+                    by_key.setdefault(k, []).append(i)
+        return always, by_key
+
+    def barrier(self, item):
+        """Whether a transformer ``item`` calls for is a barrier; see
+        Transformer.barrier."""
+        if not isinstance(item, dict):
+            indexes = range(len(self.transformers))
+        else:
+            indexes = self.always + [i for k in item for i in self.by_key.get(k, ())]
+        return any(self.transformers[i].barrier for i in indexes)
+
+    def select(self, predicate):
+        return Dispatch(t for t in self.transformers if predicate(t))
+
+    def split(self):
+        """The inline transformers, and the rest."""
+        if self._split is None:
+            self._split = (self.select(lambda t: t.inline), self.select(lambda t: not t.inline))
+        return self._split
+
+    def bind(self, ctx):
+        """The same transformers, for another context."""
+        return Dispatch(type(t)(ctx) for t in self.transformers)
+
+    def __call__(self, item):
+        """Returns False if a transformer stopped the item."""
+        try:
+            if not isinstance(item, dict):
+                for t in self.calls:
                     t(item)
-                except StopIteration:
-                    break
-        self.ctx.manifests = original_manifest
+                return True
+            queue = list(self.always)
+            for k in item:
+                queue.extend(self.by_key.get(k, ()))
+            heapq.heapify(queue)
+            seen = set(item)
+            last = -1
+            while queue:
+                i = heapq.heappop(queue)
+                if i == last:
+                    continue
+                last = i
+                self.calls[i](item)
+                if len(item) != len(seen) or not seen.issuperset(item):
+                    for k in item:
+                        if k not in seen:
+                            seen.add(k)
+                            queue.extend(j for j in self.by_key.get(k, ()) if j > i)
+                    heapq.heapify(queue)
+        except StopIteration:
+            return False
+        return True
 
 
 class UpdateIssues(object):
-    """Updates fields on each item. Removes items from the document if they are completed,
-    when purge option is set."""
-    def __init__(self, context, purge=False):
+    """Copies the ``fields`` of each issue in the document back from JIRA.
+    Removes items from the document if they are completed, when purge
+    option is set.
+
+    With a ``state``, the sync is incremental: only the issues updated since
+    the last sync of the document are fetched, besides keys which are new to
+    it. A change of ``fields`` fetches everything again, and so does
+    ``full``, past the search cache.
+    """
+    # keys per query, which bounds the length of the JQL
+    chunk_size = 100
+    page_size = 100
+    fields = ['status']
+    # GreenHopper's sprint field, unless ``sprint`` is aliased to another
+    sprint_field = 'customfield_10007'
+
+    def __init__(self, context, purge=False, fields=None, state=None, full=False):
         self.ctx = context
         self.purge = purge
+        self.full = full
         self.keys = {}
+        if fields is not None:
+            self.fields = list(fields)
+        self.state = state
 
     def __call__(self, items):
         self.recurse(items)
         self.do_updates()
 
+    def jira_field(self, name):
+        if name == 'sprint':
+            return self.ctx.aliases.get(name, self.sprint_field)
+        return self.ctx.aliases.get(name, name)
+
     def do_updates(self):
-        search = DoSearch(self.ctx)._search("key in (%s)" % ",".join(self.keys.keys()))
-        for _, v in search:
-            item = self.keys[v['key']]
-            item.apply('status', str(v['status']))
-            self.on_update(item)
+        started = time.time()
+        keys = self.keys.keys()
+        last = (self.state.data.get('update') if self.state is not None else None) or {}
+        since = None
+        if not self.full and last.get('fields') == sorted(self.fields):
+            synced = set(last['keys'])
+            # JQL dates are in the user's time zone; a relative date is not,
+            # and a minute is added for the rounding
+            since = int(started - last['time']) // 60 + 2
+        else:
+            synced = set()
+        old = [k for k in keys if k in synced]
+        new = [k for k in keys if k not in synced]
+        chunks = [(old[i:i + self.chunk_size], since) for i in range(0, len(old), self.chunk_size)] + \
+            [(new[i:i + self.chunk_size], None) for i in range(0, len(new), self.chunk_size)]
+        imap = self.ctx.executor.map if self.ctx.executor else itertools.imap
+        found = set()
+        for issues in imap(self._fetch, chunks):
+            for issue in issues:
+                # a moved issue comes back under its new key
+                item = self.keys.get(issue['key'])
+                if item is None:
+                    continue
+                found.add(issue['key'])
+                self.write_back(item, issue['fields'])
+        if self.purge:
+            # the purged items of each list are removed at once
+            edits = OrderedDict()
+            for item in self.keys.values():
+                if self.completed(item):
+                    edits.setdefault(id(item.parent), (item.parent, []))[1].append(item)
+            for items, purged in edits.values():
+                items.splice([(p, p + 1, []) for p in sorted(set(items.position(i) for i in purged))])
+        missing = len(new) - len(found.intersection(new))
+        if old:
+            print >> self.ctx.out, "Refreshed", len(found), "issues changed in the last", since, "minutes,", missing, "missing"
+        else:
+            print >> self.ctx.out, "Refreshed", len(found), "issues,", missing, "missing"
+        if self.state is not None:
+            # the keys synced so far; a new key JIRA did not return is
+            # fetched in full again next time
+            self.state.data['update'] = {'time': started, 'fields': sorted(self.fields),
+                                         'keys': sorted(found.union(old))}
+            self.state.save()
+
+    def _fetch(self, chunk):
+        """Fetches the fields written back for the keys of ``chunk``, if
+        they were updated in its last minutes."""
+        keys, minutes = chunk
+        jql = "key in (%s)" % ",".join(keys)
+        if minutes is not None:
+            jql = "%s AND updated >= -%dm" % (jql, minutes)
+        fields = [self.jira_field(name) for name in self.fields]
+        if 'summary' in self.fields:
+            fields.append('issuetype')
+        # without validation, unknown keys are dropped rather than failing the query
+        if minutes is None and not self.full:
+            return list(search_issues(self.ctx, jql, ",".join(fields), self.page_size, validate=False))
+        return list(iter_search(self.ctx.jira, jql, ",".join(fields), self.page_size, validate=False))
+
+    def write_back(self, item, fields):
+        """Applies the values of ``fields`` which differ from the item's."""
+        for name in self.fields:
+            value = fields.get(self.jira_field(name))
+            key = name
+            if name == 'sprint':
+                names = re.findall(r'[\[,]name=([^,\]]*)', ",".join(value or []))
+                value = names[-1] if names else None
+            elif name == 'summary':
+                # the summary of e.g. ``Story: ...`` is kept under its type
+                issuetype = field_value((fields.get('issuetype') or {}).get('name'))
+                if issuetype in item and 'summary' not in item:
+                    key = issuetype
+            value = field_value(value)
+            if isinstance(value, list) and len(value) == 1 and isinstance(item.get(key), basestring):
+                value = value[0]
+            if value is None or value == []:
+                if key in item:
+                    item.rm(key)
+            elif item.get(key) != value:
+                item.apply(key, value)
 
     def recurse(self, items):
         if isinstance(items, dict):
@@ -102,6 +355,8 @@ class UpdateIssues(object):
             self.inspect(item)
 
     def inspect(self, item):
+        if isinstance(item.get('aliases'), dict):
+            self.ctx.update_aliases(item['aliases'])
         if not item.get('key'):
             return
         self.keys[item['key']] = item
@@ -110,14 +365,14 @@ class UpdateIssues(object):
         for i in item.get('subtasks', []):
             self.recurse(i)
 
-    def on_update(self, item):
-        if self.purge and item['status'] in ("Closed", "Resolved"):
-            item.parent.remove(item)
+    def completed(self, item):
+        return item.get('status') in ("Closed", "Resolved")
 
 
 class Skip(KeyTransformer):
     """Skip over this item."""
     priority = 0
+    planning = inline = True
     keys = ['+ignore', '-ignore']
 
     def _do(self, *args):
@@ -141,26 +396,74 @@ class AddComment(KeyTransformer):
     def _do(self, k, comment, item):
         self.ctx.jira.add_comment(item['key'], comment)
         item.rm(k)
-        print "Added to", item['key'], comment
+        self.ctx.journal.record(item, 'comment', rm=k)
+        print >> self.ctx.out, "Added to", item['key'], comment
 
 
 class SetStatus(KeyTransformer):
+    """Moves an issue to the ``+status`` target, taking as many transitions as
+    needed. The route is planned on the project and issue type's learnt
+    Workflow, starting from the status recorded in the document."""
     ignored = keys = ['+status']
-    transitions = {}
-
-    def _do(self, k, status, item):
-        prefix = item['key'].split('-')[0]
-        if prefix not in self.transitions:
-            trans = self.ctx.jira.transitions(item['key'])
-            self.transitions[prefix] = dict([(t['name'], t['id']) for t in trans])
-        try:
-            self.ctx.jira.transition_issue(item['key'], self.transitions[prefix][status])
-        except KeyError:
-            print self.transitions[prefix]
-            raise
+    max_hops = 10
+
+    def _do(self, k, target, item):
+        key = item['key']
+        status, issuetype = item.get('status'), item.get('issuetype')
+        if isinstance(issuetype, dict):
+            issuetype = issuetype.get('name')
+        # whether status was read from JIRA rather than the document; the
+        # transitions JIRA lists are learnt only for such a status
+        verified = not status or not issuetype
+        if verified:
+            status, issuetype = self._state(key)
+        workflow = Workflow(self.ctx.cache, key.split('-')[0], issuetype)
+        checked = moved = False
+        for _ in range(self.max_hops):
+            if not verified and (status == target or not workflow.known(status)):
+                # the document may be stale: it is not taken for done, nor
+                # are the transitions JIRA lists learnt for its status
+                status, actual_type = self._state(key)
+                verified = True
+                if actual_type != issuetype:
+                    issuetype = actual_type
+                    workflow = Workflow(self.ctx.cache, key.split('-')[0], issuetype)
+            if status == target:
+                break
+            if not workflow.known(status):
+                workflow.learn(status, self.ctx.jira.transitions(key))
+            path = workflow.path(status, target)
+            if path is None:
+                print >> self.ctx.out, workflow.graph.get(status)
+                raise KeyError(target)
+            name, id_, to = path[0]
+            try:
+                self.ctx.jira.transition_issue(key, id_)
+            except JIRAError:
+                if checked:
+                    raise
+                # either the document's status or the learnt workflow is stale
+                checked = verified = True
+                actual, issuetype = self._state(key)
+                if actual == status:
+                    workflow.forget(status)
+                status = actual
+                continue
+            # as the learnt workflow has it, which may be stale
+            status, verified, moved = to, False, True
+            if target in (name, to):
+                break
+        else:
+            raise KeyError(target)
         item.rm(k)
-        item.apply('status', status)
-        print "Updated status", item['key'], status
+        item.apply('status', str(status))
+        self.ctx.journal.record(item, 'status', rm=k, apply={'status': str(status)})
+        if moved:
+            print >> self.ctx.out, "Updated status", key, status
+
+    def _state(self, key):
+        issue = self.ctx.jira.issue(key, fields='status,issuetype')
+        return str(issue.fields.status.name), str(issue.fields.issuetype.name)
 
 
 class SetFixVersion(KeyTransformer):
@@ -171,7 +474,8 @@ class SetFixVersion(KeyTransformer):
         issue.update(dict(fixVersions=[dict(name=name)]))
         item.rm(k)
         item.apply('fixVersions', name)
-        print "Updated fixVersion", item['key'], name
+        self.ctx.journal.record(item, 'fixVersion', rm=k, apply={'fixVersions': name})
+        print >> self.ctx.out, "Updated fixVersion", item['key'], name
 
 
 class IssueLinks(KeyTransformer):
@@ -190,65 +494,92 @@ class IssueLinks(KeyTransformer):
             issue, type_ = link.items()[0]
             self.ctx.jira.create_issue_link(type_, item['key'], issue)
             link.apply('created', True)
-            print "Linked", item['key'], "to", issue
+            self.ctx.journal.record(link, 'link', apply={'created': True})
+            print >> self.ctx.out, "Linked", item['key'], "to", issue
 
 
 class ParentLink(Transformer):
     priority = 1000
+    triggers = ['created']
 
     def __call__(self, item):
-        if not item.get('created'):
+        if not item.get('created') or self.ctx.journal.done(item, 'parent'):
             return
         parent = item.parent.parent
         if not parent:
-            print "No parent", item.parent.parent
+            print >> self.ctx.out, "No parent", item.parent.parent
             return
         type_ = parent['issuetype']
         if isinstance(type_, dict):
             type_ = type_['name']
         if type_ == 'Epic':
-            self.ctx.jira.add_issues_to_epic(parent['key'], [item['key']])
-            print "Linked issue to Epic", parent['key'], "<-", item['key']
-        else:
-            self.ctx.jira.create_issue_link("relates to", item['key'], parent['key'])
-            print "Linked", item['key'], "to", parent['key']
+            # made at the end of the pass, with the epic's other issues
+            self.ctx.memberships.add_to_epic(parent['key'], item)
+            return
+        self.ctx.jira.create_issue_link("relates to", item['key'], parent['key'])
+        print >> self.ctx.out, "Linked", item['key'], "to", parent['key']
+        self.ctx.journal.record(item, 'parent')
+
+
+class EpicLink(KeyTransformer):
+    """Adds an issue to the epic of its ``+epic`` key; left by a run whose
+    assignment to the epic failed, see Memberships."""
+    priority = 1000
+    ignored = keys = ['+epic']
+
+    def _do(self, key, epic, item):
+        if item.get('key') and not self.ctx.journal.done(item, 'parent'):
+            self.ctx.memberships.add_to_epic(epic, item, key)
 
 
 class SprintLink(KeyTransformer):
     priority = 1000
 
     ignored = keys = ['sprint', '+sprint']
-    boards = {}
-    sprints = {}
 
-    @classmethod
-    def add_board(cls, board_id_or_url):
+    def add_board(self, board_id_or_url):
+        """Adds a board, by id or URL, to those of the document's context."""
         if 'http' in str(board_id_or_url):
             board_id = urlparse.parse_qs(urlparse.urlparse(board_id_or_url).query)['rapidView'][0]
         else:
             board_id = board_id_or_url
-        cls.boards[int(board_id)] = None
+        self.ctx.boards.add(int(board_id))
 
     def _do(self, key, sprint, item):
         # only work with items just created
         if not item.get('created') and key == 'sprint':
             return
-        for board, sprints in self.boards.items():
-            if sprints == None:
-                self.boards[board] = set(self.ctx.jira.sprints(board))
-                for sprint_ in self.boards[board]:
-                    self.sprints[sprint_.name] = sprint_.id
-        if sprint != 'backlog':
-            print "Found sprint", sprint, self.sprints[sprint]
-            sprint_name = sprint
-            sprint = self.sprints[sprint]
+        if self.ctx.journal.done(item, 'sprint'):
+            return
+        # made at the end of the pass, with the sprint's other issues
+        self.ctx.memberships.add_to_sprint(sprint, item, key)
+
+    def add(self, sprint_name, keys):
+        """Adds the issues ``keys`` to the sprint named ``sprint_name``."""
+        try:
+            self._add(sprint_name, keys)
+        except (KeyError, JIRAError):
+            # a sprint may have been created, or a cached one removed.
+            self.ctx.cache.invalidate('sprints')
+            self._add(sprint_name, keys)
+
+    def _add(self, sprint_name, keys):
+        if sprint_name != 'backlog':
+            sprint = self.sprints()[sprint_name]
+            print >> self.ctx.out, "Found sprint", sprint_name, sprint
         else:
-            sprint_name = sprint
-        add_issues_to_sprint(self.ctx.jira, sprint, [item['key']])
-        print "Added", item['key'], "to", sprint_name
-        if key == '+sprint':
-            item.rm(key)
-        item.apply('sprint', sprint_name)
+            sprint = sprint_name
+        add_issues_to_sprint(self.ctx.jira, sprint, keys)
+        print >> self.ctx.out, "Added", ", ".join(keys), "to", sprint_name
+
+    def sprints(self):
+        """Maps the name of each sprint on the registered boards to its id."""
+        sprints = {}
+        for board in self.ctx.boards:
+            sprints.update(self.ctx.cache.fetch(
+                'sprints', board,
+                lambda: dict((s.name, s.id) for s in self.ctx.jira.sprints(board))))
+        return sprints
 
 
 def add_issues_to_sprint(self, sprint_id, issue_keys):
@@ -291,15 +622,18 @@ class Subtasks(KeyTransformer):
             if 'key' in task:
                 continue
             st = self.ctx.create_subtask_from_item(task, item)
-            print "Created", st.key
+            print >> self.ctx.out, "Created", st.key
             item['subtasks'][i].apply('key', str(st.key))
+            self.ctx.journal.record(item['subtasks'][i], 'create', apply={'key': str(st.key)})
 
 
 class NewIssue(Transformer):
     """Create an issue from an item."""
     priority = 10
+    planning = True
 
     issuetypes = ['Improvement', 'Project', 'Story', 'Bug', 'Epic', None]
+    triggers = issuetypes[:-1]
 
     def __call__(self, item):
         for k in self.issuetypes:
@@ -317,15 +651,156 @@ class NewIssue(Transformer):
 
         if 'key' in item:
             return
+        if self.ctx.planning:
+            self.ctx.bulk.add(item)
+            return
         issue = self.ctx.create_issue_from_item(item)
         item.apply('key', str(issue.key))
         # for this session
         item['created'] = True
-        print "Created", issue.key
+        self.ctx.journal.record(item, 'create', apply={'key': str(issue.key)}, session={'created': True})
+        print >> self.ctx.out, "Created", issue.key
+
+
+class BulkCreate(object):
+    """Queues new items during a planning pass and creates them through the
+    bulk endpoint, ``size`` issues per request."""
+    def __init__(self, ctx, size=50):
+        self.ctx = ctx
+        self.size = size
+        self.pending = []
+        self.failed = []
+
+    def add(self, item):
+        # fields are computed now, while the item's manifests are in scope
+        self.pending.append((item, self.ctx.issue_fields(item)))
+
+    def flush(self):
+        pending, self.pending = self.pending, []
+        for i in range(0, len(pending), self.size):
+            chunk = pending[i:i + self.size]
+            result = create_issues(self.ctx.jira, [fields for _, fields in chunk])
+            errors = dict((e['failedElementNumber'], e) for e in result.get('errors', []))
+            created = iter(result.get('issues', []))
+            for j, (item, fields) in enumerate(chunk):
+                if j in errors:
+                    self.failed.append((item, errors[j]))
+                    print >> self.ctx.err, "Failed to create", safe_str(fields.get('summary'))
+                    print >> self.ctx.err, errors[j].get('elementErrors', errors[j])
+                    # skip the item for the rest of this session
+                    item['-ignore'] = True
+                    continue
+                key = str(next(created)['key'])
+                item.apply('key', key)
+                # for this session
+                item['created'] = True
+                self.ctx.journal.record(item, 'create', apply={'key': key}, session={'created': True})
+                print >> self.ctx.out, "Created", key
+
+
+class Memberships(object):
+    """Queues the sprint and epic assignments made during a pass, and makes
+    them when it ends: one request per sprint or epic and ``size`` issues.
+
+    An item's ``sprint`` is written back once its group has been added. A
+    group JIRA rejects is reported on stderr, and its items are left with
+    ``+sprint`` or ``+epic``, so that the next run tries again.
+    """
+    size = 50
+
+    def __init__(self, ctx):
+        self.ctx = ctx
+        self.lock = threading.Lock()
+        # sprint name -> [(item, key)]; epic key -> [(item, key)], where key
+        # is the item's key which asked for it, if any
+        self.sprints = OrderedDict()
+        self.epics = OrderedDict()
+
+    def add_to_sprint(self, sprint, item, key):
+        with self.lock:
+            self.sprints.setdefault(sprint, []).append((item, key))
+
+    def add_to_epic(self, epic, item, key=None):
+        with self.lock:
+            self.epics.setdefault(epic, []).append((item, key))
+
+    def flush(self):
+        with self.lock:
+            sprints, self.sprints = self.sprints, OrderedDict()
+            epics, self.epics = self.epics, OrderedDict()
+        groups = [(self._sprint, name, entries[i:i + self.size])
+                  for name, entries in sprints.items() for i in range(0, len(entries), self.size)]
+        groups += [(self._epic, epic, entries[i:i + self.size])
+                   for epic, entries in epics.items() for i in range(0, len(entries), self.size)]
+        imap = self.ctx.executor.map if self.ctx.executor else itertools.imap
+        for _ in imap(self._apply, groups):
+            pass
+
+    def _apply(self, group):
+        fn, target, entries = group
+        try:
+            fn(target, entries)
+        except Exception, e:
+            print >> self.ctx.err, "Failed to add", len(entries), "issues to", safe_str(target)
+            print >> self.ctx.err, e
+            self._defer(fn, target, entries)
+
+    def _defer(self, fn, target, entries):
+        """Leaves the items of a failed group asking for it again."""
+        retry = '+sprint' if fn == self._sprint else '+epic'
+        with self.ctx.lock:
+            for item, key in entries:
+                if key == retry:
+                    continue
+                if key is not None:
+                    item.rm(key)
+                item.apply(retry, target)
+
+    def _sprint(self, name, entries):
+        SprintLink(self.ctx).add(name, [item['key'] for item, _ in entries])
+        with self.ctx.lock:
+            for item, key in entries:
+                if key == '+sprint':
+                    item.rm(key)
+                item.apply('sprint', name)
+                self.ctx.journal.record(item, 'sprint', rm=key, apply={'sprint': name})
+
+    def _epic(self, epic, entries):
+        keys = [item['key'] for item, _ in entries]
+        self.ctx.jira.add_issues_to_epic(epic, keys)
+        print >> self.ctx.out, "Linked issues to Epic", epic, "<-", ", ".join(keys)
+        with self.ctx.lock:
+            for item, key in entries:
+                if key is not None:
+                    item.rm(key)
+                self.ctx.journal.record(item, 'parent', rm=key)
+
+
+def create_issues(self, field_list):
+    """
+    Create several issues in one request through ``issue/bulk``.
+
+    Returns the decoded response: ``issues`` holds the created issues in
+    request order, and ``errors`` holds one entry per rejected issue, indexed
+    by ``failedElementNumber``. A request where every issue is rejected is
+    answered with a 400, whose body has the same shape.
+
+    :param field_list: a list of field dicts, one per issue
+    """
+    data = {'issueUpdates': [{'fields': fields} for fields in field_list]}
+    url = self._get_url('issue/bulk')
+    try:
+        r = self._session.post(url, data=json.dumps(data))
+    except JIRAError, e:
+        if e.status_code != 400 or e.response is None:
+            raise
+        r = e.response
+    return json.loads(r.text)
 
 
 class NewManifest(KeyTransformer):
     priority = 10 ** 5 # ensure this happens after any creation logic.
+    planning = inline = True
 
     ignored = keys = ['manifest', 'aliases', 'userAliases', 'userFields', 'objectify', 'sprintBoard', 'sprintBoards']
 
@@ -337,28 +812,71 @@ class NewManifest(KeyTransformer):
 
     def _do(self, key, manifest, _):
         if key == 'aliases':
-            self.ctx.aliases.update(manifest)
+            self.ctx.update_aliases(manifest)
         elif key == 'userFields':
-            self.ctx.user_fields.extend(manifest)
+            self.ctx.add_user_fields(manifest)
         elif key == 'userAliases':
-            self.ctx.user_aliases.update(manifest)
+            self.ctx.update_user_aliases(manifest)
         elif key == 'objectify':
             for k, v in manifest.items():
                 self.ctx.update_objectified(k, v)
         elif key == 'sprintBoard':
-            SprintLink.add_board(manifest)
+            SprintLink(self.ctx).add_board(manifest)
         elif key == 'sprintBoards':
-            [SprintLink.add_board(board_id) for board_id in manifest]
+            [SprintLink(self.ctx).add_board(board_id) for board_id in manifest]
         elif key == 'manifest':
-            if self.current:
-                # we are seeing a second manifest at the same depth
-                self.ctx.manifests.pop()
-            # this is the first manifest in this series
-            self.ctx.manifests.append(manifest)
+            # a second manifest at the same depth replaces the first
+            self.ctx.push_manifest(manifest, replace=bool(self.current))
             self.current = manifest
 
 
+def iter_search(jira, jql, fields, page_size=100, validate=True):
+    """Yields the raw JSON of each issue matching ``jql``, fetching a page
+    at a time as the results are consumed.
+
+    :param fields: the fields to request, as a list or comma-separated string
+    """
+    start = 0
+    while True:
+        page = jira.search_issues(jql, startAt=start, maxResults=page_size, validate_query=validate,
+                                  fields=fields, json_result=True)
+        for issue in page['issues']:
+            yield issue
+        start += len(page['issues'])
+        if not page['issues'] or start >= page['total']:
+            return
+
+
+def search_issues(ctx, jql, fields, page_size=100, validate=True):
+    """iter_search, through the context's search cache when it has one."""
+    if ctx.searches is None:
+        return iter_search(ctx.jira, jql, fields, page_size, validate)
+    return ctx.searches.search(ctx.jira, jql, fields, page_size, validate)
+
+
+def field_value(value):
+    """Reduces a field's JSON to the value written to the document."""
+    if isinstance(value, list):
+        return [field_value(v) for v in value]
+    if isinstance(value, dict):
+        for k in ('name', 'value', 'key'):
+            if k in value:
+                return safe_str(value[k])
+        return dict((k, field_value(v)) for k, v in value.items())
+    if isinstance(value, basestring):
+        return safe_str(value)
+    return value
+
+
 class DoSearch(Transformer):
+    """Expands a ``search`` node into the issues it matches. Fields named in
+    the node's ``fields`` list are included with each issue."""
+    page_size = 100
+    fields = ['summary', 'assignee', 'status', 'description', 'issuetype']
+    triggers = ['search']
+    # the issues created before a search are among its results
+    barrier = True
+
     def __call__(self, item):
         """Expands a node which declares a search.
         """
@@ -367,33 +885,134 @@ class DoSearch(Transformer):
         if item.get('complete'):
             return
         item.apply('complete', True)
-        i_ = item.parent.index(item)
-        for j, data in self._search(item['search']):
-            item.parent.insert(i_ + 2 + j, sdict(data.items()))
-
-    def _search(self, query):
-        for j, issue in enumerate(self.ctx.jira.search_issues(query, maxResults=200)):
-            data = OrderedDict()
-            type_ = str(issue.fields.issuetype.name)
-            data[type_] = safe_str(issue.fields.summary)
-            data['assignee'] = str(issue.fields.assignee.name)
-            data['status'] = str(issue.fields.status.name)
-            data['desc'] = safe_str(issue.fields.description)
-            data['key'] = str(issue.key)
-            yield j, data
+        search = self._search(item['search'], item.get('fields') or [], item.get('pageSize'))
+        results = [sdict(data.items()) for _, data in search]
+        with self.ctx.lock:
+            i_ = item.parent.position(item)
+            item.parent.splice([(i_ + 2, i_ + 2, results)])
+
+    def _search(self, query, extra=(), page_size=None, cached=True):
+        extra = [(name, self.ctx.aliases.get(name, name)) for name in extra]
+        fields = self.fields + [field for _, field in extra]
+        if cached:
+            issues = search_issues(self.ctx, query, fields, page_size or self.page_size)
+        else:
+            issues = iter_search(self.ctx.jira, query, fields, page_size or self.page_size)
+        for j, issue in enumerate(issues):
+            yield j, self.data(issue, extra)
+
+    def data(self, issue, extra=()):
+        """The item written to the document for ``issue``."""
+        values = issue['fields']
+        data = OrderedDict()
+        type_ = str(values['issuetype']['name'])
+        data[type_] = safe_str(values['summary'])
+        data['assignee'] = field_value(values['assignee'])
+        data['status'] = field_value(values['status'])
+        data['desc'] = safe_str(values['description'])
+        data['key'] = str(issue['key'])
+        for name, field in extra:
+            data[name] = field_value(values.get(field))
+        return data
 
 
 class GetLinked(KeyTransformer):
+    """Expands a ``+linked`` node among the items of an issue into the
+    issues linked to it, in its epic, or its subtasks. A query given as the
+    node's value narrows them down. The searches are made at the end of the
+    pass; see LinkedSearches."""
     ignored = keys = ['+linked']
 
     def _do(self, _k, query, item):
-        search = DoSearch(self.ctx)
-        parent = item.parent.parent
-        i_ = item.parent.index(item)
-        key = parent['key']
-        q = "(issue in linkedIssues(%s) or \"Epic Link\" = %s or parent = %s)" % (key, key, key)
+        self.ctx.linked.add(item, query)
+
+
+class LinkedSearches(object):
+    """Queues the ``+linked`` nodes of a pass, and expands them when it
+    ends: the nodes which share a query are searched for together, ``size``
+    issues to a search, and the results are split back to each issue by how
+    they relate to it.
+    """
+    size = 20
+
+    def __init__(self, ctx):
+        self.ctx = ctx
+        self.lock = threading.Lock()
+        # query -> [node]
+        self.nodes = OrderedDict()
+
+    def add(self, node, query):
+        with self.lock:
+            self.nodes.setdefault(query or None, []).append(node)
+
+    def flush(self):
+        with self.lock:
+            nodes, self.nodes = self.nodes, OrderedDict()
+        groups = [(query, group[i:i + self.size])
+                  for query, group in nodes.items() for i in range(0, len(group), self.size)]
+        imap = self.ctx.executor.map if self.ctx.executor else itertools.imap
+        for _ in imap(self._expand, groups):
+            pass
+
+    def _expand(self, group):
+        query, nodes = group
+        # issue key -> [node]
+        parents = OrderedDict()
+        for node in nodes:
+            key = node.parent.parent.get('key') if isinstance(node.parent.parent, dict) else None
+            if key:
+                parents.setdefault(key, []).append(node)
+        if not parents:
+            return
+        keys = parents.keys()
+        q = "(%s or \"Epic Link\" in (%s) or parent in (%s))" % (
+            " or ".join("issue in linkedIssues(%s)" % key for key in keys), ",".join(keys), ",".join(keys))
         if query:
             q = "%s AND %s" % (q, query)
-        for j, data in search._search(q):
-            item.parent.insert(i_ + 2 + j, sdict(data.items()))
-        item.parent.remove(item)
+        search = DoSearch(self.ctx)
+        epic_field = self.epic_field()
+        fields = search.fields + ['issuelinks', 'parent'] + ([epic_field] if epic_field else [])
+        found = dict((key, []) for key in keys)
+        for issue in search_issues(self.ctx, q, fields, search.page_size):
+            data = search.data(issue)
+            for key in related(issue, epic_field).intersection(keys):
+                found[key].append(data)
+        with self.ctx.lock:
+            # each list is rebuilt once, however many of its nodes expand
+            edits = OrderedDict()
+            for key, group in parents.items():
+                for node in group:
+                    i_ = node.parent.position(node)
+                    edits.setdefault(id(node.parent), (node.parent, []))[1].extend([
+                        (i_ + 2, i_ + 2, [sdict(data.items()) for data in found[key]]),
+                        (i_, i_ + 1, [])])
+            for items, changes in edits.values():
+                items.splice(changes)
+
+    def epic_field(self):
+        """The id of the Epic Link field, e.g. customfield_10008."""
+        def lookup():
+            for field in self.ctx.jira.fields():
+                if field.get('name') == 'Epic Link':
+                    return field['id']
+        return self.ctx.cache.fetch('fields', 'Epic Link', lookup)
+
+
+def related(issue, epic_field=None):
+    """The keys of the issues which ``issue`` is linked to, is in the epic
+    of, or is a subtask of."""
+    values = issue['fields']
+    keys = set()
+    for link in values.get('issuelinks') or []:
+        keys.add((link.get('inwardIssue') or link.get('outwardIssue') or {}).get('key'))
+    if epic_field and values.get(epic_field):
+        keys.add(values[epic_field])
+    keys.add((values.get('parent') or {}).get('key'))
+    keys.discard(None)
+    return keys
+
+
+# the transformers jywriter applies of itself; see jy.registry
+BUILTINS = [ApplyTransformers, Skip, Section, AddComment, SetStatus, SetFixVersion,
+            IssueLinks, ParentLink, EpicLink, SprintLink, Subtasks, NewIssue,
+            NewManifest, DoSearch, GetLinked]
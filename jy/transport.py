@@ -0,0 +1,149 @@
+from email.utils import mktime_tz, parsedate_tz
+from jira.client import GreenHopper
+from jira.utils import raise_on_error
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError, ConnectTimeout
+from requests.packages.urllib3.exceptions import NewConnectionError
+import json
+import random
+import requests
+import threading
+import time
+
+
+class Throttle(object):
+    """A token bucket shared by the threads of a run: ``rate`` requests a
+    second on average, in bursts of up to ``burst``. Without a rate, it only
+    holds requests back while the server asks us to wait."""
+    def __init__(self, rate=None, burst=1):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.tokens = float(self.burst)
+        self.last = time.time()
+        self.until = 0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        while True:
+            with self.lock:
+                now = time.time()
+                delay = self.until - now
+                if delay <= 0 and self.rate:
+                    self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+                    self.last = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    delay = (1 - self.tokens) / self.rate
+                elif delay <= 0:
+                    return
+            time.sleep(delay)
+
+    def hold(self, delay):
+        """Holds every request back for ``delay`` seconds."""
+        with self.lock:
+            self.until = max(self.until, time.time() + delay)
+
+
+def retry_after(response):
+    """The delay asked for by a Retry-After header, in seconds, or None."""
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        date = parsedate_tz(value)
+        return max(mktime_tz(date) - time.time(), 0) if date else None
+
+
+def connect_failed(error):
+    """Whether a ConnectionError was raised while connecting, before any of
+    the request was sent."""
+    if isinstance(error, ConnectTimeout):
+        return True
+    reason = getattr(error.args[0] if error.args else None, 'reason', None)
+    return isinstance(reason, NewConnectionError)
+
+
+class Session(requests.Session):
+    """The HTTP session of the JIRA client: a connection pool sized for the
+    number of concurrent calls, a timeout on every request, and retries with
+    exponential backoff and jitter when JIRA is throttling or unavailable.
+
+    JIRA may have carried out a request before a gateway error or a dropped
+    connection, so only idempotent requests are retried then. A POST, e.g.
+    a created issue, is only retried when JIRA turned it away unseen: on
+    429, on 503 with Retry-After, or when the connection could not be made.
+
+    Like the client's own session, it raises JIRAError on error responses.
+    """
+    retry_statuses = (429, 502, 503, 504)
+    idempotent = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE')
+
+    def __init__(self, pool_size=10, timeout=30, retries=5, backoff=1.0, rate=None, burst=1):
+        super(Session, self).__init__()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.mount('http://', adapter)
+        self.mount('https://', adapter)
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.throttle = Throttle(rate, burst)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        if isinstance(kwargs.get('data'), dict):
+            kwargs['data'] = json.dumps(kwargs['data'])
+        attempt = 0
+        while True:
+            self.throttle.wait()
+            try:
+                r = super(Session, self).request(method, url, **kwargs)
+            except ConnectionError, e:
+                if attempt >= self.retries or not (method.upper() in self.idempotent or connect_failed(e)):
+                    raise
+                r = None
+            if r is not None and (not self.retryable(method, r) or attempt >= self.retries):
+                raise_on_error(r, verb=method)
+                return r
+            delay = retry_after(r) if r is not None else None
+            if delay is None:
+                delay = self.backoff * 2 ** attempt * random.uniform(0.5, 1.5)
+            if r is not None and r.status_code == 429:
+                # everyone else is over the limit too
+                self.throttle.hold(delay)
+            attempt += 1
+            time.sleep(delay)
+
+    def retryable(self, method, response):
+        if response.status_code not in self.retry_statuses:
+            return False
+        if method.upper() in self.idempotent:
+            return True
+        return response.status_code == 429 or (response.status_code == 503 and
+                                               retry_after(response) is not None)
+
+    @classmethod
+    def from_conf(cls, connection, jobs=1):
+        """A session set up from the ``connection`` section of the
+        configuration."""
+        return cls(pool_size=int(connection.get('poolSize') or max(jobs, 10)),
+                   timeout=float(connection.get('timeout', 30)),
+                   retries=int(connection.get('retries', 5)),
+                   backoff=float(connection.get('backoff', 1.0)),
+                   rate=connection.get('rate') and float(connection['rate']),
+                   burst=int(connection.get('burst', 1)))
+
+
+class Client(GreenHopper):
+    """The GreenHopper client, sending its requests through ``session``."""
+    def __init__(self, session, **kwargs):
+        self.transport = session
+        GreenHopper.__init__(self, **kwargs)
+
+    def _create_http_basic_session(self, username, password):
+        self._session = self.transport
+        self._session.verify = self._options['verify']
+        self._session.auth = (username, password)
+        self._session.cert = self._options['client_cert']
@@ -0,0 +1,61 @@
+import collections
+import threading
+
+
+class Workflow(object):
+    """The transitions of one project and issue type, learnt one status at a
+    time from the issues that pass through it and kept in the metadata cache.
+
+    The graph maps each learnt status to its transitions, as
+    ``[name, id, destination status]`` triples.
+    """
+    lock = threading.Lock()
+
+    def __init__(self, cache, project, issuetype):
+        self.cache = cache
+        self.key = "%s/%s" % (project, issuetype)
+        self.graph = cache.get('transitions', self.key) or {}
+
+    def known(self, status):
+        return status in self.graph
+
+    def learn(self, status, transitions):
+        """Records ``transitions``, as returned by ``JIRA.transitions``, as
+        the ones available from ``status``."""
+        with self.lock:
+            self.graph[status] = [[t['name'], t['id'], t['to']['name']] for t in transitions]
+            self.cache.set('transitions', self.key, self.graph)
+
+    def forget(self, status):
+        with self.lock:
+            self.graph.pop(status, None)
+            self.cache.set('transitions', self.key, self.graph)
+
+    def path(self, status, target):
+        """The shortest list of transitions from ``status`` to ``target``
+        through the learnt statuses. A transition reaches the target if it
+        leads to a status of that name, or is itself named ``target``.
+
+        When the target cannot be reached yet, returns the shortest path to
+        a status whose transitions are unknown, from where it can be
+        learnt; None if there is no such status either. Already at the
+        target, the path is empty.
+        """
+        if status == target:
+            return []
+        routes = {status: []}
+        queue = collections.deque([status])
+        unknown = None
+        while queue:
+            current = queue.popleft()
+            for name, id_, to in self.graph.get(current, []):
+                route = routes[current] + [(name, id_, to)]
+                if target in (name, to):
+                    return route
+                if to not in routes:
+                    routes[to] = route
+                    if to in self.graph:
+                        queue.append(to)
+                    elif unknown is None:
+                        unknown = route
+        return unknown
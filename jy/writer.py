@@ -1,40 +1,95 @@
-from jira.client import GreenHopper, JIRA
-from jy.ioutil import load, dump
-from jy.transformers import ApplyTransformers, NewManifest, Transformer, UpdateIssues
-from optparse import OptionParser
+# The client, the transformers and the command line parser are imported
+# where they are first needed, so that e.g. --help or jy.daemon's client
+# does not wait for them; see benchmarks/bench_import.py.
+from jy import registry
+from jy.cache import MetaCache, SearchCache
+from jy.journal import Journal
+from jy.normalize import Plan, dictify, listify
+from jy.state import DocumentState, Incremental
+from jy.stats import Stats, timed
+from jy.ioutil import atomic_write, dump, load, patch
+import atexit
+import collections
 import copy
 import functools
 import os
 import sys
-from docopt import docopt
+import threading
+import time
 
 
 class Context(object):
     def __init__(self, jira):
+        from jy.transformers import LinkedSearches, Memberships
         self.jira = jira
         self.manifests = []
         self.user_fields = ['assignee', 'reporter']
         self.aliases = {}
         self.user_aliases = {}
         self.objectified = {}
+        # compiled from the above on first use; see jy.normalize.Plan
+        self._plan = None
+        self._defaults = None
+        # set while the bulk planning pass runs; see BulkCreate
+        self.planning = False
+        self.bulk = None
+        # runs items in parallel when set; see ApplyTransformers
+        self.executor = None
+        self.task = None
+        # guards changes to the document's lists
+        self.lock = threading.RLock()
+        self.cache = MetaCache()
+        # caches search results across runs when set; see jy.cache.SearchCache
+        self.searches = None
+        # skips unchanged items when set; see jy.state.Incremental
+        self.incremental = None
+        self.scope_changed = False
+        # records the changes made to JIRA; see jy.journal.Journal
+        self.journal = Journal()
+        # the boards whose sprints are looked up; see SprintLink
+        self.boards = set()
+        # sprint and epic assignments, made at the end of a pass
+        self.memberships = Memberships(self)
+        # +linked nodes, expanded at the end of a pass
+        self.linked = LinkedSearches(self)
+        # measures the run when set; see jy.stats.Stats
+        self.stats = None
+        # where the run reports what it does; see jy.daemon
+        self.out = sys.stdout
+        self.err = sys.stderr
 
-    def create_issue_from_item(self, item, **kwargs):
+    def fork(self):
+        """A copy of this context which keeps the current manifests and field
+        mappings while this context moves on. The client is shared."""
+        ctx = copy.copy(self)
+        ctx.manifests = list(self.manifests)
+        ctx.user_fields = list(self.user_fields)
+        ctx.aliases = dict(self.aliases)
+        ctx.user_aliases = dict(self.user_aliases)
+        ctx.objectified = dict(self.objectified)
+        return ctx
+
+    def issue_fields(self, item, **kwargs):
+        """The normalized fields used to create an issue from ``item``."""
         params = self.compute_defaults()
         params.update(item)
         params.update(kwargs)
         self._squash_prefixed(params)
-        params = self._normalize(params)
+        return self._normalize(params)
+
+    def create_issue_from_item(self, item, **kwargs):
+        params = self.issue_fields(item, **kwargs)
         try:
             issue = self.jira.create_issue(**params)
         except Exception, e:
-            print >> sys.stderr, params
-            print >> sys.stderr, e
+            print >> self.err, params
+            print >> self.err, e
             sys.exit(1)
         return issue
 
     def _squash_prefixed(self, params):
         """Ensure handle issuetype/value"""
-        prefix = "%s/" % self._normalize(params)["issuetype"]['name']
+        prefix = "%s/" % self.plan().field(params, "issuetype")['name']
         for key in params.keys():
             if key.startswith(prefix):
                 pkey = key[len(prefix):]
@@ -45,10 +100,25 @@ class Context(object):
                 params.pop(key)
 
     def compute_defaults(self):
-        params = {}
-        for m in self.manifests:
-            params.update(m)
-        return params
+        """The fields of the manifests in scope, merged. The merge is kept
+        until the manifests in scope change."""
+        if self._defaults is None:
+            self._defaults = {}
+            for m in self.manifests:
+                self._defaults.update(m)
+        return dict(self._defaults)
+
+    def push_manifest(self, manifest, replace=False):
+        """Brings ``manifest`` into scope, in place of the innermost one when
+        ``replace`` is set."""
+        if replace:
+            self.manifests.pop()
+        self.manifests.append(manifest)
+        self._defaults = None
+
+    def restore_manifests(self, manifests):
+        self.manifests = manifests
+        self._defaults = None
 
     def create_subtask_from_item(self, task, parent):
         base_manifest = self.compute_defaults()
@@ -66,70 +136,266 @@ class Context(object):
             kw = self._normalize(params)
             return self.jira.create_issue(**kw)
         except:
-            print kw
+            print >> self.out, kw
             raise
 
     def update_objectified(self, k, v):
         if isinstance(v, basestring):
-            self.objectified[k] = functools.partial(self._dictify, k, v)
+            self.objectified[k] = functools.partial(dictify, v)
         elif isinstance(v, list):
-            self.objectified[k] = functools.partial(self._listify, k, v[0])
+            self.objectified[k] = functools.partial(listify, v[0])
+        self._plan = None
 
-    def _dictify(self, k, dkey, item):
-        if isinstance(item.get(k), basestring):
-            item[k] = {dkey: item[k]}
+    def update_aliases(self, aliases):
+        self.aliases.update(aliases)
+        self._plan = None
 
-    def _listify(self, k, dkey, item):
-        l = item.get(k, [])
-        if not isinstance(l, list):
-            item[k] = l = [l]
-        for i, el in enumerate(l):
-            if isinstance(el, basestring) and k:
-                item[k][i] = {dkey: el}
+    def update_user_aliases(self, aliases):
+        self.user_aliases.update(aliases)
+        self._plan = None
+
+    def add_user_fields(self, fields):
+        self.user_fields.extend(fields)
+        self._plan = None
+
+    def plan(self):
+        """The field mappings compiled, recompiled when they or the
+        registered transformers change."""
+        transformers = registry.transformers()
+        if self._plan is None or self._plan[0] != len(transformers):
+            ignored = set(k for trans in transformers for k in trans.ignored)
+            self._plan = (len(transformers), Plan(self.user_fields, self.user_aliases,
+                                                  self.objectified, self.aliases, ignored))
+        return self._plan[1]
 
     def _normalize(self, item):
-        item = copy.copy(item)
-        for k in self.user_fields:
-            user = item.get(k)
-            if isinstance(user, basestring) and user in self.user_aliases:
-                item[k] = self.user_aliases[user]
-
-        # transform anything needing transformed
-        for trans in self.objectified.values():
-            trans(item)
-        # map over aliased fields
-        for k, v in self.aliases.items():
-            if k in item:
-                item[v] = item.pop(k)
-        # pop out exceptional tags
-        for trans in Transformer:
-            for k in trans.ignored:
-                item.pop(k, None)
-        return item
-
-
-def connect(conf):
+        return self.plan()(item)
+
+
+def connect(conf, jobs=1):
+    from jy.transport import Client, Session
     conf = conf or {}
     connection = conf.get('connection', {})
     def _value(name):
         return connection.get(name) or os.environ['JY_%s' % name.upper()]
 
-    return GreenHopper(options={'server': _value('server')},
-                       basic_auth=(_value('username'),
-                                   _value('password')))
+    return Client(Session.from_conf(connection, jobs),
+                  options={'server': _value('server')},
+                  basic_auth=(_value('username'),
+                              _value('password')))
+
+
+def fake_connect(conf, jobs=1):
+    """Connects to a fake JIRA served by this process, in which the issues
+    the document refers to exist; see jy.fakejira."""
+    from jy.fakejira import FakeJira
+    from jy.transport import Client, Session
+    fake = FakeJira(autocreate=True)
+    session = Session.from_conf({}, jobs)
+    atexit.register(fake.stop)
+    atexit.register(session.close)
+    return Client(session, options={'server': fake.start()}, basic_auth=('test', 'test'))
+
+
+def documents(paths):
+    """The documents named by ``paths``, with each directory expanded to
+    the YAML files in it."""
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.endswith(('.yaml', '.yml')) and not name.startswith('.'):
+                    yield os.path.join(path, name)
+        else:
+            yield path
+
+
+def read_document(path, stats=None):
+    with open(path) as f:
+        source = f.read().decode('utf-8')
+    with timed(stats, 'yaml', 'load'):
+        return source, load(source)
+
+
+def document_version(path):
+    """The modification time and size of the file at ``path``, or None."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime, st.st_size
+
+
+def write_document(path, source, items, stats=None, version=None):
+    """Writes the document out, and returns the version written. With a
+    ``version``, the document is only written if it is still at that
+    version; if it was saved meanwhile, returns None."""
+    with timed(stats, 'yaml', 'patch'):
+        text = patch(source, items, default_flow_style=False)
+    if text is None:
+        with timed(stats, 'yaml', 'dump'):
+            text = dump(items, default_flow_style=False, encoding=None)
+    if version is not None and document_version(path) != version:
+        return None
+    st = atomic_write(path, text.encode('utf-8'))
+    return (st.st_mtime, st.st_size) if st else None
+
+
+class Runner(object):
+    """Runs documents one after another through one client, metadata cache
+    and pool of threads, each with a Context of its own.
 
+    With a ``pool`` of processes, documents are written out there, while
+    the next document runs.
+    """
+    def __init__(self, jira, arguments, conf=None, stats=None):
+        self.jira = jira
+        self.arguments = arguments
+        self.conf = conf
+        self.stats = stats
+        self.cache = MetaCache()
+        self.searches = None
+        self.executor = None
+        self.pool = None
+        self.writes = []
+        # the version of the document the last run wrote; see run
+        self.written = None
+        # (path, changes made by op, seconds, succeeded) per document run
+        self.summary = []
+
+    def context(self):
+        from jy.transformers import NewManifest
+        context = Context(self.jira)
+        context.cache = self.cache
+        context.searches = self.searches
+        context.executor = self.executor
+        if self.stats:
+            self.stats.instrument(context)
+        if self.conf:
+            NewManifest(context)(self.conf)
+        return context
+
+    def run(self, path, output, source, items, version=None, out=None):
+        """Runs a document and writes it to ``output``.
+
+        With the ``version`` of ``output`` the document was read at, it is
+        not written if it was saved during the run: :attr:`written` is then
+        None, and the journal is kept for the next run to replay. Otherwise
+        :attr:`written` is the version written. The run reports to ``out``
+        rather than stdout and stderr when given.
+        """
+        from jy.transformers import ApplyTransformers, BulkCreate, UpdateIssues
+        arguments = self.arguments
+        started = time.time()
+        succeeded = False
+        self.written = None
+        context = self.context()
+        if out is not None:
+            context.out = context.err = out
+        if not arguments.get('--test'):
+            context.journal = Journal.beside(path)
+        replayed = context.journal.start(source, items, context.err)
+        if replayed:
+            print >> context.out, "Resumed", replayed, "changes from an interrupted run"
+        # the fake JIRA of --test starts afresh on each run, and a dry run
+        # leaves no state behind
+        state = DocumentState(path if not arguments.get('--test') else None)
+        if arguments.get('--incremental'):
+            context.incremental = Incremental(state, items, self.conf)
+        try:
+            if arguments.get("--update"):
+                update = (self.conf or {}).get('update') or {}
+                with timed(self.stats, 'phase', 'update'):
+                    UpdateIssues(context, arguments.get('--purge'), update.get('fields'), state,
+                                 arguments.get('--full'))(items)
+            else:
+                if arguments.get('--bulk'):
+                    context.bulk = BulkCreate(context, int(arguments['--bulk']))
+                    context.planning = True
+                    ApplyTransformers(context)(items)
+                    context.planning = False
+                    context.bulk.flush()
+                ApplyTransformers(context)(items)
+                if context.incremental:
+                    print >> context.out, "Skipped", context.incremental.skipped, "unchanged items"
+                    context.incremental.record(items)
+            succeeded = True
+        finally:
+            # after an error, the assignments queued before it are still made
+            context.memberships.flush()
+            self.cache.save()
+            if self.searches:
+                self.searches.save()
+            if self.pool:
+                # the journal is kept until the document is written
+                self.writes.append((self.pool.apply_async(write_document, (output, source, items)),
+                                    context.journal))
+            else:
+                self.written = write_document(output, source, items, self.stats, version)
+                if version is not None and self.written is None:
+                    print >> context.err, output, "was saved during the run, and was not written"
+                    context.journal.close(keep=True)
+                else:
+                    context.journal.close()
+            changes = collections.Counter(op for _, op in context.journal.completed)
+            self.summary.append((path, changes, time.time() - started, succeeded))
+
+    def finish(self):
+        """Waits for the documents being written, and stops the pools."""
+        try:
+            for result, journal in self.writes:
+                result.get()
+                journal.close()
+        finally:
+            self.writes = []
+            if self.pool:
+                self.pool.close()
+                self.pool.join()
+            if self.executor:
+                self.executor.close()
+
+    @staticmethod
+    def describe(entry):
+        path, changes, seconds, succeeded = entry
+        return "%s: %s, %s in %.1fs" % (
+            path, "ok" if succeeded else "FAILED",
+            ", ".join("%d %s" % (n, op) for op, n in sorted(changes.items())) or "no changes",
+            seconds)
+
+    def report(self, out=sys.stdout):
+        for entry in self.summary:
+            print >> out, self.describe(entry)
+        failed = len([s for s in self.summary if not s[3]])
+        print >> out, "%d documents, %d failed" % (len(self.summary), failed)
+
+
+def load_conf():
+    """The settings in ~/.jy, if any."""
+    defaults = os.path.expanduser("~/.jy")
+    if os.path.exists(defaults):
+        return load(open(defaults))
 
-def mock_connect(conf):
-    from mock import Mock
-    jira = Mock(spec=GreenHopper)
-    jira.search_issues.return_value = [Mock(), Mock()]
 
-    def create_issue(**kwargs):
-        m = Mock()
-        m.key = kwargs
-        return m
-    jira.create_issue.side_effect = create_issue
-    return jira
+def make_runner(arguments, conf=None, stats=None):
+    """A Runner connected, and with the metadata cache and thread pool, as
+    the command line ``arguments`` and ``conf`` say."""
+    jobs = int(arguments.get('--jobs') or 1)
+    _connect = fake_connect if arguments.get('--test') else connect
+    runner = Runner(_connect(conf, jobs), arguments, conf, stats)
+    cache_conf = (conf or {}).get('cache', {})
+    if not arguments.get('--test'):
+        runner.cache = MetaCache(os.path.expanduser(cache_conf.get('path', '~/.jy.cache')),
+                                 cache_conf.get('maxEntries'))
+        if not arguments.get('--no-search-cache'):
+            runner.searches = SearchCache(os.path.expanduser(cache_conf.get('searchPath', '~/.jy.searches')),
+                                          cache_conf.get('maxSearches'))
+    if arguments.get('--refresh-cache'):
+        runner.cache.clear()
+        if runner.searches:
+            runner.searches.clear()
+    if jobs > 1:
+        from jy.executor import Executor
+        runner.executor = Executor(jobs)
+    return runner
 
 
 def main():
@@ -138,51 +404,124 @@ def main():
 Usage:
   jywriter [options] <input>
   jywriter [options] <input> <output>
+  jywriter [options] --batch <path>...
+  jywriter [options] --search=<jql> [<output>]
 
 Options:
   -U --update   Update all the known tickets with Status.
+  --full        With --update, fetch every ticket rather than those changed since the last update.
   -P --purge    Remove all completed items
   -h --help     Show this screen.
-  -t --test     Use a mock instead of connecting to JIRA.
-  --freemind    Output to freemind
+  -t --test     Run against a fake JIRA instead of connecting to JIRA.
+  -b --batch    Rewrite each document given, or each YAML file in the directories given.
+  --procs=<n>   With --batch, load and write documents in <n> worker processes.
+  -B --bulk=<n>  Create new issues through the bulk endpoint, <n> per request.
+  -j --jobs=<n>  Run up to <n> JIRA calls at once.
+  --refresh-cache  Discard the cached transitions, sprints, search results and other metadata.
+  --no-search-cache  Run every search against JIRA rather than checking cached results for changes.
+  -I --incremental  Only process items changed since the last run.
+  --stats       Print call counts and timings to stderr at the end of the run.
+  --stats-json=<path>  Write the call counts and timings as JSON to <path>.
+  --profile=<path>  Write a cProfile profile of the run to <path>.
+  --export=<format>  Write the document, or the issues matching --search, to <output> or stdout
+                     as jsonl, csv or freemind, instead of running it.
+  --search=<jql>  Export the issues matching <jql>.
+  --freemind    Same as --export=freemind.
     """
+    from docopt import docopt
     arguments = docopt(main.__doc__)
 
-    if arguments.get('--test'):
-        _connect = mock_connect
-        arguments['<output>'] = "/dev/stdout"
+    if arguments.get('--batch'):
+        paths = list(documents(arguments['<path>']))
+        outputs = list(paths)
     else:
-        _connect = connect
+        paths = [arguments['<input>']]
+        outputs = [arguments.get('<output>') or arguments['<input>']]
 
-    if not arguments.get("<output>"):
-        arguments['<output>'] = arguments['<input>']
+    if arguments.get('--test'):
+        outputs = ["/dev/stdout"] * len(paths)
 
-    if arguments['--freemind']:
-        from jy.freemind import Writer
-        w = Writer(open(arguments.get('<output>', '/dev/stdout'), 'w'))
-        items = load(open(arguments["<input>"]))
-        w.doc({arguments["<input>"]: items})
+    format = arguments.get('--export') or ('freemind' if arguments['--freemind'] else None)
+    if format or arguments.get('--search'):
+        from jy import export
+        if arguments.get('--batch'):
+            sys.exit("Only one document can be exported at a time")
+        try:
+            cls = export.exporter_class(format or 'jsonl')
+        except ValueError, e:
+            sys.exit(str(e))
+        output = arguments.get('<output>') or '/dev/stdout'
+        # the output is only opened once the input has been read, or the
+        # search has started, and is replaced once it is all written
+        if arguments.get('--search'):
+            runner = make_runner(arguments, load_conf())
+            try:
+                pairs = export.started(export.search(runner.context(), arguments['--search']))
+                n = export.export_to(output, pairs, cls, arguments['--search'])
+            finally:
+                runner.finish()
+        else:
+            if os.path.exists(output) and os.path.realpath(output) == os.path.realpath(paths[0]):
+                sys.exit("Cannot export %s over itself" % paths[0])
+            pairs = export.walk(read_document(paths[0])[1])
+            n = export.export_to(output, pairs, cls, paths[0])
+        print >> sys.stderr, "Exported", n, "items"
         return
 
-    conf = None
-    defaults = os.path.expanduser("~/.jy")
-    if os.path.exists(defaults):
-        conf = load(open(defaults))
-
-    jira = connect(conf)
-    items = load(open(arguments["<input>"]))
-    context = Context(jira)
+    stats = None
+    if arguments.get('--stats') or arguments.get('--stats-json'):
+        stats = Stats()
+    profile = None
+    if arguments.get('--profile'):
+        import cProfile
+        profile = cProfile.Profile()
+        profile.enable()
 
-    if conf:
-        NewManifest(context)(conf)
+    conf = load_conf()
+    pool = None
+    if arguments.get('--batch') and int(arguments.get('--procs') or 0) > 1:
+        import multiprocessing
+        # forked before the client, and the fake server of --test, start
+        # threads of their own
+        pool = multiprocessing.Pool(int(arguments['--procs']))
+    runner = make_runner(arguments, conf, stats)
+    runner.pool = pool
+    if pool:
+        # documents are loaded ahead of the one running
+        reads = pool.imap(read_document, paths)
+    else:
+        reads = (read_document(path, stats) for path in paths)
     try:
-        if arguments.get("--update"):
-            UpdateIssues(context, arguments.get('--purge'))(items)
-        else:
-            ApplyTransformers(context)(items)
+        for path, output in zip(paths, outputs):
+            if not arguments.get('--batch'):
+                source, items = next(reads)
+                runner.run(path, output, source, items)
+                continue
+            # in a batch, a document which fails is reported, and the
+            # others still run
+            try:
+                source, items = next(reads)
+            except Exception, e:
+                print >> sys.stderr, "%s: %s" % (path, e)
+                runner.summary.append((path, {}, 0, False))
+                continue
+            try:
+                runner.run(path, output, source, items)
+            except (Exception, SystemExit), e:
+                print >> sys.stderr, "%s: %s" % (path, e)
     finally:
-        with open(arguments['<output>'], "w") as f:
-            dump(items, f, default_flow_style=False)
+        runner.finish()
+        if profile:
+            profile.disable()
+            profile.dump_stats(arguments['--profile'])
+        if arguments.get('--stats'):
+            stats.report()
+        if arguments.get('--stats-json'):
+            stats.write_json(arguments['--stats-json'])
+    if arguments.get('--batch'):
+        runner.report()
+        if not all(s[3] for s in runner.summary):
+            sys.exit(1)
 
 
 if __name__ == '__main__':
@@ -17,10 +17,12 @@ setup(
     license="BSD",
     packages=find_packages(exclude=['tests']),
     long_description="",
-    install_requires=['jira==0.35', 'PyYAML>=3.10', 'docopt', 'mock'],
+    install_requires=['jira==0.35', 'PyYAML>=3.10', 'docopt'],
+    tests_require=['mock', 'nose'],
     test_suite='nose.collector',
     classifiers=[
         "License :: OSI Approved :: MIT License",
     ],
-    entry_points={'console_scripts': ['jywriter = jy.writer:main']}
+    entry_points={'console_scripts': ['jywriter = jy.writer:main',
+                                        'jyd = jy.daemon:main']}
 )
@@ -0,0 +1,128 @@
+from jy.cache import MetaCache, SearchCache, split_order
+from jy.fakejira import FakeJira
+from jy.transport import Client, Session
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+
+class TestMetaCache(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'cache')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_persist(self):
+        cache = MetaCache(self.path)
+        cache.set('transitions', 'PROJ', {'Done': '31'})
+        cache.set('sprints', 12, {'Sprint 1': 100}, ttl=-1)
+        cache.save()
+        cache = MetaCache(self.path)
+        assert cache.get('transitions', 'PROJ') == {'Done': '31'}
+        assert cache.get('sprints', 12) is None
+
+    def test_fetch_and_invalidate(self):
+        cache = MetaCache()
+        calls = []
+        fetch = lambda: calls.append(1) or len(calls)
+        assert cache.fetch('sprints', 1, fetch) == 1
+        assert cache.fetch('sprints', 1, fetch) == 1
+        cache.set('sprints', 2, 'x')
+        cache.set('transitions', 1, 'y')
+        cache.invalidate('sprints')
+        assert cache.get('sprints', 2) is None
+        assert cache.get('transitions', 1) == 'y'
+        assert cache.fetch('sprints', 1, fetch) == 2
+        assert cache.fetch('fields', 'Epic Link', lambda: calls.append(1)) is None
+        assert cache.fetch('fields', 'Epic Link', lambda: calls.append(1)) is None
+        assert len(calls) == 3
+
+    def test_persist_use(self):
+        cache = MetaCache(self.path, max_entries=10)
+        for i in range(10):
+            cache.set('fields', i, i)
+            time.sleep(0.001)
+        cache.save()
+        cache = MetaCache(self.path, max_entries=10)
+        # a run which only reads the cache
+        cache.get('fields', 0)
+        cache.save()
+        cache = MetaCache(self.path, max_entries=10)
+        cache.set('fields', 10, 10)
+        assert cache.get('fields', 0) == 0 and cache.get('fields', 1) is None
+
+    def test_evict_least_recently_used(self):
+        cache = MetaCache(max_entries=10)
+        for i in range(10):
+            cache.set('fields', i, i)
+            time.sleep(0.001)
+        cache.get('fields', 0)
+        cache.set('fields', 10, 10)
+        assert len(cache.entries) == 9
+        assert cache.get('fields', 0) == 0
+        assert cache.get('fields', 1) is None
+
+
+class TestSearchCache(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'searches')
+        self.fake = FakeJira(page_size=2)
+        for i in range(5):
+            self.fake.add_issue({'project': 'P', 'issuetype': 'Story', 'summary': 'story %d' % i})
+        self.age()
+        self.jira = Client(Session(), options={'server': self.fake.start()}, basic_auth=('u', 'p'))
+
+    def tearDown(self):
+        self.jira._session.close()
+        self.fake.stop()
+        shutil.rmtree(self.dir)
+
+    def age(self):
+        for issue in self.fake.issues.values():
+            issue['fields']['updated'] -= 3600
+
+    def search(self, jql):
+        self.fake.reset_stats()
+        cache = SearchCache(self.path)
+        found = [(i['key'], i['fields']['summary']) for i in cache.search(self.jira, jql, 'summary', 2)]
+        cache.save()
+        return found, self.fake.stats()['calls']['search']
+
+    def test_delta(self):
+        found, calls = self.search('project = P')
+        assert len(found) == 5 and calls == 3
+        # nothing changed: the delta and the keys, two to a page, only
+        assert self.search(' project  =  P ') == (found, 4)
+        self.fake._set(self.fake.issues['P-2'], {'summary': 'renamed'})
+        found, calls = self.search('project = P')
+        assert found[1] == ('P-2', 'renamed') and calls == 4
+
+    def test_removed(self):
+        self.search('project = P')
+        del self.fake.issues['P-2']
+        found, calls = self.search('project = P')
+        assert [k for k, _ in found] == ['P-1', 'P-3', 'P-4', 'P-5'] and calls == 3
+
+    def test_joined(self):
+        # issues which match a JQL function without being updated, one
+        # leaving and one joining, which leaves the total as it was
+        link = lambda key: {'outwardIssue': {'key': key}}
+        self.fake.issues['P-1']['links'].append(link('P-5'))
+        self.fake.issues['P-2']['links'].append(link('P-5'))
+        self.search('issue in linkedIssues(P-5)')
+        self.fake.issues['P-2']['links'][:] = []
+        self.fake.issues['P-3']['links'].append(link('P-5'))
+        found, calls = self.search('issue in linkedIssues(P-5)')
+        assert [k for k, _ in found] == ['P-1', 'P-3'] and calls == 3
+
+    def test_ordered(self):
+        self.search('project = P order by key')
+        self.fake._set(self.fake.issues['P-2'], {'summary': 'renamed'})
+        found, calls = self.search('project = P order by key')
+        assert found[1] == ('P-2', 'renamed') and calls == 4
+        assert split_order('project = P ORDER BY key') == ('project = P', 'ORDER BY key')
@@ -0,0 +1,72 @@
+from jy.daemon import Daemon, request
+from jy.fakejira import FakeJira
+from jy.transport import Client, Session
+from jy.writer import Runner, read_document
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+
+class TestDaemon(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.fake = FakeJira(autocreate=True)
+        self.jira = Client(Session(), options={'server': self.fake.start()}, basic_auth=('u', 'p'))
+        self.address = os.path.join(self.dir, 'jy.sock')
+        self.daemon = Daemon(Runner(self.jira, {}), self.address, interval=0.05)
+        self.thread = threading.Thread(target=self.daemon.serve)
+        self.thread.start()
+        while not os.path.exists(self.address):
+            time.sleep(0.01)
+
+    def tearDown(self):
+        request(self.address, {'command': 'stop'})
+        self.thread.join()
+        self.jira._session.close()
+        self.fake.stop()
+        shutil.rmtree(self.dir)
+
+    def write(self, text):
+        path = os.path.join(self.dir, 'doc.yaml')
+        with open(path, 'w') as f:
+            f.write(text)
+        return path
+
+    def test_run(self):
+        path = self.write(u"- key: P-1\n  +comment: hi\n")
+        reply = request(self.address, {'command': 'run', 'path': path})
+        assert reply['ok'], reply
+        assert "Added to P-1 hi" in reply['output']
+        assert read_document(path)[1][0].real == {'key': 'P-1'}
+        reply = request(self.address, {'command': 'run', 'path': os.path.join(self.dir, 'missing.yaml')})
+        assert not reply['ok']
+
+    def test_watch(self):
+        path = self.write(u"- key: P-1\n")
+        request(self.address, {'command': 'watch', 'path': path})
+        for text in (u"- key: P-1\n  +comment: one\n", u"- key: P-1\n  +comment: two\n"):
+            while self.daemon.watched[path] is None:
+                time.sleep(0.01)
+            self.write(text)
+            os.utime(path, (0, 0))
+            deadline = time.time() + 5
+            while '+comment' in read_document(path)[1][0] and time.time() < deadline:
+                time.sleep(0.01)
+        assert [c['body'] for c in self.fake.issues['P-1']['comments']] == ['one', 'two']
+
+    def test_saved_during_run(self):
+        self.fake.latency = {'comment': 0.3}
+        path = self.write(u"- key: P-1\n  +comment: one\n")
+        thread = threading.Thread(target=lambda: setattr(self, 'reply', self.daemon.sync(path)))
+        thread.start()
+        time.sleep(0.1)
+        self.write(u"- key: P-1\n  +comment: one\n- key: P-2\n")
+        thread.join()
+        assert self.reply['ok'], self.reply
+        assert 'again' in self.reply['output']
+        # the save is kept, and the comment made once
+        assert [i.real for i in read_document(path)[1]] == [{'key': 'P-1'}, {'key': 'P-2'}]
+        assert [c['body'] for c in self.fake.issues['P-1']['comments']] == ['one']
@@ -0,0 +1,132 @@
+from jy import export
+from jy.ioutil import load
+from jy import writer
+from jy.writer import Context
+from mock import Mock, patch
+from xml.etree import ElementTree
+import csv
+import json
+import os
+import shutil
+import StringIO
+import sys
+import tempfile
+import unittest
+
+DOC = """- Epic: Exports
+  key: P-1
+  subtasks:
+  - Story: jsonl
+    key: P-2
+    status: Open
+  - Story: "csv, & <freemind>"
+    key: P-3
+- Bug: unrelated
+  key: P-4
+  assignee: bob
+"""
+
+
+class TestExport(unittest.TestCase):
+    def run_export(self, name):
+        out = StringIO.StringIO()
+        n = export.export(export.walk(load(StringIO.StringIO(DOC))), export.exporter(name, out, "doc.yaml"))
+        assert n == 4
+        return out.getvalue()
+
+    def test_jsonl(self):
+        rows = [json.loads(line) for line in self.run_export('jsonl').splitlines()]
+        assert [r['key'] for r in rows] == ['P-1', 'P-2', 'P-3', 'P-4']
+        assert [r.get('parent') for r in rows] == [None, 'P-1', 'P-1', None]
+        assert 'subtasks' not in rows[0]
+        assert rows[1] == {'Story': 'jsonl', 'key': 'P-2', 'status': 'Open', 'parent': 'P-1'}
+
+    def test_csv(self):
+        rows = list(csv.reader(StringIO.StringIO(self.run_export('csv'))))
+        assert rows[0] == export.COLUMNS
+        assert rows[3] == ['P-3', 'Story', 'csv, & <freemind>', '', '', 'P-1']
+        assert rows[4] == ['P-4', 'Bug', 'unrelated', '', 'bob', '']
+
+    def test_freemind(self):
+        root = ElementTree.fromstring(self.run_export('freemind')).find('node')
+        assert root.get('TEXT') == 'doc.yaml'
+        epic, bug = root.findall('node')
+        assert epic.get('TEXT') == 'Epic: Exports [P-1]'
+        assert [n.get('TEXT') for n in epic.findall('node')] == ['Story: jsonl [P-2]',
+                                                                 'Story: csv, & <freemind> [P-3]']
+        assert bug.find('attribute').attrib == {'NAME': 'assignee', 'VALUE': 'bob'}
+
+    def test_unknown(self):
+        self.assertRaises(ValueError, export.exporter, 'xlsx', StringIO.StringIO())
+
+    def test_search(self):
+        def search(jql, startAt=0, maxResults=50, **kwargs):
+            issues = [{'key': 'P-%s' % i,
+                       'fields': {'issuetype': {'name': 'Story'}, 'summary': 'story %s' % i,
+                                  'assignee': None, 'status': {'name': 'Open'}, 'description': None}}
+                      for i in range(5)]
+            return {'total': len(issues), 'issues': issues[startAt:startAt + maxResults]}
+        jira = Mock()
+        jira.search_issues.side_effect = search
+        ctx = Context(jira)
+        ctx.searches = Mock()
+        out = StringIO.StringIO()
+        n = export.export(export.search(ctx, 'project = P'), export.exporter('csv', out))
+        assert n == 5
+        assert not ctx.searches.search.called
+        rows = list(csv.reader(StringIO.StringIO(out.getvalue())))
+        assert [r[:3] for r in rows[1:3]] == [['P-0', 'Story', 'story 0'], ['P-1', 'Story', 'story 1']]
+
+
+class TestExportTo(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'doc.yaml')
+        with open(self.path, 'w') as f:
+            f.write(DOC)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def content(self, path):
+        with open(path) as f:
+            return f.read()
+
+    def test_failed(self):
+        output = os.path.join(self.dir, 'doc.jsonl')
+        with open(output, 'w') as f:
+            f.write("previous\n")
+
+        def pairs():
+            yield 0, {'key': 'P-1'}
+            raise IOError("lost")
+        self.assertRaises(IOError, export.export_to, output, pairs(), export.JsonLines)
+        assert self.content(output) == "previous\n"
+        assert sorted(os.listdir(self.dir)) == ['doc.jsonl', 'doc.yaml']
+
+    def test_started(self):
+        def pairs():
+            raise IOError("rejected")
+            yield
+        self.assertRaises(IOError, export.started, pairs())
+        assert list(export.started(iter([]))) == []
+        assert list(export.started([(0, 'a'), (0, 'b')])) == [(0, 'a'), (0, 'b')]
+
+    def test_over_input(self):
+        link = os.path.join(self.dir, 'link.yaml')
+        os.symlink(self.path, link)
+        with patch.object(sys, 'argv', ['jywriter', '--export=csv', self.path, link]):
+            self.assertRaises(SystemExit, writer.main)
+        assert self.content(self.path) == DOC
+
+    def test_unknown_format(self):
+        output = os.path.join(self.dir, 'doc.csv')
+        with patch.object(sys, 'argv', ['jywriter', '--export=xlsx', self.path, output]):
+            self.assertRaises(SystemExit, writer.main)
+        assert not os.path.exists(output)
+
+    def test_main(self):
+        output = os.path.join(self.dir, 'doc.csv')
+        with patch.object(sys, 'argv', ['jywriter', '--export=csv', self.path, output]):
+            writer.main()
+        assert len(list(csv.reader(open(output)))) == 5
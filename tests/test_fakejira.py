@@ -0,0 +1,206 @@
+from jy.executor import Executor
+from jy.fakejira import EPIC_LINK, SPRINT, FakeJira, JQL
+from jy.ioutil import dump, load
+from jy.state import DocumentState, Incremental
+from jy.transformers import ApplyTransformers, BulkCreate, UpdateIssues, iter_search
+from jy.transport import Client, Session
+from jy.writer import Context
+from mock import Mock
+import os
+import shutil
+import tempfile
+import unittest
+
+
+class TestFakeJira(unittest.TestCase):
+    doc = u"""- objectify:
+    issuetype: name
+  sprintBoard: 1
+  manifest:
+    project: PROJ
+- Epic: big
+  items:
+  - Story: one
+    +comment: hello
+    sprint: Sprint 2
+    links:
+    - PROJ-1: blocks
+  - Story: two
+- key: OLD-1
+  +status: Closed
+"""
+
+    def setUp(self):
+        self.fake = FakeJira(page_size=2)
+        self.fake.add_issue({'project': 'OLD', 'issuetype': 'Bug', 'summary': 'old'})
+        self.jira = Client(Session(), options={'server': self.fake.start()}, basic_auth=('u', 'p'))
+
+    def tearDown(self):
+        self.jira._session.close()
+        self.fake.stop()
+
+    def test_document(self):
+        items = load(self.doc)
+        ApplyTransformers(Context(self.jira))(items)
+        assert [i.real['key'] for i in items[1]['items']] == ['PROJ-2', 'PROJ-3']
+        one = self.fake.issues['PROJ-2']
+        assert one['fields'][EPIC_LINK] == 'PROJ-1'
+        assert one['comments'][0]['body'] == 'hello'
+        assert 'name=Sprint 2' in one['fields']['customfield_10007'][0]
+        assert one['links'][0]['type']['name'] == 'Blocks'
+        assert self.fake.issues['OLD-1']['fields']['status']['name'] == 'Closed'
+        assert items[2].real['status'] == 'Closed'
+        assert self.fake.stats()['calls']['create'] == 3
+
+    def test_bulk(self):
+        ctx = Context(self.jira)
+        ctx.bulk = BulkCreate(ctx, 10)
+        items = load(self.doc)
+        ctx.planning = True
+        ApplyTransformers(ctx)(items)
+        ctx.planning = False
+        ctx.bulk.flush()
+        ApplyTransformers(ctx)(items)
+        assert self.fake.stats()['calls']['bulk'] == 1
+        assert 'create' not in self.fake.stats()['calls']
+        assert sorted(self.fake.issues) == ['OLD-1', 'PROJ-1', 'PROJ-2', 'PROJ-3']
+
+    def test_memberships(self):
+        for i in range(4):
+            self.fake.add_issue({'project': 'P', 'issuetype': 'Story', 'summary': 'story %d' % i})
+        items = load(u"- sprintBoard: 1\n"
+                     u"- {key: P-1, +sprint: Sprint 1}\n- {key: P-2, +sprint: Sprint 1}\n"
+                     u"- {key: P-3, +sprint: Sprint 3}\n- {key: P-4, +sprint: Nope}\n")
+        ApplyTransformers(Context(self.jira))(items)
+        assert self.fake.stats()['calls']['rank'] == 2
+        assert [i.real.get('sprint') for i in items[1:]] == ['Sprint 1', 'Sprint 1', 'Sprint 3', None]
+        assert items[4].real['+sprint'] == 'Nope'
+        assert 'name=Sprint 1' in self.fake.issues['P-2']['fields']['customfield_10007'][0]
+
+    def test_failed_memberships(self):
+        doc = (u"- objectify:\n    issuetype: name\n  manifest:\n    project: P\n  sprintBoard: 1\n"
+               u"- key: E-1\n  issuetype: Epic\n  items:\n  - Story: child\n    sprint: Nope\n")
+        items = load(doc)
+        ApplyTransformers(Context(self.jira))(items)
+        child = items[1]['items'][0]
+        # left for the next run to try again
+        assert child.real['+sprint'] == 'Nope' and 'sprint' not in child.real
+        assert child.real['+epic'] == 'E-1'
+        self.fake.add_issue({'project': 'E', 'issuetype': 'Epic', 'summary': 'epic'}, key='E-1')
+        ApplyTransformers(Context(self.jira))(items)
+        assert '+epic' not in child.real
+        assert self.fake.issues[child['key']]['fields'][EPIC_LINK] == 'E-1'
+
+    def test_parallel_search(self):
+        # the search sees every issue created before it, as in a serial run,
+        # the stories too, which wait for their epic
+        self.fake.latency = {'create': 0.05}
+        for project, executor in (('P', None), ('Q', Executor(4))):
+            items = load(u"- objectify:\n    issuetype: name\n  manifest:\n    project: %s\n" % project +
+                         u"- Epic: big\n  items:\n" +
+                         u"".join(u"  - Story: story %d\n" % i for i in range(3)) +
+                         u"- search: project = %s and issuetype = Story\n" % project)
+            ctx = Context(self.jira)
+            ctx.executor = executor
+            ApplyTransformers(ctx)(items)
+            if executor:
+                executor.close()
+            created = sorted((i.real['Story'], i.real['key']) for i in items[1]['items'])
+            assert sorted((i.real['Story'], i.real['key']) for i in items[3:]) == created
+
+    def test_incremental_retry(self):
+        doc = (u"- objectify:\n    issuetype: name\n  manifest:\n    project: P\n  sprintBoard: 1\n"
+               u"- key: E-1\n  issuetype: Epic\n  items:\n  - Story: child\n    sprint: Nope\n"
+               u"  - Story: ''\n")
+        state = DocumentState()
+
+        def run():
+            ctx = Context(self.jira)
+            ctx.incremental = Incremental(state, items)
+            ctx.bulk = BulkCreate(ctx, 10)
+            ctx.planning = True
+            ApplyTransformers(ctx)(items)
+            ctx.planning = False
+            ctx.bulk.flush()
+            ApplyTransformers(ctx)(items)
+            ctx.incremental.record(items)
+            return ctx
+        items = load(doc)
+        run()
+        child, empty = items[1]['items']
+        assert child.real['+epic'] == 'E-1' and 'key' not in empty
+        self.fake.add_issue({'project': 'E', 'issuetype': 'Epic', 'summary': 'epic'}, key='E-1')
+        self.fake.reset_stats()
+        # as the next run reads the document
+        items = load(dump(items))
+        child, empty = items[1]['items']
+        ctx = run()
+        # the items left pending are not taken as unchanged
+        assert ctx.incremental.skipped == 2
+        assert '+epic' not in child.real and child.real['+sprint'] == 'Nope'
+        assert self.fake.stats()['calls']['bulk'] == 1
+
+    def test_update(self):
+        for i in range(30):
+            self.fake.add_issue({'project': 'P', 'issuetype': 'Story', 'summary': 'story %d' % i})
+        for issue in self.fake.issues.values():
+            issue['fields']['updated'] -= 3600
+        items = load(u"".join(u"- Story: story %d\n  key: P-%d\n" % (i, i + 1) for i in range(30)))
+        home = tempfile.mkdtemp()
+        try:
+            path = os.path.join(home, 'doc.yaml')
+            state = DocumentState(path)
+            fields = ['status', 'assignee', 'fixVersions', 'sprint', 'summary', 'resolution']
+            UpdateIssues(Context(self.jira), fields=fields, state=state)(items)
+            assert items[0].real == {'Story': 'story 0', 'key': 'P-1', 'status': 'Open'}
+            state.data['update']['time'] -= 600
+            state.save()
+
+            issue = self.fake.issues['P-2']
+            self.fake.transition(issue, '3')
+            self.fake._set(issue, {'assignee': 'bob', 'summary': 'renamed', 'fixVersions': [{'name': '1.0'}],
+                                   SPRINT: [self.fake.sprint_field(2)]})
+            updater = UpdateIssues(Context(self.jira), fields=fields, state=DocumentState(path))
+            updater.write_back = Mock(wraps=updater.write_back)
+            updater(items)
+        finally:
+            shutil.rmtree(home)
+        assert updater.write_back.call_count == 1
+        assert items[1].real == {'Story': 'renamed', 'key': 'P-2', 'status': 'Resolved', 'assignee': 'bob',
+                                 'fixVersions': ['1.0'], 'sprint': 'Sprint 2', 'resolution': 'Fixed'}
+        assert items[0].real['status'] == 'Open'
+
+    def test_linked(self):
+        add = self.fake.add_issue
+        for i in range(3):
+            add({'project': 'E', 'issuetype': 'Epic', 'summary': 'epic %d' % i})
+        add({'project': 'P', 'issuetype': 'Story', 'summary': 'in E-1', EPIC_LINK: 'E-1'})
+        add({'project': 'P', 'issuetype': 'Story', 'summary': 'in E-1 too', EPIC_LINK: 'E-1'})
+        add({'project': 'P', 'issuetype': 'Bug', 'summary': 'linked to E-2'})
+        self.fake.link('Blocks', 'P-3', 'E-2')
+        add({'project': 'P', 'issuetype': 'Sub-task', 'summary': 'under E-3', 'parent': 'E-3'})
+        items = load(u"- key: E-1\n  items:\n  - +linked:\n  - key: X-9\n"
+                     u"- key: E-2\n  items:\n  - +linked:\n"
+                     u"- key: E-3\n  items:\n  - +linked:\n  - key: X-9\n"
+                     u"- key: E-1\n  items:\n  - +linked: issuetype = Bug\n")
+        ApplyTransformers(Context(self.jira))(items)
+        found = [[i['key'] for i in item['items']] for item in items]
+        assert found == [['X-9', 'P-1', 'P-2'], ['P-3'], ['X-9', 'P-4'], []]
+        assert items[1]['items'][0]['Bug'] == 'linked to E-2'
+        # one search, of two pages, for the nodes without a query, and one
+        # for the other
+        assert self.fake.stats()['calls']['search'] == 3
+
+    def test_search(self):
+        for i in range(4):
+            self.fake.add_issue({'project': 'P', 'issuetype': 'Story', 'summary': 'story %d' % i})
+        self.fake.issues['P-2']['fields'][EPIC_LINK] = 'P-1'
+        found = list(iter_search(self.jira, 'project = P and (key in (P-1, P-3) or "Epic Link" = P-1)',
+                                 'summary', page_size=50))
+        assert [i['key'] for i in found] == ['P-1', 'P-2', 'P-3']
+        assert self.fake.stats()['calls']['search'] == 2
+        assert found[0]['fields'] == {'summary': 'story 0'}
+
+    def test_jql(self):
+        assert JQL('issue in linkedIssues(P-1) and not status = Closed order by key').tree == \
+            ('and', ('linked', 'P-1'), ('not', ('=', 'status', 'Closed')))
@@ -0,0 +1,94 @@
+from jy.ioutil import load
+from jy.journal import Journal
+from jy.transformers import ApplyTransformers
+from jy.writer import Context
+from mock import Mock
+import os
+import shutil
+import tempfile
+import unittest
+
+
+class TestJournal(unittest.TestCase):
+    doc = u"""- objectify:
+    issuetype: name
+  manifest:
+    project: PROJ
+- Epic: big
+  items:
+  - Story: one
+    +comment: hello
+- Story: two
+  +comment: crash
+"""
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'doc.yaml')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def jira(self):
+        jira = Mock()
+        keys = iter(range(1, 100))
+
+        def create_issue(**kwargs):
+            return Mock(key="PROJ-%d" % next(keys))
+        jira.create_issue.side_effect = create_issue
+        return jira
+
+    def run_doc(self, jira):
+        ctx = Context(jira)
+        ctx.journal = Journal.beside(self.path)
+        items = load(self.doc)
+        replayed = ctx.journal.start(self.doc, items)
+        ApplyTransformers(ctx)(items)
+        return ctx, items, replayed
+
+    def test_resume(self):
+        jira = self.jira()
+        jira.add_comment.side_effect = lambda key, comment: comment == 'crash' and 1 / 0
+        self.assertRaises(ZeroDivisionError, self.run_doc, jira)
+        assert jira.create_issue.call_count == 3
+        assert os.path.exists(Journal.beside(self.path).path)
+
+        jira = self.jira()
+        ctx, items, replayed = self.run_doc(jira)
+        # three issues created and one comment added; the epic link was
+        # still queued when the run died, and is made now
+        assert replayed == 4
+        assert jira.create_issue.call_count == 0
+        jira.add_issues_to_epic.assert_called_once_with('PROJ-1', ['PROJ-2'])
+        jira.add_comment.assert_called_once_with('PROJ-3', 'crash')
+        assert items[1].real['key'] == 'PROJ-1'
+        assert items[1]['items'][0].real['key'] == 'PROJ-2'
+        assert '+comment' not in items[1]['items'][0].real
+        assert items[2].real['key'] == 'PROJ-3'
+        ctx.journal.close()
+        assert not os.path.exists(ctx.journal.path)
+
+    def test_other_source(self):
+        jira = self.jira()
+        jira.add_comment.side_effect = ZeroDivisionError
+        self.assertRaises(ZeroDivisionError, self.run_doc, jira)
+        # an item the journal made changes for was edited
+        self.doc = self.doc.replace('Story: one', 'Story: uno')
+        jira = self.jira()
+        self.assertRaises(RuntimeError, self.run_doc, jira)
+        assert jira.create_issue.call_count == 0
+        assert os.path.exists(Journal.beside(self.path).path)
+
+    def test_edited(self):
+        jira = self.jira()
+        jira.add_comment.side_effect = lambda key, comment: comment == 'crash' and 1 / 0
+        self.assertRaises(ZeroDivisionError, self.run_doc, jira)
+        # an item added above the others moves them all
+        self.doc = self.doc.replace("- Epic: big", "- Story: new\n- Epic: big")
+        jira = self.jira()
+        ctx, items, replayed = self.run_doc(jira)
+        assert replayed == 4
+        assert jira.create_issue.call_count == 1
+        assert [i.real['key'] for i in items[1:]] == ['PROJ-1', 'PROJ-1', 'PROJ-3']
+        assert items[2]['items'][0].real['key'] == 'PROJ-2'
+        jira.add_comment.assert_called_once_with('PROJ-3', 'crash')
@@ -0,0 +1,35 @@
+from jy.transformers import NewManifest
+from jy.writer import Context
+from mock import Mock
+import unittest
+
+
+class TestNormalize(unittest.TestCase):
+    def setUp(self):
+        self.ctx = Context(Mock())
+        NewManifest(self.ctx)({'objectify': {'issuetype': 'name', 'components': ['name'], 'owner': 'name'},
+                               'aliases': {'points': 'customfield_1', 'owner': 'customfield_2'},
+                               'userAliases': {'bob': 'bob.smith'},
+                               'manifest': {'project': 'PROJ', 'assignee': 'bob'}})
+
+    def test_normalize(self):
+        components = ['ui', {'name': 'api'}]
+        params = self.ctx.issue_fields({'summary': 'one', 'issuetype': 'Story', 'points': 3,
+                                        'owner': 'sam', 'components': components,
+                                        'links': ['PROJ-2'], 'Story/labels': ['x'], 'Bug/labels': ['y']})
+        assert params == {'project': 'PROJ', 'assignee': 'bob.smith', 'summary': 'one',
+                          'issuetype': {'name': 'Story'}, 'customfield_1': 3,
+                          'customfield_2': {'name': 'sam'},
+                          'components': [{'name': 'ui'}, {'name': 'api'}], 'labels': ['x']}
+        # the item's own values are left alone
+        assert components == ['ui', {'name': 'api'}]
+
+    def test_recompiled(self):
+        plan = self.ctx.plan()
+        assert self.ctx.plan() is plan
+        self.ctx.compute_defaults()
+        NewManifest(self.ctx)({'aliases': {'epic': 'customfield_3'}, 'manifest': {'project': 'OTHER'}})
+        assert self.ctx.plan() is not plan
+        params = self.ctx.issue_fields({'issuetype': 'Bug', 'epic': 'PROJ-1'})
+        assert params['customfield_3'] == 'PROJ-1'
+        assert params['project'] == 'OTHER'
@@ -0,0 +1,48 @@
+from jy import registry
+from jy.transformers import BUILTINS, KeyTransformer, Transformer
+import os
+import pkg_resources
+import shutil
+import tempfile
+import unittest
+import zipfile
+
+
+class TestRegistry(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_entry_points(self):
+        for name, text in (('plugin-1.0.egg-info', "[jy.transformers]\nEstimate = plugin:Estimate\n"),
+                           ('other-2.0.egg-info', "[console_scripts]\nother = other:main\n"),
+                           ('Bare-1.0.egg-info', None)):
+            os.mkdir(os.path.join(self.dir, name))
+            if text:
+                with open(os.path.join(self.dir, name, 'entry_points.txt'), 'w') as f:
+                    f.write(text)
+        egg = os.path.join(self.dir, 'zipped-3.0-py2.7.egg')
+        with zipfile.ZipFile(egg, 'w') as z:
+            z.writestr('EGG-INFO/PKG-INFO', "Metadata-Version: 1.0\nName: zipped\nVersion: 3.0\n")
+            z.writestr('EGG-INFO/entry_points.txt', "[jy.transformers]\nRank = zipped:Rank\n")
+        found = registry.entry_points(registry.GROUP, working_set=pkg_resources.WorkingSet([self.dir, egg]))
+        assert sorted((e.name, e.module_name) for e in found) == [('Estimate', 'plugin'), ('Rank', 'zipped')]
+
+    def test_transformers(self):
+        transformers = registry.transformers()
+        assert Transformer not in transformers and KeyTransformer not in transformers
+        assert set(BUILTINS) <= set(transformers)
+        self.assertRaises(TypeError, registry.register, object)
+
+    def test_register(self):
+        class Estimate(Transformer):
+            pass
+        assert Estimate not in registry.transformers()
+        try:
+            assert registry.register(Estimate) is Estimate
+            registry.register(Estimate)
+            assert registry.transformers().count(Estimate) == 1
+        finally:
+            registry.transformers().remove(Estimate)
@@ -0,0 +1,67 @@
+from jy.ioutil import dump, load
+from jy.state import DocumentState, Incremental
+from jy.transformers import ApplyTransformers
+from jy.writer import Context
+from mock import Mock
+import os
+import shutil
+import StringIO
+import tempfile
+import unittest
+
+
+class TestIncremental(unittest.TestCase):
+    doc = """- manifest:
+    assignee: bob
+- key: P-1
+  +comment: one
+- key: P-2
+  items:
+  - key: P-3
+    +comment: three
+- manifest:
+    assignee: sam
+- key: P-4
+"""
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'doc.yaml')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def run_doc(self, doc):
+        jira = Mock()
+        ctx = Context(jira)
+        items = load(StringIO.StringIO(doc))
+        ctx.incremental = Incremental(DocumentState(self.path), items)
+        ApplyTransformers(ctx)(items)
+        ctx.incremental.record(items)
+        out = StringIO.StringIO()
+        dump(items, out, default_flow_style=False)
+        return jira, ctx.incremental.skipped, out.getvalue()
+
+    def test_skip_unchanged(self):
+        jira, skipped, doc = self.run_doc(self.doc)
+        assert skipped == 0
+        assert jira.add_comment.call_count == 2
+        assert os.path.exists(os.path.join(self.dir, '.doc.yaml.jystate'))
+        jira, skipped, doc = self.run_doc(doc)
+        assert skipped == 6
+        doc = doc.replace("key: P-3", "key: P-3\n    +comment: again")
+        jira, skipped, _ = self.run_doc(doc)
+        assert skipped == 5
+        jira.add_comment.assert_called_once_with('P-3', 'again')
+
+    def test_manifest_scope(self):
+        _, _, doc = self.run_doc(self.doc)
+        _, skipped, _ = self.run_doc(doc.replace("assignee: sam", "assignee: mary"))
+        # only the second manifest and what follows it are revisited
+        assert skipped == 4
+
+    def test_duplicated(self):
+        _, _, doc = self.run_doc(self.doc)
+        # a copy of an unchanged item is new to the document
+        _, skipped, _ = self.run_doc(doc + "- key: P-4\n")
+        assert skipped == 6
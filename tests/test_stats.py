@@ -0,0 +1,48 @@
+from jy.fakejira import FakeJira
+from jy.ioutil import load
+from jy.stats import Stats, endpoint
+from jy.transformers import AddComment, ApplyTransformers, Dispatch
+from jy.transport import Client, Session
+from jy.writer import Context
+from mock import Mock
+import copy
+import unittest
+
+
+class TestStats(unittest.TestCase):
+    def test_instrument(self):
+        fake = FakeJira(autocreate=True)
+        jira = Client(Session(), options={'server': fake.start()}, basic_auth=('u', 'p'))
+        try:
+            ctx = Context(jira)
+            stats = Stats()
+            stats.instrument(ctx)
+            items = load(u"- objectify: {issuetype: name}\n"
+                         u"- project: P\n  Story: one\n  +comment: hi\n"
+                         u"- key: P-9\n  +comment: there\n")
+            ApplyTransformers(ctx)(items)
+        finally:
+            jira._session.close()
+            fake.stop()
+        report = stats.as_json()
+        assert report['transformer']['AddComment']['calls'] == 2
+        assert report['transformer']['NewIssue']['calls'] == 1
+        assert report['jira']['add_comment']['calls'] == 2
+        assert report['context']['create_issue_from_item']['calls'] == 1
+        http = report['http']['POST /rest/api/2/issue/{key}/comment']
+        assert http['calls'] == 2 and http['bytes'] > 0
+        assert sum(http['histogram'].values()) == 2
+        # copies of the context are measured too
+        assert type(copy.copy(ctx)) is type(ctx)
+
+    def test_off(self):
+        ctx = Context(Mock())
+        dispatch = Dispatch([AddComment(ctx)])
+        assert dispatch.calls is dispatch.transformers
+        assert type(ctx) is Context
+
+    def test_endpoint(self):
+        assert endpoint('https://jira/rest/api/2/issue/PROJ-12/transitions?expand=x') == \
+            '/rest/api/2/issue/{key}/transitions'
+        assert endpoint('https://jira/rest/greenhopper/1.0/sprintquery/12') == \
+            '/rest/greenhopper/1.0/sprintquery/{id}'
@@ -0,0 +1,314 @@
+from jy import registry
+from jy.executor import Executor
+from jy.ioutil import dump, load
+from jy.state import DocumentState
+from jy.transformers import ApplyTransformers, BulkCreate, Dispatch, NewManifest, Transformer, UpdateIssues
+from jy.writer import Context
+from mock import Mock
+from jira.utils import JIRAError
+import json
+import StringIO
+import time
+import unittest
+
+
+class TestBulkCreate(unittest.TestCase):
+    doc = """- objectify:
+    issuetype: name
+  manifest:
+    project: PROJ
+- Story: one
+  +comment: hello
+- Story: two
+  +comment: hello
+- Bug: three
+"""
+
+    def run_bulk(self, response):
+        jira = Mock()
+        jira._session.post.return_value.text = json.dumps(response)
+        ctx = Context(jira)
+        ctx.bulk = BulkCreate(ctx, size=10)
+        items = load(StringIO.StringIO(self.doc))
+        ctx.planning = True
+        ApplyTransformers(ctx)(items)
+        ctx.planning = False
+        ctx.bulk.flush()
+        ApplyTransformers(ctx)(items)
+        return jira, items
+
+    def test_chunk(self):
+        jira, items = self.run_bulk({'issues': [{'key': 'PROJ-1'}, {'key': 'PROJ-2'}, {'key': 'PROJ-3'}],
+                                     'errors': []})
+        assert jira._session.post.call_count == 1
+        sent = json.loads(jira._session.post.call_args[1]['data'])['issueUpdates']
+        assert [u['fields']['summary'] for u in sent] == ['one', 'two', 'three']
+        assert all(u['fields']['project'] == 'PROJ' for u in sent)
+        assert [i.real.get('key') for i in items] == [None, 'PROJ-1', 'PROJ-2', 'PROJ-3']
+        assert jira.add_comment.call_count == 2
+
+    def test_item_error(self):
+        jira, items = self.run_bulk({'issues': [{'key': 'PROJ-1'}, {'key': 'PROJ-3'}],
+                                     'errors': [{'failedElementNumber': 1,
+                                                 'elementErrors': {'errors': {'summary': 'bad'}}}]})
+        assert [i.real.get('key') for i in items] == [None, 'PROJ-1', None, 'PROJ-3']
+        assert items[2].real['+comment'] == 'hello'
+        jira.add_comment.assert_called_once_with('PROJ-1', 'hello')
+
+
+class TestParallel(unittest.TestCase):
+    doc = """- objectify:
+    issuetype: name
+  manifest:
+    project: PROJ
+- Epic: epic
+  items:
+  - manifest:
+      assignee: bob
+  - Story: child %(i)s
+    +comment: first
+  - Story: second child %(i)s
+- key: PROJ-%(i)s
+  +comment: hello
+  links:
+  - PROJ-1: blocks
+"""
+
+    def run_doc(self, executor):
+        jira = Mock()
+
+        def create_issue(**fields):
+            issue = Mock()
+            issue.key = "%s-%s" % (fields['project'], fields['summary'].replace(' ', '_'))
+            return issue
+        jira.create_issue.side_effect = create_issue
+        ctx = Context(jira)
+        ctx.executor = executor
+        items = load(StringIO.StringIO("".join(self.doc % dict(i=i) for i in range(20))))
+        ApplyTransformers(ctx)(items)
+        s = StringIO.StringIO()
+        dump(items, s, default_flow_style=False)
+        return jira, s.getvalue()
+
+    def test_same_document(self):
+        serial_jira, serial = self.run_doc(None)
+        executor = Executor(8)
+        parallel_jira, parallel = self.run_doc(executor)
+        executor.close()
+        assert serial == parallel
+        # call_count is not thread safe; call_args_list is appended to.
+        assert len(parallel_jira.create_issue.call_args_list) == 60
+        assert (sorted(serial_jira.create_issue.call_args_list) ==
+                sorted(parallel_jira.create_issue.call_args_list))
+        assert len(parallel_jira.add_comment.call_args_list) == 40
+        # every epic shares a summary, and so a key; its children are added at once
+        assert len(parallel_jira.add_issues_to_epic.call_args_list) == 1
+        assert len(parallel_jira.add_issues_to_epic.call_args[0][1]) == 40
+
+    def test_error(self):
+        executor = Executor(4)
+        jira = Mock()
+        jira.add_comment.side_effect = ValueError
+        ctx = Context(jira)
+        ctx.executor = executor
+        items = load(StringIO.StringIO("- key: A-1\n  +comment: x\n- key: A-2\n  +comment: y\n"))
+        self.assertRaises(ValueError, ApplyTransformers(ctx), items)
+        executor.close()
+
+    def test_failed_create(self):
+        executor = Executor(4)
+        jira = Mock()
+        jira.create_issue.side_effect = ValueError
+        ctx = Context(jira)
+        ctx.executor = executor
+        items = load(StringIO.StringIO("- objectify:\n    issuetype: name\n  manifest:\n    project: A\n"
+                                       "- Story: x\n- Story: y\n"))
+        self.assertRaises(SystemExit, ApplyTransformers(ctx), items)
+        executor.close()
+
+
+@registry.register
+class Ping(Transformer):
+    ignored = triggers = ['+ping']
+    calls = []
+
+    def __call__(self, item):
+        self.calls.append(item['+ping'])
+
+
+@registry.register
+class AddPing(Transformer):
+    priority = 50
+    ignored = triggers = ['+addPing']
+
+    def __call__(self, item):
+        item['+ping'] = item['+addPing']
+
+
+class TestDispatch(unittest.TestCase):
+    def test_triggers(self):
+        del Ping.calls[:]
+        items = load(StringIO.StringIO("- key: A-1\n  +ping: one\n- key: A-2\n- key: A-3\n  +addPing: three\n"))
+        ApplyTransformers(Context(Mock()))(items)
+        assert Ping.calls == ['one', 'three']
+
+    def test_index(self):
+        ctx = Context(Mock())
+        first = Dispatch([AddPing(ctx), Ping(ctx), NewManifest(ctx)])
+        second = Dispatch([AddPing(ctx), Ping(ctx), NewManifest(ctx)])
+        assert first.by_key is second.by_key
+        assert first.by_key['+ping'] == [1] and first.by_key['manifest'] == [2]
+        assert first.always == []
+
+
+class TestUpdateIssues(unittest.TestCase):
+    def search(self, jql, startAt=0, maxResults=50, **kwargs):
+        keys = [k for k in jql[len("key in ("):-1].split(",") if k not in self.missing]
+        page = keys[startAt:startAt + maxResults]
+        return {'total': len(keys),
+                'issues': [{'key': k, 'fields': {'status': {'name': 'Closed' if k in self.closed else 'Open'}}}
+                           for k in page]}
+
+    def run_update(self, executor, purge=False, state=None, full=False, searches=None):
+        self.missing = set(['P-3', 'P-140'])
+        self.closed = set(['P-5', 'P-240'])
+        jira = Mock()
+        jira.search_issues.side_effect = self.search
+        ctx = Context(jira)
+        ctx.executor = executor
+        ctx.searches = searches
+        items = load(StringIO.StringIO("".join("- key: P-%s\n" % i for i in range(250))))
+        updater = UpdateIssues(ctx, purge, state=state, full=full)
+        updater.page_size = 30
+        updater(items)
+        return jira, items
+
+    def test_chunked(self):
+        jira, items = self.run_update(None)
+        assert all(len(c[0][0].split(",")) <= 100 for c in jira.search_issues.call_args_list)
+        assert [i.real.get('status') for i in items].count('Open') == 246
+        assert items[3].real.get('status') is None
+        assert items[240].real['status'] == 'Closed'
+
+    def test_missing_not_synced(self):
+        state = DocumentState()
+        self.run_update(None, state=state)
+        synced = state.data['update']['keys']
+        assert len(synced) == 248 and 'P-3' not in synced and 'P-4' in synced
+
+    def test_parallel_purge(self):
+        executor = Executor(4)
+        jira, items = self.run_update(executor, purge=True)
+        executor.close()
+        assert len(items) == 248
+        assert 'P-240' not in [i['key'] for i in items]
+
+    def test_full(self):
+        state = DocumentState()
+        state.data['update'] = {'time': time.time(), 'fields': ['status'],
+                                'keys': ['P-%s' % i for i in range(250)]}
+        searches = Mock()
+        jira, items = self.run_update(None, state=state, full=True, searches=searches)
+        assert not searches.search.called
+        assert not [c for c in jira.search_issues.call_args_list if 'updated' in c[0][0]]
+        assert items[240].real['status'] == 'Closed'
+
+
+class TestDoSearch(unittest.TestCase):
+    def search(self, jql, startAt=0, maxResults=50, fields=None, **kwargs):
+        issues = [{'key': 'P-%s' % i,
+                   'fields': {'issuetype': {'name': 'Story'}, 'summary': 'story %s' % i,
+                              'assignee': None if i % 2 else {'name': 'bob'},
+                              'status': {'name': 'Open'}, 'description': None,
+                              'customfield_1': [{'value': 'a'}, {'value': 'b'}]}}
+                  for i in range(7)]
+        return {'total': len(issues), 'issues': issues[startAt:startAt + maxResults]}
+
+    def test_paged_expansion(self):
+        jira = Mock()
+        jira.search_issues.side_effect = self.search
+        ctx = Context(jira)
+        ctx.aliases['tags'] = 'customfield_1'
+        items = load(StringIO.StringIO("- search: project = P\n  pageSize: 3\n  fields: [tags]\n- key: X-1\n"))
+        ApplyTransformers(ctx)(items)
+        assert jira.search_issues.call_count == 3
+        assert 'customfield_1' in jira.search_issues.call_args[1]['fields']
+        assert len(items) == 9
+        assert items[0].real['complete'] is True
+        assert items[1]['key'] == 'X-1'
+        assert [i['key'] for i in items[2:]] == ['P-%s' % i for i in range(7)]
+        assert items[2].real['Story'] == 'story 0'
+        assert items[2]['assignee'] == 'bob' and items[3]['assignee'] is None
+        assert items[2]['tags'] == ['a', 'b']
+
+
+class TestSetStatus(unittest.TestCase):
+    workflow = {'Open': [('Start Progress', '4', 'In Progress')],
+                'In Progress': [('Stop Progress', '5', 'Open'), ('Resolve Issue', '6', 'Resolved')],
+                'Resolved': [('Close Issue', '7', 'Closed'), ('Reopen', '8', 'Open')]}
+
+    def transitions(self, key):
+        return [{'name': n, 'id': i, 'to': {'name': to}} for n, i, to in self.workflow[self.status[key]]]
+
+    def transition_issue(self, key, id_):
+        for n, i, to in self.workflow[self.status[key]]:
+            if i == id_:
+                self.status[key] = to
+                return
+        raise JIRAError(400)
+
+    def issue(self, key, fields=None):
+        issue = Mock()
+        issue.fields.status.name = self.status[key]
+        issue.fields.issuetype.name = 'Bug'
+        return issue
+
+    def run_doc(self, doc, jira=None):
+        jira = jira or Mock()
+        jira.issue.side_effect = self.issue
+        jira.transitions.side_effect = self.transitions
+        jira.transition_issue.side_effect = self.transition_issue
+        items = load(StringIO.StringIO(doc))
+        self.ctx = Context(jira)
+        ApplyTransformers(self.ctx)(items)
+        return jira, items
+
+    def test_multi_hop(self):
+        self.status = dict(('P-%s' % i, 'Open') for i in range(5))
+        jira, items = self.run_doc("".join("- key: P-%s\n  issuetype: Bug\n  status: Open\n  +status: Closed\n" % i
+                                           for i in range(5)))
+        assert jira.transitions.call_count == 3
+        assert jira.transition_issue.call_count == 15
+        assert set(self.status.values()) == set(['Closed'])
+        assert [i.real['status'] for i in items] == ['Closed'] * 5
+        assert '+status' not in items[0].real
+
+    def test_stale_status(self):
+        self.status = {'P-1': 'Open', 'P-2': 'In Progress'}
+        jira, items = self.run_doc("- key: P-1\n  issuetype: Bug\n  status: Open\n  +status: Resolve Issue\n"
+                                   "- key: P-2\n  issuetype: Bug\n  status: Open\n  +status: Resolved\n")
+        assert jira.transitions.call_count == 2
+        assert self.status == {'P-1': 'Resolved', 'P-2': 'Resolved'}
+        assert items[0].real['status'] == 'Resolved'
+
+    def test_already_there(self):
+        self.status = {'P-1': 'Closed', 'P-2': 'In Progress'}
+        jira, items = self.run_doc("- key: P-1\n  issuetype: Bug\n  status: Closed\n  +status: Closed\n"
+                                   "- key: P-2\n  issuetype: Bug\n  status: Open\n  +status: In Progress\n")
+        assert jira.transition_issue.call_count == 0
+        assert [i.real['status'] for i in items] == ['Closed', 'In Progress']
+
+    def test_stale_target(self):
+        # the document says the issue is there already; JIRA does not
+        self.status = {'P-1': 'Open'}
+        jira, items = self.run_doc("- key: P-1\n  issuetype: Bug\n  status: Resolved\n  +status: Resolved\n")
+        assert self.status == {'P-1': 'Resolved'}
+        assert jira.transition_issue.call_count == 2
+        assert items[0].real['status'] == 'Resolved' and '+status' not in items[0].real
+
+    def test_learn_actual_status(self):
+        # the document says Open; what JIRA lists is In Progress's transitions
+        self.status = {'P-1': 'In Progress'}
+        jira, items = self.run_doc("- key: P-1\n  issuetype: Bug\n  status: Open\n  +status: Resolved\n")
+        assert self.status == {'P-1': 'Resolved'}
+        assert self.ctx.cache.get('transitions', 'P/Bug').keys() == ['In Progress']
@@ -0,0 +1,122 @@
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from jira.utils import JIRAError
+from jy.transport import Session, Throttle, connect_failed
+from requests.exceptions import ConnectionError, Timeout
+import socket
+import threading
+import time
+import unittest
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Answers with the statuses queued on the server, then with 200."""
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        status, headers = self.server.responses.pop(0) if self.server.responses else (200, {})
+        if status == 'slow':
+            time.sleep(0.5)
+            status = 200
+        body = '{"ok": true}' if status == 200 else '{"errorMessages": ["throttled"]}'
+        self.send_response(status)
+        for k, v in headers.items():
+            self.send_header(k, v)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_POST = do_GET
+
+    def log_message(self, *args):
+        pass
+
+
+class Server(HTTPServer):
+    def handle_error(self, request, client_address):
+        # the client gave up on a slow response
+        pass
+
+
+class TestSession(unittest.TestCase):
+    def setUp(self):
+        self.server = Server(('127.0.0.1', 0), Handler)
+        self.server.requests = []
+        self.server.responses = []
+        self.thread = threading.Thread(target=self.server.serve_forever, args=(0.01,))
+        self.thread.daemon = True
+        self.thread.start()
+        self.url = 'http://127.0.0.1:%s/rest/api/2/issue' % self.server.server_port
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_retry_after(self):
+        self.server.responses = [(429, {'Retry-After': '0'}), (503, {}), (429, {'Retry-After': '0.2'})]
+        session = Session(backoff=0.01)
+        start = time.time()
+        assert session.get(self.url).json() == {'ok': True}
+        assert len(self.server.requests) == 4
+        assert time.time() - start >= 0.2
+
+    def test_gives_up(self):
+        self.server.responses = [(429, {'Retry-After': '0'})] * 3
+        session = Session(retries=2)
+        try:
+            session.post(self.url, data={'fields': {}})
+        except JIRAError, e:
+            assert e.status_code == 429
+        else:
+            self.fail("no error")
+        assert len(self.server.requests) == 3
+
+    def test_post_not_repeated(self):
+        # JIRA may have created the issue before the gateway gave up
+        self.server.responses = [(504, {}), (503, {})]
+        self.assertRaises(JIRAError, Session(backoff=0.01).post, self.url, data={'fields': {}})
+        assert len(self.server.requests) == 1
+        self.server.responses = [(503, {'Retry-After': '0'})]
+        assert Session().post(self.url, data={'fields': {}}).json() == {'ok': True}
+        assert len(self.server.requests) == 3
+
+    def test_connect_failed(self):
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        url = 'http://127.0.0.1:%s/' % sock.getsockname()[1]
+        sock.close()
+        try:
+            Session(retries=1, backoff=0.01).post(url, data={})
+        except ConnectionError, e:
+            assert connect_failed(e)
+        else:
+            self.fail("no error")
+
+    def test_error_not_retried(self):
+        self.server.responses = [(400, {})]
+        self.assertRaises(JIRAError, Session().get, self.url)
+        assert len(self.server.requests) == 1
+
+    def test_timeout(self):
+        self.server.responses = [('slow', {})]
+        self.assertRaises(Timeout, Session(timeout=0.1).get, self.url)
+
+    def test_rate(self):
+        session = Session(rate=20, burst=2)
+        start = time.time()
+        for _ in range(6):
+            session.get(self.url)
+        # two at once, then one every 50ms
+        assert time.time() - start >= 0.18
+
+    def test_pool(self):
+        session = Session.from_conf({'timeout': 5}, jobs=16)
+        assert session.get_adapter(self.url)._pool_maxsize == 16
+        assert session.timeout == 5.0
+
+
+class TestThrottle(unittest.TestCase):
+    def test_hold(self):
+        throttle = Throttle()
+        throttle.hold(0.1)
+        start = time.time()
+        throttle.wait()
+        assert time.time() - start >= 0.09
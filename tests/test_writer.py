@@ -0,0 +1,68 @@
+from jy.fakejira import FakeJira
+from jy.transport import Client, Session
+from jy.writer import Runner, documents, read_document
+import os
+import shutil
+import tempfile
+import unittest
+
+
+class TestBatch(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.fake = FakeJira(autocreate=True)
+        self.jira = Client(Session(), options={'server': self.fake.start()}, basic_auth=('u', 'p'))
+
+    def tearDown(self):
+        self.jira._session.close()
+        self.fake.stop()
+        shutil.rmtree(self.dir)
+
+    def write(self, name, text):
+        path = os.path.join(self.dir, name)
+        with open(path, 'w') as f:
+            f.write(text)
+        return path
+
+    def test_documents(self):
+        for name in ('b.yaml', 'a.yml', '.a.yaml.jystate', 'notes.txt'):
+            self.write(name, '')
+        other = self.write('other', '')
+        assert list(documents([self.dir, other])) == [
+            os.path.join(self.dir, 'a.yml'), os.path.join(self.dir, 'b.yaml'), other]
+
+    def test_run(self):
+        doc = u"- sprintBoard: 1\n- key: P-%d\n  +sprint: Sprint 1\n  +comment: hi\n"
+        paths = [self.write('%d.yaml' % i, doc % i) for i in range(3)]
+        paths.append(self.write('3.yaml', u"- key: P-9\n  +status: Nowhere\n"))
+        runner = Runner(self.jira, {})
+        for path in paths:
+            try:
+                runner.run(path, path, *read_document(path))
+            except Exception:
+                pass
+        runner.finish()
+        # the sprints of the board are looked up once for the batch
+        assert self.fake.stats()['calls']['sprints'] == 1
+        assert [s[3] for s in runner.summary] == [True, True, True, False]
+        assert runner.summary[0][1] == {'comment': 1, 'sprint': 1}
+        assert read_document(paths[1])[1][1].real == {'key': 'P-1', 'sprint': 'Sprint 1'}
+        assert not os.path.exists(os.path.join(self.dir, '.0.yaml.jyjournal'))
+
+    def test_boards_per_document(self):
+        first = self.write('first.yaml', u"- sprintBoard: 1\n- key: P-1\n  +sprint: Sprint 1\n")
+        second = self.write('second.yaml', u"- key: P-2\n  +sprint: Sprint 1\n")
+        runner = Runner(self.jira, {})
+        for path in (first, second):
+            runner.run(path, path, *read_document(path))
+        runner.finish()
+        # the second document names no board, so its sprint is not found
+        assert read_document(first)[1][1].real == {'key': 'P-1', 'sprint': 'Sprint 1'}
+        assert read_document(second)[1][0].real == {'key': 'P-2', '+sprint': 'Sprint 1'}
+
+    def test_dry_run_state(self):
+        path = self.write('doc.yaml', u"- key: P-1\n  +comment: hi\n")
+        runner = Runner(self.jira, {'--test': True, '--incremental': True})
+        runner.run(path, os.devnull, *read_document(path))
+        runner.finish()
+        assert os.listdir(self.dir) == ['doc.yaml']
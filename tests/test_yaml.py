@@ -1,4 +1,10 @@
-from jy.ioutil import load, sdict, dump, slist
+from jy.ioutil import load, sdict, dump, slist, patch, atomic_write, PureLoader, PureDumper
+import collections
+import copy
+import os
+import pickle
+import shutil
+import tempfile
 import StringIO
 import unittest
 
@@ -60,3 +66,142 @@ class TestLoader(unittest.TestCase):
         v2 = load(StringIO.StringIO(s2_str))
         assert d.real == v2, (v2.real, d.real)
         assert d == v2
+
+    def test_pure_backend(self):
+        fast = load(StringIO.StringIO(self.s1))
+        pure = load(StringIO.StringIO(self.s1), Loader=PureLoader)
+        assert fast == pure
+        boom = pure[1]['foo']['bar']['boom']
+        assert isinstance(boom, slist) and boom.parent is pure[1]['foo']['bar']
+        assert dump(fast, default_flow_style=False) == dump(pure, Dumper=PureDumper, default_flow_style=False)
+
+    def test_session_changes(self):
+        d = load(StringIO.StringIO("Story: summary\nkey: P-1\nstatus: Open\n"))
+        d['summary'] = d.pop('Story')
+        d['status'] = 'Closed'
+        d['created'] = True
+        d.apply('key', 'P-2')
+        assert d == {'summary': 'summary', 'key': 'P-2', 'status': 'Closed', 'created': True}
+        assert d.real.items() == [('Story', 'summary'), ('key', 'P-2'), ('status', 'Open')]
+        d.rm('status')
+        assert d.real.keys() == ['Story', 'key']
+        assert not hasattr(d, '__dict__')
+
+    def test_session_order(self):
+        d = load(StringIO.StringIO("z: 1\ny: 2\nx: 3\nw: 4\n"))
+        d['b'] = d.pop('y')
+        d['a'] = 5
+        del d['b']
+        d['c'] = 6
+        d.apply('v', 7)
+        assert d.keys() == ['z', 'x', 'w', 'v', 'a', 'c']
+        assert d.items()[:2] == [('z', 1), ('x', 3)] and list(d.itervalues())[-1] == 6
+        assert sdict(d).keys() == d.keys() and sdict(collections.OrderedDict(d.items())).keys() == d.keys()
+        e = sdict({'k': 1}, parent=d)
+        assert e.real.items() == [('k', 1)] and e.parent is d
+        e.update(collections.OrderedDict([('n', 1), ('m', 2)]), l=3)
+        assert e.keys() == ['k', 'n', 'm', 'l']
+
+    def test_copy_and_pickle(self):
+        v = load(StringIO.StringIO(self.s1))
+        v[0]['b'] = 2
+        for v2 in (copy.deepcopy(v), pickle.loads(pickle.dumps(v, 2))):
+            assert v2 == v
+            assert v2[0].real == v[0].real
+            bar = v2[1]['foo']['bar']
+            assert bar['boom'].parent is bar
+        c = copy.copy(v[0])
+        c.apply('c', 3)
+        assert 'c' not in v[0].real
+
+    def test_splice(self):
+        items = load(StringIO.StringIO("- {a: 1}\n- {a: 1}\n- {b: 2}\n- {c: 3}\n"))
+        first, second = items[0], items[1]
+        assert items.position(second) == 1 and items.position(first) == 0
+        self.assertRaises(ValueError, items.position, sdict([('a', 1)]))
+        new = sdict([('d', 4)])
+        items.splice([(3, 3, [new]), (0, 1, []), (2, 3, [])])
+        assert items == [{'a': 1}, {'d': 4}, {'c': 3}]
+        assert items.position(second) == 0 and new.parent is items
+        self.assertRaises(ValueError, items.splice, [(0, 2, []), (1, 1, [new])])
+
+
+class TestPatch(unittest.TestCase):
+    source = u"""# planning
+- manifest:
+    assignee: bob   # the usual
+- Story: first
+  links: {PROJ-1: blocks}
+  note: |
+    keep
+    this
+
+- key: PROJ-2  # existing
+  +comment: done
+- Epic: epic
+  items:
+    - Story: nested
+      components: [Foo, Bar]
+"""
+
+    def test_unchanged(self):
+        v = load(self.source)
+        assert patch(self.source, v) == self.source
+
+    def test_only_changed_nodes(self):
+        v = load(self.source)
+        v[1].apply('key', 'PROJ-3')
+        v[2].rm('+comment')
+        v[3]['items'][0]['components'].append('Baz')
+        v[1]['links'].apply('created', True)
+        text = patch(self.source, v, default_flow_style=False)
+        assert text.startswith(u"# planning\n- manifest:\n    assignee: bob   # the usual\n")
+        # the comment stays on the line it was written on
+        assert u"- key: PROJ-2  # existing\n- Epic" in text
+        assert u"      components: [Foo, Bar, Baz]\n" in text
+        v2 = load(text)
+        assert v2[1].real == v[1].real, v2[1].real
+        assert v2[1]['note'] == u"keep\nthis\n"
+        assert v2 == load(dump(v, default_flow_style=False))
+
+    def test_trailing_comment(self):
+        source = u"- Story: s1\n- Story: s2   # c2\n- Story: 'a # b' # c3\n  status: Open\n"
+        v = load(source)
+        v[1].apply('key', 'PROJ-2')
+        v[2].apply('status', 'Closed')
+        text = patch(source, v, default_flow_style=False)
+        assert text == (u"- Story: s1\n- Story: s2   # c2\n  key: PROJ-2\n"
+                        u"- Story: 'a # b' # c3\n  status: Closed\n"), text
+
+    def test_top_level_change(self):
+        v = load(self.source)
+        v.insert(1, sdict([('key', 'PROJ-9')]))
+        assert patch(self.source, v) is None
+
+
+class TestAtomicWrite(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_symlink(self):
+        target = os.path.join(self.dir, 'doc.yaml')
+        link = os.path.join(self.dir, 'link.yaml')
+        with open(target, 'w') as f:
+            f.write("old")
+        os.chmod(target, 0640)
+        os.symlink(target, link)
+        atomic_write(link, "new")
+        assert os.path.islink(link)
+        assert open(target).read() == "new"
+        assert os.stat(target).st_mode & 0777 == 0640
+        assert sorted(os.listdir(self.dir)) == ['doc.yaml', 'link.yaml']
+
+    def test_not_a_file(self):
+        r, w = os.pipe()
+        atomic_write('/dev/fd/%d' % w, "text")
+        os.close(w)
+        assert os.read(r, 10) == "text"
+        os.close(r)